@@ -1,6 +1,72 @@
-from subprocess import run
+import argparse
+import os
+import sys
+import time
+from importlib import import_module
 
-def main():
-    run(['python', 'editor.py'])
+# What editor imports when it loads, in its order, so --profile-startup can time each; diff and tracing load on demand
+EDITOR_IMPORTS = ('tkinter', 'ttkbootstrap', 'document', 'largefile', 'search', 'fileio', 'saver', 'settings',
+                  'watcher', 'gutter', 'highlight', 'journal', 'undo')
 
-main()
+
+class StartupProfile:
+    """Wall-clock time spent in each startup phase, printed with --profile-startup"""
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self, stream=sys.stderr):
+        print('Startup profile (ms)', file=stream)
+        for phase, seconds in self.phases:
+            print(f'  {phase:<28}{seconds * 1000:>9.1f}', file=stream)
+        print(f'  {"total":<28}{(self.last - self.start) * 1000:>9.1f}', file=stream)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Run in this interpreter, wherever it was launched from
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if argv[:1] == ['batch']: # Headless find/replace; never loads Tk
+        return import_module('batch').main(argv[1:])
+
+    parser = argparse.ArgumentParser(prog='TextEditor', description='Text Editor', epilog='Run "TextEditor batch --help" for find/replace across files without the GUI.')
+    parser.add_argument('file', nargs='?', help='file to open instead of the last document')
+    parser.add_argument('--profile-startup', action='store_true', help='print an import/phase timing breakdown once the window is up')
+    parser.add_argument('--trace', metavar='FILE', help='record callback and I/O timings and write them to FILE as a Chrome trace on exit')
+    parser.add_argument('--slow-ms', type=float, default=50, help='callbacks slower than this are flagged in the trace (default 50)')
+    args = parser.parse_args(argv)
+
+    profile = None
+    if args.profile_startup:
+        profile = StartupProfile()
+        for module in EDITOR_IMPORTS:
+            import_module(module)
+            profile.mark(f'import {module}')
+
+    tracer = None
+    if args.trace:
+        from tracing import Tracer
+        tracer = Tracer(slow_ms=args.slow_ms)
+        tracer.install() # Before any widget registers a callback
+        if profile:
+            profile.mark('import tracing')
+
+    editor = import_module('editor')
+    if profile:
+        profile.mark('import editor')
+    try:
+        editor.main(args.file, profile, tracer)
+    finally:
+        if tracer:
+            tracer.write(args.trace)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
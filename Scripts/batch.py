@@ -0,0 +1,167 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+from fileio import detect_file
+from findfiles import iter_files
+from saver import format_size
+from search import SearchEngine, replace_rules
+
+# Headless find/replace for TextEditor.py batch. Nothing here may import tkinter: it has to run on servers and in CI.
+
+
+def load_rules(args):
+    """(query, replacement, regex, whole_word, case) per rule, from --find/--replace pairs then --rules"""
+    finds, replaces = args.find or [], args.replace or []
+    if len(finds) != len(replaces):
+        raise ValueError('every --find needs a --replace')
+    rules = [(query, replacement, args.regex, args.whole_word, args.case) for query, replacement in zip(finds, replaces)]
+
+    if args.rules:
+        with open(args.rules, encoding='utf-8') as file:
+            for number, rule in enumerate(json.load(file), 1):
+                if 'find' not in rule or 'replace' not in rule:
+                    raise ValueError(f'rule {number} in {args.rules} needs "find" and "replace"')
+                rules.append((rule['find'], rule['replace'], rule.get('regex', args.regex), rule.get('whole_word', args.whole_word), rule.get('case', args.case)))
+    if not rules:
+        raise ValueError('no rules: give --find/--replace or --rules')
+
+    for query, replacement, regex, whole_word, case in rules:
+        # Raise re.error here rather than in every worker
+        try:
+            engine = SearchEngine(query, regex, whole_word, case)
+        except re.error as e:
+            raise ValueError(f'bad regex {query!r}: {e}')
+        try:
+            engine.check_replacement(replacement)
+        except re.error as e:
+            raise ValueError(f'bad replacement {replacement!r} for {query!r}: {e}')
+    return rules
+
+
+def iter_paths(args):
+    """Files named on the command line, and the matching files under directories named there"""
+    max_size = args.max_size * 1024 * 1024 if args.max_size else None
+    for path in args.paths:
+        if os.path.isdir(path):
+            yield from iter_files(path, args.include, args.exclude, max_size)
+        else:
+            yield path
+
+
+def process_file(path, rules, dry_run=False, by_line=False):
+    """Apply the rules to one file; runs in a worker process.
+
+    Returns a result dict: path, counts per rule, bytes, seconds, and error
+    or skipped when the file couldn't be or wasn't processed.
+    """
+    start = time.perf_counter()
+    result = {'path': path, 'counts': [0] * len(rules), 'bytes': 0}
+    try:
+        result['bytes'] = os.path.getsize(path)
+        file_format = detect_file(path)
+        if file_format.binary:
+            result['skipped'] = 'binary'
+        else:
+            engines = [(SearchEngine(query, regex, whole_word, case), replacement) for query, replacement, regex, whole_word, case in rules]
+            for engine, replacement in engines:
+                engine.check_replacement(replacement)
+            result['counts'] = replace_rules(path, engines, encoding=file_format.encoding, dry_run=dry_run, by_line=by_line)
+    except (OSError, UnicodeError, re.error) as e:
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def pool_results(pool, paths, options, window):
+    """Yield results as files finish, keeping at most window of them queued while the walk goes on"""
+    pending = set()
+    for path in paths:
+        pending.add(pool.submit(process_file, path, *options))
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    for future in as_completed(pending):
+        yield future.result()
+
+
+def run(args, rules, stream=None):
+    """Process every file, reporting each one to stream (stdout) as it finishes; return the summary"""
+    stream = stream or sys.stdout
+    paths = iter_paths(args)
+    options = (rules, args.dry_run, args.by_line)
+    summary = {'files': 0, 'changed': 0, 'replacements': 0, 'skipped': 0, 'errors': 0, 'bytes': 0}
+    started = time.perf_counter()
+
+    if args.jobs == 1:
+        pool = None
+        results = (process_file(path, *options) for path in paths)
+    else:
+        pool = ProcessPoolExecutor(args.jobs, mp_context=multiprocessing.get_context('spawn'))
+        results = pool_results(pool, paths, options, args.jobs * 4)
+
+    try:
+        for result in results:
+            count = sum(result['counts'])
+            summary['files'] += 1
+            summary['bytes'] += result['bytes']
+            summary['replacements'] += count
+            summary['changed'] += bool(count)
+            if 'error' in result:
+                summary['errors'] += 1
+                print(f"{result['path']}: error: {result['error']}", file=sys.stderr)
+            elif 'skipped' in result:
+                summary['skipped'] += 1
+            elif count and not args.json:
+                verb = 'would replace' if args.dry_run else 'replaced'
+                per_rule = f" ({', '.join(map(str, result['counts']))})" if len(rules) > 1 else ''
+                print(f"{result['path']}: {verb} {count}{per_rule} in {result['seconds'] * 1000:.1f} ms", file=stream)
+            if args.json:
+                print(json.dumps(result), file=stream)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='TextEditor batch', description='Find and replace across files without opening the editor')
+    parser.add_argument('paths', nargs='+', help='files, and directories to search recursively')
+    parser.add_argument('-f', '--find', action='append', metavar='QUERY', help='text to find; repeat with --replace for several rules, applied in order')
+    parser.add_argument('-r', '--replace', action='append', metavar='TEXT', help='replacement for the matching --find (a template with \\1 etc. for regexes)')
+    parser.add_argument('--rules', metavar='FILE', help='JSON list of {"find", "replace", "regex", "whole_word", "case"} rules, applied after --find ones')
+    parser.add_argument('--regex', action='store_true', help='treat queries as regular expressions')
+    parser.add_argument('--whole-word', action='store_true', help='only match whole words')
+    parser.add_argument('--case', action='store_true', help='match case')
+    parser.add_argument('--include', default='*', help='file name globs to process in directories, separated by ; or , (default *)')
+    parser.add_argument('--exclude', default='', help='file and directory name globs to skip')
+    parser.add_argument('--max-size', type=float, metavar='MB', help='skip files in directories larger than this')
+    parser.add_argument('--by-line', action='store_true', help="treat regexes as never matching across lines, so files can be streamed a chunk of lines at a time (automatic for regexes that can't)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='worker processes (default: one per CPU)')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='count what would be replaced without writing anything')
+    parser.add_argument('--json', action='store_true', help='print a JSON object per file and a summary line instead of text')
+    args = parser.parse_args(argv)
+
+    try:
+        rules = load_rules(args)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    summary = run(args, rules)
+    if args.json:
+        print(json.dumps({'summary': summary}))
+    else:
+        rate = summary['bytes'] / summary['seconds'] if summary['seconds'] else 0
+        verb = 'would change' if args.dry_run else 'changed'
+        print(f"{summary['files']} files, {verb} {summary['changed']} ({summary['replacements']} replacements), "
+              f"{summary['skipped']} skipped, {summary['errors']} errors; "
+              f"{format_size(summary['bytes'])} in {summary['seconds']:.2f}s ({format_size(rate)}/s)", file=sys.stderr)
+    return 1 if summary['errors'] else 0
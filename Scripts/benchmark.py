@@ -0,0 +1,404 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from diff import DiffJob
+from document import Document
+from fileio import read_file
+from highlight import Highlighter, lexer_for
+from journal import Journal
+from largefile import LARGE_WINDOW, LargeFile
+from gutter import render_line_numbers
+from saver import SaveJob, format_size
+from search import BackgroundSearch, SearchEngine, replace_file
+
+VOCABULARY = ('the quick brown fox jumps over lazy dog lorem ipsum dolor sit amet editor buffer '
+              'piece table line offset search replace window gutter scroll widget index').split()
+NEEDLE = 'needle'
+
+# Corpus shapes: mean line length and the share of lines containing NEEDLE
+SHAPES = {
+    'prose': {'line_length': 60, 'density': 0.001},
+    'dense': {'line_length': 60, 'density': 0.5},
+    'long-lines': {'line_length': 2000, 'density': 0.01},
+}
+
+VIEW_LINES = 50 # Lines re-rendered after each keystroke
+
+
+class Skip(Exception):
+    """Raised by a benchmark that can't run here"""
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit, scale in (('GB', 1 << 30), ('MB', 1 << 20), ('KB', 1 << 10), ('B', 1)):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * scale)
+    return int(text)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def generate_corpus(path, size, line_length, density, seed=0):
+    """Write size bytes of ASCII lines drawn from a pool with the given shape"""
+    rng = random.Random(seed)
+    pool = []
+    for _ in range(4096):
+        length = max(1, int(rng.expovariate(1 / line_length)))
+        words, count = [], 0
+        while count < length:
+            word = rng.choice(VOCABULARY)
+            words.append(word)
+            count += len(word) + 1
+        if rng.random() < density:
+            words.insert(rng.randrange(len(words) + 1), NEEDLE)
+        pool.append(' '.join(words))
+
+    temp_path = path + '.tmp'
+    written = 0
+    with open(temp_path, 'w', encoding='ascii', newline='\n') as file:
+        while written < size:
+            block = '\n'.join(rng.choices(pool, k=10000)) + '\n'
+            block = block[:size - written]
+            file.write(block)
+            written += len(block)
+    os.replace(temp_path, path)
+
+
+def corpus_path(directory, shape, size):
+    """Path of a generated corpus, creating it the first time it is asked for"""
+    path = os.path.join(directory, f'{shape}-{format_size(size)}.txt')
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        print(f'Generating {os.path.basename(path)}...', file=sys.stderr)
+        generate_corpus(path, size, **SHAPES[shape])
+    return path
+
+
+def read_text(path):
+    return read_file(path)[0]
+
+
+class Timer:
+    """Collects wall time per measured block and, when tracing, the peak extra heap it used"""
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.samples = []
+        self.peak = 0
+
+    @contextmanager
+    def measure(self):
+        if self.trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield
+        self.samples.append(time.perf_counter() - start)
+        if self.trace:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1] - base)
+
+
+# Benchmarks: each takes (path, timer, options) and measures one editor operation
+def bench_open(path, timer, options):
+    """load_file for an in-memory document: read, build the piece table, hash for the dirty check"""
+    with timer.measure():
+        document = Document(read_text(path))
+        document.digest()
+
+
+def bench_open_large(path, timer, options):
+    """open_large_file: time until the first window of lines can be shown"""
+    with timer.measure():
+        large_file = LargeFile(path)
+        while not (large_file.line_count > LARGE_WINDOW or large_file.complete):
+            time.sleep(0.001)
+        large_file.lines(1, LARGE_WINDOW)
+    large_file.close()
+
+
+def bench_index_large(path, timer, options):
+    """Background line index of a large file, start to finish"""
+    with timer.measure():
+        large_file = LargeFile(path)
+        while not large_file.complete:
+            time.sleep(0.001)
+    large_file.close()
+
+
+def bench_keystroke(path, timer, options):
+    """Per-key cost behind document_edited: mirror, journal, re-highlight the view"""
+    document = Document(read_text(path))
+    highlighter = Highlighter(lexer_for('bench.py'), document.get_line, document.line_count)
+    while highlighter.sweep(lambda line, tokens: None, 10000): # Start from the idle sweep having caught up
+        pass
+    directory = tempfile.mkdtemp(prefix='texteditor-bench-')
+    journal = Journal(os.path.join(directory, 'bench.journal'), document.digest(), fsync=False)
+    rng = random.Random(1)
+    offset = document.line_start(document.line_count // 2)
+    try:
+        for i in range(options.keystrokes):
+            key = '\n' if i % 40 == 39 else rng.choice('abcdefghijklmnopqrstuvwxyz ')
+            with timer.measure():
+                document.insert(offset, key)
+                line = document.index_of(offset)[0]
+                highlighter.edited(line, key.count('\n'))
+                journal.insert(offset, key)
+                first = max(line - VIEW_LINES // 2, 1)
+                highlighter.render(first, first + VIEW_LINES, lambda line, tokens: None)
+            offset += 1
+    finally:
+        journal.close(discard=True)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_gutter(path, timer, options):
+    """Per-key cost of update_line_numbers: type into a Text widget showing the document, then renumber the view"""
+    import tkinter
+
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError as e:
+        raise Skip(f'needs a display ({e})')
+    try:
+        root.geometry('1000x800')
+        text_area = tkinter.Text(root, undo=False)
+        line_numbers = tkinter.Text(root, width=4, state='disabled')
+        line_numbers.pack(side='left', fill='y')
+        text_area.pack(side='right', fill='both', expand=True)
+        text = read_text(path)
+        line_count = text.count('\n') + 1
+        text_area.insert(1.0, text)
+        text_area.mark_set('insert', f'{line_count // 2}.0')
+        text_area.see('insert')
+        root.update()
+        view = render_line_numbers(text_area, line_numbers, line_count=line_count)
+        rng = random.Random(1)
+        for i in range(options.keystrokes):
+            key = '\n' if i % 40 == 39 else rng.choice('abcdefghijklmnopqrstuvwxyz ')
+            with timer.measure():
+                text_area.insert('insert', key)
+                line_count += key == '\n'
+                view = render_line_numbers(text_area, line_numbers, line_count=line_count, last_view=view)
+                root.update_idletasks()
+    finally:
+        root.destroy()
+
+
+def bench_find_all(path, timer, options):
+    """perform_search: BackgroundSearch from start until every match is found"""
+    text = read_text(path)
+    engine = SearchEngine(NEEDLE)
+    with timer.measure():
+        job = BackgroundSearch(engine, text)
+        while not job.done:
+            time.sleep(0.0005)
+
+
+def bench_replace_all(path, timer, options):
+    """replace_all on the document model: find the edits and splice them in one pass"""
+    text = read_text(path)
+    document = Document(text)
+    engine = SearchEngine(NEEDLE)
+    with timer.measure():
+        edits = list(engine.edits(text, 'pin'))
+        document.replace_spans([(start, end) for start, end, _ in edits], [new_text for _, _, new_text in edits])
+
+
+def bench_replace_large(path, timer, options):
+    """replace_in_file: stream a large file through replace_file"""
+    directory = tempfile.mkdtemp(prefix='texteditor-bench-')
+    work_path = os.path.join(directory, os.path.basename(path))
+    shutil.copyfile(path, work_path)
+    try:
+        with timer.measure():
+            replace_file(work_path, SearchEngine(NEEDLE), 'pin')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_save(path, timer, options):
+    """write_file: SaveJob of a snapshot to a new file"""
+    document = Document(read_text(path))
+    document.insert(0, 'x') # Saves usually follow an edit, so the piece table isn't a single piece
+    directory = tempfile.mkdtemp(prefix='texteditor-bench-')
+    try:
+        with timer.measure():
+            job = SaveJob(os.path.join(directory, 'saved.txt'), document.snapshot(), fsync=options.fsync)
+            job.join()
+        if job.error:
+            raise job.error
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_dirty_check(path, timer, options):
+    """exit's dirty check with verify_exit on: re-hash the text"""
+    document = Document(read_text(path))
+    document.insert(0, 'x')
+    with timer.measure():
+        document.digest()
+
+
+def bench_compare(path, timer, options):
+    """compare: diff the text against a copy with a scattering of lines edited, inserted and deleted"""
+    text = read_text(path)
+    lines = text.split('\n')
+    rng = random.Random(0)
+    for _ in range(max(len(lines) // 1000, 1)):
+        pos = rng.randrange(len(lines))
+        choice = rng.random()
+        if choice < 0.4:
+            lines[pos] += ' edited'
+        elif choice < 0.7:
+            lines.insert(pos, f'inserted line {pos}')
+        else:
+            del lines[pos]
+    edited = '\n'.join(lines)
+    with timer.measure():
+        job = DiffJob(lambda: text, lambda: edited)
+        job.join()
+
+
+BENCHMARKS = {
+    'open': (bench_open, False),
+    'open_large': (bench_open_large, True),
+    'index_large': (bench_index_large, True),
+    'keystroke': (bench_keystroke, False),
+    'gutter': (bench_gutter, False),
+    'find_all': (bench_find_all, False),
+    'replace_all': (bench_replace_all, False),
+    'replace_large': (bench_replace_large, True),
+    'save': (bench_save, False),
+    'dirty_check': (bench_dirty_check, False),
+    'compare': (bench_compare, False),
+}
+
+
+def run(names, shapes, sizes, options):
+    results = {}
+    for size in sizes:
+        large = size >= options.large_mb * 1024 * 1024 # The editor opens these read-only through LargeFile
+        for shape in shapes:
+            path = corpus_path(options.corpus_dir, shape, size)
+            for name in names:
+                function, for_large = BENCHMARKS[name]
+                if for_large != large:
+                    continue
+
+                key = f'{name}/{shape}/{format_size(size)}'
+                print(f'Running {key}...', file=sys.stderr)
+                timer = Timer()
+                try:
+                    for _ in range(options.repeat):
+                        function(path, timer, options)
+                except Skip as e:
+                    print(f'Skipped {key}: {e}', file=sys.stderr)
+                    continue
+
+                # One more run under tracemalloc, which is too slow to time
+                traced = Timer(trace=True)
+                tracemalloc.start()
+                try:
+                    function(path, traced, options)
+                finally:
+                    tracemalloc.stop()
+
+                samples = timer.samples
+                results[key] = {
+                    'samples': len(samples),
+                    'mean': sum(samples) / len(samples),
+                    'p50': percentile(samples, 0.5),
+                    'p90': percentile(samples, 0.9),
+                    'p99': percentile(samples, 0.99),
+                    'max': max(samples),
+                    'peak_mb': traced.peak / (1 << 20),
+                }
+    return results
+
+
+def compare(results, baseline, tolerance, noise):
+    """Return [(key, old p50, new p50, ratio)] for every result slower than baseline beyond tolerance"""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        ratio = result['p50'] / old['p50'] if old['p50'] else float('inf')
+        if ratio > 1 + tolerance and result['p50'] - old['p50'] > noise:
+            regressions.append((key, old['p50'], result['p50'], ratio))
+    return regressions
+
+
+def print_table(results, baseline, stream=sys.stdout):
+    print(f'{"benchmark":<36}{"p50 ms":>11}{"p90 ms":>11}{"p99 ms":>11}{"peak MB":>10}{"vs base":>10}', file=stream)
+    for key, result in results.items():
+        old = baseline.get(key)
+        change = f'{result["p50"] / old["p50"]:>9.2f}x' if old and old['p50'] else ''
+        print(f'{key:<36}{result["p50"] * 1000:>11.3f}{result["p90"] * 1000:>11.3f}{result["p99"] * 1000:>11.3f}'
+              f'{result["peak_mb"]:>10.1f}{change:>10}', file=stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmark', description='Benchmark the editor engines on generated corpora')
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS), help='comma-separated benchmarks to run')
+    parser.add_argument('--shapes', default=','.join(SHAPES), help='comma-separated corpus shapes')
+    parser.add_argument('--sizes', default='1MB,10MB', help='comma-separated corpus sizes, e.g. 1MB,100MB,1GB')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark')
+    parser.add_argument('--keystrokes', type=int, default=2000, help='keys typed per keystroke run')
+    parser.add_argument('--large-mb', type=int, default=64, help='corpora this big take the large file path (as the large_file_mb setting)')
+    parser.add_argument('--fsync', action='store_true', help='fsync saves, as the editor does by default')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'texteditor-bench'), help='where generated corpora are cached')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='compare against results saved with --json')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='slowdown in p50 allowed before a result counts as a regression')
+    parser.add_argument('--noise', type=float, default=0.5, help='ignore p50 slowdowns smaller than this many ms')
+    options = parser.parse_args(argv)
+
+    names = [name for name in options.benchmarks.split(',') if name]
+    shapes = [shape for shape in options.shapes.split(',') if shape]
+    unknown = [name for name in names if name not in BENCHMARKS] + [shape for shape in shapes if shape not in SHAPES]
+    if unknown:
+        parser.error(f'unknown benchmark or shape: {", ".join(unknown)}')
+    sizes = [parse_size(size) for size in options.sizes.split(',') if size]
+
+    results = run(names, shapes, sizes, options)
+    baseline = {}
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline = json.load(file)['results']
+    print_table(results, baseline)
+
+    if options.json:
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'options': {'repeat': options.repeat, 'keystrokes': options.keystrokes, 'fsync': options.fsync},
+            },
+            'results': results,
+        }
+        with open(options.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    regressions = compare(results, baseline, options.tolerance, options.noise / 1000)
+    for key, old, new, ratio in regressions:
+        print(f'REGRESSION {key}: p50 {old * 1000:.3f} ms -> {new * 1000:.3f} ms ({ratio:.2f}x)', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
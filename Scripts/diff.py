@@ -0,0 +1,182 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from difflib import SequenceMatcher
+from operator import itemgetter
+
+
+def diff_lines(a, b, fallback_limit=1 << 20):
+    """Return SequenceMatcher-style (tag, i1, i2, j1, j2) opcodes that turn the lines a into b.
+
+    Lines are numbered by value first, so everything after that compares
+    ints. Each region is trimmed of the lines it starts and ends with, then
+    split on the longest in-order run of lines that occur once on both
+    sides (patience diff), or failing that the rarest lines that occur as
+    often on both (as histogram diff does), and the pieces in between are
+    diffed the same way. That keeps the work near linear however long the
+    files are. Only regions with no such line left go to SequenceMatcher,
+    and only if they have fewer than fallback_limit line pairs; bigger ones
+    count as replaced.
+    """
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a]
+    b = [ids.setdefault(line, len(ids)) for line in b]
+
+    blocks = [] # Matching (i, j, length) runs
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = regions.pop()
+        head = 0
+        while a_lo + head < a_hi and b_lo + head < b_hi and a[a_lo + head] == b[b_lo + head]:
+            head += 1
+        if head:
+            blocks.append((a_lo, b_lo, head))
+            a_lo += head
+            b_lo += head
+        tail = 0
+        while a_hi - tail > a_lo and b_hi - tail > b_lo and a[a_hi - 1 - tail] == b[b_hi - 1 - tail]:
+            tail += 1
+        if tail:
+            blocks.append((a_hi - tail, b_hi - tail, tail))
+            a_hi -= tail
+            b_hi -= tail
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+
+        anchors = _anchors(a, a_lo, a_hi, b, b_lo, b_hi)
+        if anchors:
+            for i, j in anchors:
+                blocks.append((i, j, 1))
+                regions.append((a_lo, i, b_lo, j))
+                a_lo, b_lo = i + 1, j + 1
+            regions.append((a_lo, a_hi, b_lo, b_hi))
+        elif (a_hi - a_lo) * (b_hi - b_lo) <= fallback_limit:
+            matcher = SequenceMatcher(None, a[a_lo:a_hi], b[b_lo:b_hi], autojunk=False)
+            blocks.extend((a_lo + i, b_lo + j, length) for i, j, length in matcher.get_matching_blocks() if length)
+    blocks.sort()
+    return _opcodes(blocks, len(a), len(b))
+
+
+def _anchors(a, a_lo, a_hi, b, b_lo, b_hi):
+    """(i, j) pairs of matching lines to split a region on.
+
+    Lines that occur as often in a[a_lo:a_hi] as in b[b_lo:b_hi] pair up,
+    the nth occurrence with the nth; of those, only the rarest lines are
+    used (once each, ideally), and only their longest in-order run.
+    """
+    a_positions = {}
+    for i in range(a_lo, a_hi):
+        a_positions.setdefault(a[i], []).append(i)
+    b_positions = {}
+    for j in range(b_lo, b_hi):
+        b_positions.setdefault(b[j], []).append(j)
+    shared = [(line, positions) for line, positions in b_positions.items() if len(a_positions.get(line, ())) == len(positions)]
+    if not shared:
+        return []
+    rarest = min(len(positions) for _, positions in shared)
+    pairs = [pair for line, positions in shared if len(positions) == rarest for pair in zip(a_positions[line], positions)]
+    pairs.sort(key=itemgetter(1))
+
+    # Longest increasing run of i (patience sorting)
+    tails = [] # Smallest i that ends a run of each length
+    ends = [] # Index in pairs of that run's last pair
+    back = []
+    for k, (i, _) in enumerate(pairs):
+        pos = bisect_left(tails, i)
+        back.append(ends[pos - 1] if pos else -1)
+        if pos == len(tails):
+            tails.append(i)
+            ends.append(k)
+        else:
+            tails[pos] = i
+            ends[pos] = k
+    run = []
+    k = ends[-1] if ends else -1
+    while k >= 0:
+        run.append(pairs[k])
+        k = back[k]
+    return run[::-1]
+
+
+def _opcodes(blocks, a_length, b_length):
+    opcodes = []
+    i = j = 0
+    for block_i, block_j, length in blocks + [(a_length, b_length, 0)]:
+        if i < block_i or j < block_j:
+            tag = 'replace' if i < block_i and j < block_j else 'delete' if i < block_i else 'insert'
+            opcodes.append((tag, i, block_i, j, block_j))
+        if length:
+            last = opcodes[-1] if opcodes else None
+            if last and last[0] == 'equal' and last[2] == block_i and last[4] == block_j:
+                opcodes[-1] = ('equal', last[1], block_i + length, last[3], block_j + length)
+            else:
+                opcodes.append(('equal', block_i, block_i + length, block_j, block_j + length))
+        i, j = block_i + length, block_j + length
+    return opcodes
+
+
+class DiffRows:
+    """The rows of a side-by-side view of two line lists.
+
+    Equal and changed lines share a row; a replaced block takes as many
+    rows as its longer side, the shorter one padded with blank rows. Rows
+    are worked out from the opcodes on request, so only the ones on screen
+    ever exist.
+    """
+
+    def __init__(self, opcodes):
+        self.opcodes = opcodes
+        self.starts = [] # First row of each opcode
+        row = 0
+        for _, i1, i2, j1, j2 in opcodes:
+            self.starts.append(row)
+            row += max(i2 - i1, j2 - j1)
+        self.count = row
+        self.hunks = [start for start, opcode in zip(self.starts, opcodes) if opcode[0] != 'equal'] # First row of each change
+
+    def rows(self, first, last):
+        """Yield (tag, i, j) for rows first to last - 1; i or j is None where that side has no line"""
+        opcodes, starts = self.opcodes, self.starts
+        k = max(bisect_right(starts, first) - 1, 0)
+        row = first
+        while k < len(opcodes) and row < last:
+            tag, i1, i2, j1, j2 = opcodes[k]
+            end = min(last, starts[k] + max(i2 - i1, j2 - j1))
+            for offset in range(row - starts[k], end - starts[k]):
+                yield tag, i1 + offset if i1 + offset < i2 else None, j1 + offset if j1 + offset < j2 else None
+            row = end
+            k += 1
+
+
+class DiffJob:
+    """Reads and diffs two texts by line on a worker thread.
+
+    left and right are callables returning the texts, so reading files
+    happens off the UI thread too. Poll done from the UI thread, then use
+    rows and the line lists, or error if anything went wrong.
+    """
+
+    def __init__(self, left, right):
+        self.left_lines = None
+        self.right_lines = None
+        self.rows = None
+        self.error = None
+        self.seconds = 0.0
+        self.done = False
+        self._thread = threading.Thread(target=self._run, args=(left, right), daemon=True)
+        self._thread.start()
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self, left, right):
+        start = time.perf_counter()
+        try:
+            self.left_lines = left().split('\n')
+            self.right_lines = right().split('\n')
+            self.rows = DiffRows(diff_lines(self.left_lines, self.right_lines))
+        except Exception as e: # Including MemoryError; anything left unset here would break the poll
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+            self.done = True
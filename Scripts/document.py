@@ -0,0 +1,325 @@
+import hashlib
+import re
+from bisect import bisect_left, bisect_right
+
+NEWLINE = re.compile('\n')
+ASTRAL = re.compile('[\U00010000-\U0010ffff]') # Outside the BMP: two columns to Tk
+
+
+def newline_positions(text, base=0):
+    return [match.start() + base for match in NEWLINE.finditer(text)]
+
+
+def tk_column(line, col):
+    """Tk's column for column col of line.
+
+    Tcl 8.6 keeps text as UTF-16, so a character outside the BMP (most
+    emoji) counts as two columns in Tk indices and as one in Python.
+    """
+    if line.isascii():
+        return col
+    return col + len(ASTRAL.findall(line, 0, col))
+
+
+def code_column(line, tk_col):
+    """The column in line of Tk column tk_col; the inverse of tk_column"""
+    if line.isascii() or not ASTRAL.search(line, 0, tk_col):
+        return tk_col
+    units = 0
+    for col, char in enumerate(line):
+        if units >= tk_col:
+            return col
+        units += 2 if char > '\uffff' else 1
+    return len(line)
+
+
+class Document:
+    """Piece table holding the editor text. The Text widget only mirrors it.
+
+    Pieces are (buffer, start, length, newlines) tuples pointing into the
+    original text or the append-only add buffers, so edits never copy the
+    document and snapshots are just a copy of the piece list.
+    """
+
+    ORIGINAL = 0
+    ADD_LIMIT = 1 << 16 # Start a new add buffer past this size so appends stay cheap
+
+    def __init__(self, text=''):
+        self._buffers = [text]
+        self._newlines = [newline_positions(text)]
+        self._pieces = [self._piece(self.ORIGINAL, 0, len(text))] if text else []
+        self._length = len(text)
+        self._line_breaks = len(self._newlines[self.ORIGINAL])
+        self.version = 0
+
+        # Prefix sums over the pieces, rebuilt lazily from self._stale
+        self._starts = []
+        self._lines = []
+        self._stale = 0
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def line_count(self):
+        return self._line_breaks + 1
+
+    # Editing
+    def insert(self, offset, text):
+        if not 0 <= offset <= self._length:
+            raise IndexError(f'offset {offset} out of range')
+        if not text:
+            return
+
+        piece = self._append(text)
+        self._splice(offset, offset, [piece])
+        self._length += len(text)
+        self._line_breaks += piece[3]
+        self.version += 1
+
+    def delete(self, offset, length):
+        """Delete length chars at offset and return the removed text"""
+        end = min(offset + length, self._length)
+        if not 0 <= offset <= self._length:
+            raise IndexError(f'offset {offset} out of range')
+        if end <= offset:
+            return ''
+
+        removed = self.get_text(offset, end)
+        self._splice(offset, end, [])
+        self._length -= end - offset
+        self._line_breaks -= removed.count('\n')
+        self.version += 1
+        return removed
+
+    def replace_spans(self, spans, text):
+        """Replace every (start, end) span in a single pass.
+
+        text is either one string for all spans or a list with one string per
+        span. Spans must be sorted and must not overlap.
+        """
+        if not spans:
+            return
+
+        texts = [text] * len(spans) if isinstance(text, str) else text
+        new_pieces = self._append_all(texts)
+        pieces = []
+        cursor = 0
+        for (start, end), new_piece in zip(spans, new_pieces):
+            if start < cursor or end > self._length:
+                raise IndexError(f'span ({start}, {end}) out of order or range')
+            pieces.extend(self._slice(cursor, start))
+            if new_piece:
+                pieces.append(new_piece)
+            cursor = end
+        pieces.extend(self._slice(cursor, self._length))
+
+        self._pieces = self._coalesce(pieces)
+        self._stale = 0
+        self._length = sum(piece[2] for piece in self._pieces)
+        self._line_breaks = sum(piece[3] for piece in self._pieces)
+        self.version += 1
+
+    # Reading
+    def get_text(self, start=0, end=None):
+        return ''.join(self.chunks(start, end))
+
+    def chunks(self, start=0, end=None):
+        """Yield the text between start and end piece by piece, without joining it"""
+        end = self._length if end is None else min(end, self._length)
+        buffers = self._buffers
+        for buf, pstart, length, _ in self._slice(start, end):
+            yield buffers[buf][pstart:pstart + length]
+
+    def pieces(self):
+        """Yield (text, origin) per piece; origin is its offset in the original text, or None for inserted text"""
+        buffers = self._buffers
+        for buf, pstart, length, _ in self._pieces:
+            yield buffers[buf][pstart:pstart + length], pstart if buf == self.ORIGINAL else None
+
+    def snapshot(self):
+        """Return a read-only copy that is unaffected by later edits"""
+        copy = Document.__new__(Document)
+        copy._buffers = list(self._buffers)
+        copy._newlines = list(self._newlines) # Only ever extended past what the copied pieces use
+        copy._pieces = list(self._pieces)
+        copy._length = self._length
+        copy._line_breaks = self._line_breaks
+        copy.version = self.version
+        copy._starts = []
+        copy._lines = []
+        copy._stale = 0
+        return copy
+
+    def digest(self, block=1 << 20):
+        """Hash of the text, so saved and current states can be compared without keeping a copy"""
+        return self.hasher(block).hexdigest()
+
+    def hasher(self, block=1 << 20):
+        """The hash object behind digest(); updating it with appended text gives the digest of the longer text"""
+        hasher = hashlib.blake2b(digest_size=16)
+        for chunk in self.chunks():
+            for i in range(0, len(chunk), block):
+                hasher.update(chunk[i:i + block].encode('utf-8', 'surrogatepass'))
+        return hasher
+
+    # Line / column mapping (lines are 1-based, like Tk indices)
+    def line_start(self, line):
+        if line <= 1:
+            return 0
+        breaks = line - 1
+        if breaks > self._line_breaks:
+            return self._length
+
+        self._reindex()
+        i = bisect_left(self._lines, breaks) - 1
+        buf, pstart, _, _ = self._pieces[i]
+        newlines = self._newlines[buf]
+        pos = newlines[bisect_left(newlines, pstart) + breaks - self._lines[i] - 1]
+        return self._starts[i] + pos - pstart + 1
+
+    def line_end(self, line):
+        if line >= self.line_count:
+            return self._length
+        return self.line_start(line + 1) - 1
+
+    def get_line(self, line):
+        return self.get_text(self.line_start(line), self.line_end(line))
+
+    def offset_of(self, line, col):
+        start = self.line_start(line)
+        return min(start + max(col, 0), self.line_end(line))
+
+    def index_of(self, offset):
+        """Return the (line, col) of offset"""
+        offset = max(0, min(offset, self._length))
+        if not self._pieces:
+            return 1, 0
+
+        self._reindex()
+        i = max(bisect_right(self._starts, offset) - 1, 0)
+        buf, pstart, _, _ = self._pieces[i]
+        newlines = self._newlines[buf]
+        local = pstart + offset - self._starts[i]
+        breaks = self._lines[i] + bisect_left(newlines, local) - bisect_left(newlines, pstart)
+        return breaks + 1, offset - self.line_start(breaks + 1)
+
+    def tk_index(self, offset):
+        """Tk 'line.col' index of offset"""
+        line, col = self.index_of(offset)
+        return f'{line}.{tk_column(self.get_text(offset - col, offset), col)}'
+
+    def tk_offset(self, line, tk_col):
+        """Offset of the Tk index line.tk_col"""
+        start = self.line_start(line)
+        prefix = self.get_text(start, min(start + max(tk_col, 0), self.line_end(line))) # No more characters than Tk columns
+        return start + min(code_column(prefix, max(tk_col, 0)), len(prefix))
+
+    # Internals
+    def _piece(self, buf, start, length):
+        newlines = self._newlines[buf]
+        return (buf, start, length, bisect_left(newlines, start + length) - bisect_left(newlines, start))
+
+    def _append(self, text):
+        buf = len(self._buffers) - 1
+        if buf == self.ORIGINAL or len(self._buffers[buf]) + len(text) > self.ADD_LIMIT:
+            self._buffers.append('')
+            self._newlines.append([])
+            buf += 1
+        start = len(self._buffers[buf])
+        self._buffers[buf] += text
+        self._newlines[buf].extend(newline_positions(text, start))
+        return self._piece(buf, start, len(text))
+
+    def _append_all(self, texts):
+        """Append many texts with one buffer write and return a piece (or None) per text"""
+        first = self._append(''.join(texts))
+        buf, start = first[0], first[1]
+        pieces = []
+        for text in texts:
+            pieces.append(self._piece(buf, start, len(text)) if text else None)
+            start += len(text)
+        return pieces
+
+    def _reindex(self):
+        pieces, starts, lines = self._pieces, self._starts, self._lines
+        i = self._stale
+        if i >= len(pieces) and len(starts) == len(pieces):
+            return
+
+        del starts[i:], lines[i:]
+        if i:
+            offset = starts[i - 1] + pieces[i - 1][2]
+            breaks = lines[i - 1] + pieces[i - 1][3]
+        else:
+            offset = breaks = 0
+        for _, _, length, newlines in pieces[i:]:
+            starts.append(offset)
+            lines.append(breaks)
+            offset += length
+            breaks += newlines
+        self._stale = len(pieces)
+
+    def _slice(self, start, end):
+        if start >= end:
+            return []
+
+        self._reindex()
+        pieces, starts = self._pieces, self._starts
+        i = max(bisect_right(starts, start) - 1, 0)
+        result = []
+        while i < len(pieces) and starts[i] < end:
+            piece = pieces[i]
+            lo = max(start - starts[i], 0)
+            hi = min(end - starts[i], piece[2])
+            if lo == 0 and hi == piece[2]:
+                result.append(piece)
+            elif hi > lo:
+                result.append(self._piece(piece[0], piece[1] + lo, hi - lo))
+            i += 1
+        return result
+
+    def _splice(self, start, end, new):
+        self._reindex()
+        pieces, starts = self._pieces, self._starts
+        i = max(bisect_right(starts, start) - 1, 0)
+        j = bisect_left(starts, end) if start < end else bisect_right(starts, start)
+        if j <= i:
+            j = i
+            i = j - (1 if j and starts[j - 1] < start else 0)
+
+        middle = []
+        if i < j:
+            first, last = pieces[i], pieces[j - 1]
+            if starts[i] < start:
+                middle.append(self._piece(first[0], first[1], start - starts[i]))
+            middle.extend(new)
+            tail = starts[j - 1] + last[2] - end
+            if tail > 0:
+                middle.append(self._piece(last[0], last[1] + last[2] - tail, tail))
+        else:
+            middle.extend(new)
+
+        # Let neighbours merge with the new pieces so typing does not fragment the table
+        if i > 0:
+            i -= 1
+            middle.insert(0, pieces[i])
+        if j < len(pieces):
+            middle.append(pieces[j])
+            j += 1
+
+        pieces[i:j] = self._coalesce(middle)
+        self._stale = min(self._stale, i)
+
+    def _coalesce(self, pieces):
+        result = []
+        for piece in pieces:
+            if not piece[2]:
+                continue
+            if result:
+                buf, start, length, newlines = result[-1]
+                if buf == piece[0] and start + length == piece[1]:
+                    result[-1] = (buf, start, length + piece[2], newlines + piece[3])
+                    continue
+            result.append(piece)
+        return result
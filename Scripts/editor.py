@@ -1,45 +1,135 @@
 from ttkbootstrap import *
-from ttkbootstrap.tooltip import ToolTip
-from configparser import ConfigParser
 import os
-from tkinter.filedialog import askopenfilename, asksaveasfilename
+from tkinter import TclError
+from document import Document, tk_column
+from largefile import LARGE_WINDOW, LargeFile
+from search import BackgroundSearch, LineIndex, SearchEngine, replace_file
+from fileio import FileFormat, detect_file, read_file
+from saver import SaveJob, format_size
+from settings import Settings
+from watcher import DiskState, FileWatcher, line_edits, signature, stat_signature
+from gutter import render_line_numbers, visible_lines
+from highlight import TAG_COLORS, Highlighter, lexer_for
+from journal import Journal, journal_path, recover
+from undo import SpanEdit, UndoHistory, undo_path
+from bisect import bisect_left, bisect_right
+import threading
+import time
+import re
+from contextlib import nullcontext
+
+
+def tab_attribute(name):
+    """Editor attribute that reads and writes the active tab's"""
+    return property(lambda self: getattr(self.tab, name), lambda self, value: setattr(self.tab, name, value))
+
+
+class Tab:
+    """One open document: its text area and the state that goes with it.
+
+    Tabs past the resident limit are evicted: the text area is emptied and
+    the document dropped, leaving the file path and, for unsaved changes,
+    the recovery journal to rebuild it from when the tab is selected again.
+    """
+
+    def __init__(self, page, text_area):
+        self.page = page # Empty notebook page; the tab bar only shows its label
+        self.text_area = text_area
+        self.text_command = None
+        self.document = Document()
+        self.mirroring = True
+        self.save_path = None
+        self.saved_version = 0
+        self.saved_digest = None
+        self.file_format = FileFormat()
+        self.disk = None # DiskState of the file when the document last matched it
+        self.disk_hash = None # Hash object of the text at that point, to extend when the file is appended to
+        self.disk_changed = False # Changed by another program while the tab was in the background
+        self.reloading = False # A reload is reading and diffing the file on a worker
+        self.large_file = None
+        self.window_start = 1
+        self.highlighter = None
+        self.journal = None
+        self.history = UndoHistory()
+        self.history_digest = None # Digest of the document the history ends at, while evicted
+        self.evicted = False
+        self.modified = False # Whether it had unsaved changes when evicted
+        self.view = None # Cursor and scroll position when evicted
 
 
 class TextEditor:
-    def __init__(self):
+    LARGE_WINDOW = LARGE_WINDOW
+    LARGE_MARGIN = 200
+    HIGHLIGHT_MARGIN = 100 # Lines above/below the view that get search tags
+    HIGHLIGHT_CHUNK = 300 # Lines syntax highlighted per idle callback
+    AUTOSAVE_MS = 5000 # How often to check whether the recovery journal needs compacting
+    WATCH_MS = 500 # How often to look for changes other programs made to open files
+    COMPARE_CONTEXT = 3 # Unchanged rows shown above a change when stepping to it
+    FILE_HITS_PER_POLL = 500 # Find in Files results added to the list per callback
+    FILE_HITS_SHOWN = 10000 # ...and in all
+
+    # Per-document state lives on the active tab
+    text_area = tab_attribute('text_area')
+    text_command = tab_attribute('text_command')
+    document = tab_attribute('document')
+    mirroring = tab_attribute('mirroring')
+    save_path = tab_attribute('save_path')
+    saved_version = tab_attribute('saved_version')
+    saved_digest = tab_attribute('saved_digest')
+    file_format = tab_attribute('file_format')
+    large_file = tab_attribute('large_file')
+    window_start = tab_attribute('window_start')
+    highlighter = tab_attribute('highlighter')
+    journal = tab_attribute('journal')
+    history = tab_attribute('history')
+
+    def __init__(self, file_path=None, profile=None, tracer=None):
         # Initial Vars
-        self.config = ConfigParser()
-        self.update_config()
+        self.profile = profile
+        self.tracer = tracer
+        self.settings = Settings()
         self.finding = False
-        self.save_path = None
-        self.pad = self.config.getint('Editor', 'pad')
+        self.pad = self.settings.getint('pad')
         self.search_matches = []
         self.current_match_index = -1
         self.last_search = ""
+        self.search_job = None
+        self.search_after = None
+        self.search_refresh = None # Searches again, while the Find panel is open
+        self.file_search = None
+        self.save_job = None
+        self.tagged_matches = None
         self.remember_var = None
+        self.gutter_view = None
+        self.highlight_after = None
+        self.tab = None
+        self.tabs = [] # In tab bar order
+        self.recent = [] # Least recently used first
+        self.shortcuts = {} # Key sequence -> command, for bind_shortcut
+        self.watcher = FileWatcher()
         self.destroy_binds = ['<Escape>', '<Control-w>', '<Control-q>']
-        self.window = Window(themename=self.config.get('Editor', 'theme'), title='Text Editor', size=(1280, 720))
+        self.mark('settings')
+        self.window = Window(themename=self.settings.get('theme'), title='Text Editor', size=(1280, 720))
+        self.mark('window')
         pad = self.pad
 
-        # Text Area
-        self.text_area = Text(self.window, font=('', self.config.getint('Editor', 'font_size')))
-        self.text_area.pack(side='right', fill='both', expand=True, padx=pad, pady=pad)
-        self.text_area.focus_set()
+        # Tabs (the tab bar's pages are empty; the active tab's text area is packed in the body below it)
+        editor_frame = Frame(self.window)
+        editor_frame.pack(side='right', fill='both', expand=True)
+        self.tab_bar = Notebook(editor_frame)
+        self.tab_bar.pack(side='top', fill='x', padx=pad, pady=(pad, 0))
+        self.tab_bar.enable_traversal()
+        self.tab_bar.bind('<<NotebookTabChanged>>', lambda _: self.on_tab_changed())
+        self.tab_bar.bind('<Button-2>', self.on_tab_middle_click)
+        self.body = Frame(editor_frame)
+        self.body.pack(side='top', fill='both', expand=True)
 
-        # Add line numbers sidebar
-        self.line_numbers = Text(self.window, width=4, border=0, state='disabled', font=('', self.config.getint('Editor', 'font_size')))
+        # Large File Scrolling (the text area only holds a window of lines)
+        self.large_scroll = Scrollbar(self.body, orient='vertical', command=self.scroll_large_file)
 
-        # Get Last Doc
-        if self.config.get('Editor', 'last_doc') != None:
-            try:
-                with open(self.config.get('Editor', 'last_doc'), 'r') as f:
-                    self.text_area.insert(1.0, f.read() if self.config.getboolean('Editor', 'remember') and self.config.get('Editor', 'last_doc') else '')
-                    self.save_path = self.config.get('Editor', 'last_doc') if self.config.getboolean('Editor', 'remember') and self.config.get('Editor', 'last_doc') else None
-                    f.close()
-                if self.save_path:
-                    self.window.title(f'Text Editor - {self.save_path}')
-            except FileNotFoundError:
-                pass
+        # Add line numbers sidebar
+        self.line_numbers = Text(self.body, width=4, border=0, state='disabled', font=('', self.settings.getint('font_size')))
+        self.activate(self.new_tab())
 
         # Sidebar Stuff
         self.sidebar = Frame(self.window)
@@ -54,122 +144,893 @@ class TextEditor:
         find_btn = Button(self.sidebar, text='Find', command=self.find_text)
         find_btn.pack(padx=pad, pady=pad, fill='x')
 
+        compare_btn = Button(self.sidebar, text='Compare', command=self.compare_file)
+        compare_btn.pack(padx=pad, pady=pad, fill='x')
+
         exit_btn = Button(self.sidebar, text='Exit', command=self.exit, style='danger-outline')
         exit_btn.pack(padx=pad, pady=pad, fill='x', side='bottom')
 
         settings_btn = Button(self.sidebar, text='Settings', command=self.open_settings)
         settings_btn.pack(padx=pad, pady=pad, fill='x', side='bottom')
 
+        self.save_status = Label(self.sidebar, text='', wraplength=120, bootstyle='secondary')
+        self.save_status.pack(padx=pad, pady=pad, fill='x', side='bottom')
+
+        # Live trace summary (only with --trace)
+        if tracer:
+            tracer.document_size = lambda: len(self.document) if self.tab and self.tab.document is not None else 0
+            self.trace_status = Label(self.sidebar, text='', wraplength=120, bootstyle='secondary')
+            self.trace_status.pack(padx=pad, pady=pad, fill='x', side='bottom')
+            self.window.after(1000, self.update_trace_status)
+
         # Pack line Numbers
-        if self.config.getboolean('Editor', 'line_numbers'):
+        if self.settings.getboolean('line_numbers'):
             self.line_numbers.pack(side='left', fill='y', padx=pad, pady=pad)
 
-        # Tooltips
-        ToolTip(save_btn, text='Save File (CTRL+S)', bootstyle='info', delay=500, position='bottom right')
-        ToolTip(open_btn, text='Open File (CTRL+O)', bootstyle='info', delay=500, position='bottom right')
-        ToolTip(find_btn, text='Search in File (CTRL+F)', bootstyle='info', delay=500, position='bottom right')
-        ToolTip(settings_btn, text='Open Settings (CTRL+,)', bootstyle='info', delay=500, position='top right')
-        ToolTip(exit_btn, text='Exit Application', bootstyle='danger', delay=500, position='top right')
+        # Tooltips (added once the window is up)
+        def add_tooltips():
+            from ttkbootstrap.tooltip import ToolTip
+            ToolTip(save_btn, text='Save File (CTRL+S)', bootstyle='info', delay=500, position='bottom right')
+            ToolTip(open_btn, text='Open File (CTRL+O)', bootstyle='info', delay=500, position='bottom right')
+            ToolTip(find_btn, text='Search in File (CTRL+F)', bootstyle='info', delay=500, position='bottom right')
+            ToolTip(compare_btn, text='Compare with a File (CTRL+D), or with the Saved File (CTRL+SHIFT+D)', bootstyle='info', delay=500, position='bottom right')
+            ToolTip(settings_btn, text='Open Settings (CTRL+,)', bootstyle='info', delay=500, position='top right')
+            ToolTip(exit_btn, text='Exit Application', bootstyle='danger', delay=500, position='top right')
 
         # Bindings
         self.window.bind('<Control-s>', lambda _: self.save_file())
-        self.window.bind('<Control-o>', lambda _: self.open_file())
+        self.bind_shortcut('<Control-o>', self.open_file)
+        self.bind_shortcut('<Control-t>', self.open_tab)
+        self.window.bind('<Control-w>', lambda _: self.close_tab())
         self.window.bind('<Control-q>', lambda _: self.exit())
         self.window.bind('<Control-comma>', lambda _: self.open_settings())
 
-        self.window.bind('<Control-z>', lambda _: self.text_area.edit_undo())
-        self.window.bind('<Control-y>', lambda _: self.text_area.edit_redo())
-        self.window.bind('<Control-Shift-z>', lambda _: self.text_area.edit_redo())
+        self.window.bind('<Control-z>', lambda _: self.undo())
+        self.window.bind('<Control-y>', lambda _: self.redo())
+        self.window.bind('<Control-Shift-z>', lambda _: self.redo())
 
         self.window.bind('<Control-f>', lambda _: self.find_text())
+        self.window.bind('<Control-Shift-F>', lambda _: self.find_in_files())
+        self.bind_shortcut('<Control-d>', self.compare_file)
+        self.bind_shortcut('<Control-Shift-D>', self.compare)
 
-        self.text_area.bind('<KeyRelease>', lambda _: self.update_line_numbers())
 
         self.window.protocol("WM_DELETE_WINDOW", self.exit)
 
         self.update_line_numbers()
+        self.mark('widgets')
+
+        # Let the window draw before reading the document or importing anything else
+        self.window.after_idle(self.restore_document, file_path)
+        self.window.after(500, add_tooltips)
+        self.window.after(self.AUTOSAVE_MS, self.autosave)
+        self.window.after(self.WATCH_MS, self.check_files)
         self.window.mainloop()
+        self.watcher.close()
+        for tab in self.tabs:
+            self.save_history(tab)
+            if tab.journal: # Keep it only if the last save failed
+                tab.journal.close(discard=self.save_job is None or self.save_job.error is None)
+        self.settings.flush()
+
+    def mark(self, phase):
+        if self.profile:
+            self.profile.mark(phase)
+
+    def span(self, name, **args):
+        """Trace an I/O step, when tracing is on"""
+        return self.tracer.span(name, **args) if self.tracer else nullcontext({}) # Yields the args either way
+
+    def bind_shortcut(self, sequence, command):
+        """Bind a key for the whole window, and on every text area too, where the Text class may bind it first (Ctrl+O opens a line, Ctrl+T transposes, Ctrl+D deletes)"""
+        def handler(_):
+            command()
+            return 'break'
+
+        self.shortcuts[sequence] = handler
+        self.window.bind(sequence, handler)
+        for tab in self.tabs:
+            tab.text_area.bind(sequence, handler)
+
+    def update_trace_status(self):
+        self.trace_status.config(text=self.tracer.summary())
+        self.window.after(1000, self.update_trace_status)
+
+    # Tabs
+    def new_tab(self):
+        """Add an empty tab to the end of the tab bar, without selecting it"""
+        page = Frame(self.tab_bar, height=0)
+        text_area = Text(self.body, font=('', self.settings.getint('font_size')), undo=False) # The tab's UndoHistory replaces Tk's
+        tab = Tab(page, text_area)
+        tab.history.budget = self.settings.getint('undo_mb') << 20
+        self.wrap_text_area(tab)
+        text_area.configure(yscrollcommand=lambda first, last: self.on_text_scroll(first, last) if tab is self.tab else None)
+
+        for tag, color in TAG_COLORS.items():
+            text_area.tag_configure(tag, foreground=color)
+        text_area.tag_configure("search_match", background="yellow", foreground="black")
+        text_area.tag_configure("current_match", background="orange", foreground="black")
+
+        text_area.bind('<KeyRelease>', lambda _: self.update_line_numbers())
+        for sequence, handler in self.shortcuts.items():
+            text_area.bind(sequence, handler)
+        text_area.bind('<Configure>', lambda _: self.update_line_numbers())
+
+        self.tab_bar.add(page, text='Untitled')
+        self.tabs.append(tab)
+        return tab
+
+    def open_tab(self):
+        """Select a new untitled tab"""
+        self.select_tab(self.new_tab())
+        self.mark_saved()
+        self.start_journal()
+
+    def select_tab(self, tab):
+        self.activate(tab)
+        self.tab_bar.select(tab.page)
+
+    def on_tab_changed(self):
+        selected = self.tab_bar.select()
+        for tab in self.tabs:
+            if str(tab.page) == selected:
+                self.activate(tab)
+
+    def on_tab_middle_click(self, event):
+        try:
+            index = self.tab_bar.index(f'@{event.x},{event.y}')
+        except TclError:
+            return
+        self.close_tab(self.tabs[index])
 
-    def save_file(self):
+    def activate(self, tab):
+        """Show tab's text area in place of the active one"""
+        if tab is self.tab:
+            return
+
+        if self.tab:
+            self.cancel_search()
+            self.clear_highlights()
+            self.search_matches = []
+            self.current_match_index = -1
+            self.text_area.pack_forget()
+        self.large_scroll.pack_forget()
+
+        self.tab = tab
+        if tab in self.recent:
+            self.recent.remove(tab)
+        self.recent.append(tab)
+        tab.text_area.pack(side='right', fill='both', expand=True, padx=self.pad, pady=self.pad)
+        if tab.evicted:
+            self.rehydrate(tab)
+        if tab.large_file:
+            self.large_scroll.pack(side='right', fill='y', before=tab.text_area)
+        tab.text_area.focus_set()
+        if tab.disk_changed:
+            self.file_changed(tab)
+
+        self.gutter_view = None
+        self.update_line_numbers()
+        self.schedule_highlight()
+        self.update_title()
+        self.evict_inactive()
+
+    def close_tab(self, tab=None):
+        tab = tab or self.tab
+        if self.is_modified(tab=tab):
+            from tkinter.messagebox import askyesnocancel
+
+            self.select_tab(tab)
+            answer = askyesnocancel('Close Tab', f'Save changes to {self.tab_name(tab)}?', parent=self.window)
+            if answer is None:
+                return
+            if answer:
+                self.save_file(wait=True)
+                if self.is_modified(): # Save As was cancelled or the save failed
+                    return
+
+        self.save_history(tab)
+        if tab.journal:
+            tab.journal.close(discard=True)
+        if tab.large_file:
+            tab.large_file.close()
+        self.tabs.remove(tab)
+        self.recent.remove(tab)
+
+        active = tab is self.tab
+        if active:
+            self.cancel_search()
+            self.search_matches = []
+            self.current_match_index = -1
+            self.large_scroll.pack_forget()
+            self.tab = None
+        self.tab_bar.forget(tab.page)
+        tab.page.destroy()
+        tab.text_area.destroy()
+        tab.text_area.tk.deletecommand(tab.text_area._w) # The edit proxy
+
+        if active:
+            if self.recent:
+                self.select_tab(self.recent[-1])
+            else:
+                self.open_tab()
+
+    def tab_name(self, tab):
+        return os.path.basename(tab.save_path) if tab.save_path else 'Untitled'
+
+    def evict_inactive(self):
+        """Release the least recently used tabs past the resident limit"""
+        resident = [tab for tab in self.recent if not tab.evicted]
+        for tab in resident[:-max(self.settings.getint('resident_tabs'), 1)]:
+            self.evict(tab)
+
+    def evict(self, tab):
+        """Empty an inactive tab; its file and journal are enough to rebuild it"""
+        saving = self.save_job and not self.save_job.done and self.save_job.path == tab.save_path
+        tab.modified = self.is_modified(tab=tab)
+        if saving or tab.modified and tab.journal is None: # Nothing else holds the unsaved changes
+            return
+
+        text_area = tab.text_area
+        insert_line, col = map(int, text_area.index('insert').split('.'))
+        top_line = int(text_area.index('@0,0').split('.')[0])
+        tab.view = (tab.window_start + insert_line - 1, col, tab.window_start + top_line - 1)
+        if tab.history:
+            tab.history_digest = tab.document.digest() if tab.document.version != tab.saved_version else tab.saved_digest
+
+        if tab.modified:
+            tab.journal.compact(tab.document.snapshot()) # So it replays onto a snapshot, whatever happens to the file
+        elif tab.journal:
+            tab.journal.close(discard=True)
+            tab.journal = None
+        if tab.large_file:
+            tab.large_file.close()
+            tab.large_file = None
+            tab.window_start = 1
+
+        text_area.configure(state='normal')
+        text_area.delete(1.0, 'end') # Inactive tabs aren't mirrored, so this leaves the document alone
+        tab.document = None
+        tab.highlighter = None
+        tab.evicted = True
+
+    def rehydrate(self, tab):
+        """Rebuild the active tab's document after it was evicted"""
+        tab.evicted = False
+        tab.document = Document()
+        file_path = tab.save_path
+        journal = tab.journal
+        history = tab.history
+        tab.history = UndoHistory(history.budget) # Loading clears it; kept below if the text comes back the same
+
+        def load_base():
+            if not file_path:
+                return ''
+            return read_file(file_path)[0]
+
+        recovered = None
+        if journal:
+            with self.span('rehydrate tab', path=journal.path):
+                journal.wait()
+                recovered = recover(journal.path, tab.saved_digest, load_base)
+
+        if recovered is not None:
+            self.load_text(recovered.get_text())
+            self.saved_version = -1 # Still differs from the file on disk
+            tab.file_format.forget_exceptions()
+        elif file_path:
+            try:
+                self.load_file(file_path)
+            except OSError as e:
+                self.load_text('')
+                self.mark_saved()
+                self.save_status.config(text=f'Could not reopen {self.tab_name(tab)}: {e}')
+        else:
+            self.load_text('')
+            self.mark_saved()
+            self.start_journal(offer_recovery=False)
+
+        if history and not tab.large_file:
+            digest = self.saved_digest if self.document.version == self.saved_version else self.document.digest()
+            if digest == tab.history_digest:
+                tab.history = history
+        tab.history_digest = None
+
+        if tab.view and not tab.large_file:
+            insert_line, col, top_line = tab.view
+            self.goto_line(top_line)
+            self.text_area.mark_set('insert', f'{insert_line}.{col}')
+        tab.view = None
+
+    def restore_document(self, file_path=None):
+        """Open file_path, or the remembered last document"""
+        if file_path is None and self.settings.getboolean('remember'):
+            file_path = self.settings.get('last_doc') or None
+        if file_path:
+            try:
+                self.load_file(file_path)
+            except FileNotFoundError:
+                file_path = None
+        if not file_path:
+            self.mark_saved()
+            self.start_journal()
+        self.mark('restore document')
+
+        if self.profile:
+            def first_idle():
+                self.mark('first idle')
+                self.profile.report()
+
+            self.window.after_idle(first_idle)
+
+    def save_file(self, wait=False):
         def save_file_as():
+            from tkinter.filedialog import asksaveasfilename
 
             file_path = asksaveasfilename(defaultextension='.txt', filetypes=[('Text Files', '*.txt'), ('All Files', '*.*'), ('Python Files', '*.py')])
 
             if not file_path:
                 return
 
-            with open(file_path, 'w') as file:
-                content = self.text_area.get(1.0, 'end')
-                file.write(content)
-                self.window.title(f'Text Editor - {file_path}')
-                self.save_path = file_path
+            self.save_path = file_path
+            self.reset_highlighter()
+            self.write_file(file_path, wait)
+
+        if self.large_file: # Large files are opened read-only
+            return
 
         if self.save_path is None:
             save_file_as()
             return
 
-        with open(self.save_path, 'w') as file:
-            content = self.text_area.get(1.0, 'end')
-            file.write(content)
+        self.write_file(self.save_path, wait)
+
+    def write_file(self, file_path, wait=False):
+        """Save a snapshot of the document atomically on a worker thread"""
+        if self.save_job and not self.save_job.done:
+            self.save_job.join()
+
+        tab = self.tab
+        with self.span('start save', path=file_path, chars=len(self.document)):
+            mark = self.journal.mark() if self.journal else None # Journal position matching the snapshot
+            job = self.save_job = SaveJob(file_path, self.document.snapshot(), self.file_format, fsync=self.settings.getboolean('fsync'))
+        self.save_status.config(text='Saving...')
+
+        def poll():
+            if job.done:
+                self.finish_save(job, mark, tab)
+            else:
+                self.window.after(50, poll)
+
+        if wait:
+            job.join()
+            self.finish_save(job, mark, tab)
+        else:
+            poll()
+
+    def finish_save(self, job, mark=None, tab=None):
+        tab = tab or self.tab
+        if job.error:
+            self.save_status.config(text=f'Save failed: {job.error}')
+            return
+        if self.tracer:
+            self.tracer.complete('save', job.started, job.seconds, thread='save worker', path=job.path, bytes=job.size)
+
+        if job.path == tab.save_path and tab in self.tabs and not tab.evicted:
+            tab.saved_version = job.document.version
+            tab.saved_digest = job.digest
+            tab.disk_hash = job.hasher
+            try:
+                tab.disk = DiskState(job.path)
+            except OSError:
+                tab.disk = None
+            self.update_title(tab)
+            if tab.journal and tab.journal.path != journal_path(job.path):
+                self.start_journal(offer_recovery=False, tab=tab) # Saved under a new name
+            elif tab.journal and mark:
+                tab.journal.rebase(job.digest, mark)
+        self.save_status.config(text=f'Saved {format_size(job.size)} in {job.seconds:.2f}s ({format_size(job.rate)}/s)')
+
+    def ask_open_path(self):
+        from tkinter.filedialog import askopenfilename
+        return askopenfilename(filetypes=[('Text Files', '*.txt'), ('All Files', '*.*'), ('Python Files', '*.py')])
 
     def open_file(self):
-        file_path = askopenfilename(filetypes=[('Text Files', '*.txt'), ('All Files', '*.*'), ('Python Files', '*.py')])
+        file_path = self.ask_open_path()
 
         if not file_path:
             return
 
-        with open(file_path, 'r') as file:
-            content = file.read()
-            self.text_area.delete(1.0, 'end')
-            self.text_area.insert(1.0, content)
-            self.window.title(f'Text Editor - {file_path}')
-            self.save_path = file_path
+        self.open_path(file_path)
 
-    def exit(self):
-        config = self.config
-        # Check if current content matches saved content
-        current_content = self.text_area.get(1.0, 'end-1c')
-        if self.save_path:
+    def open_path(self, file_path):
+        """Show file_path in its tab, opening a new tab unless the active one is empty and untitled"""
+        for tab in self.tabs:
+            if tab.save_path and os.path.abspath(tab.save_path) == os.path.abspath(file_path):
+                self.select_tab(tab)
+                return
+        if self.save_path or self.large_file or len(self.document):
+            self.select_tab(self.new_tab())
+        self.load_file(file_path)
+
+    def load_file(self, file_path):
+        self.close_large_file()
+        disk = DiskState(file_path) # Taken first, so only the bytes it covers are read
+        with self.span('load_file', path=file_path, bytes=disk.size) as args:
+            file_format = detect_file(file_path)
+            if disk.size >= self.settings.getint('large_file_mb') * 1024 * 1024 and file_format.ascii_compatible:
+                self.open_large_file(file_path, file_format)
+            else:
+                text, file_format = read_file(file_path, size=disk.size)
+                self.load_text(text)
+            args['format'] = file_format.label
+        self.tab.disk = disk
+        self.file_format = file_format
+        self.save_status.config(text=file_format.label + (' (not a text file; saved back unchanged)' if file_format.binary else ''))
+        self.save_path = file_path
+        self.reset_highlighter()
+        self.mark_saved()
+        self.load_history(self.saved_digest)
+        self.start_journal()
+
+    def start_journal(self, offer_recovery=True, tab=None):
+        """Start journaling edits to a tab's document, first offering to replay one left by a crash"""
+        tab = tab or self.tab
+        if tab.journal:
+            tab.journal.close(discard=True)
+            tab.journal = None
+        if tab.large_file:
+            return
+
+        path = journal_path(tab.save_path, self.untitled_number(tab))
+        recovered = None
+        if offer_recovery:
+            with self.span('recover journal', path=path):
+                recovered = recover(path, tab.saved_digest, tab.document.get_text)
+        if recovered is not None:
+            from tkinter.messagebox import askyesno
+
+            name = os.path.basename(self.save_path) if self.save_path else 'An untitled document'
+            when = time.strftime('%Y-%m-%d %H:%M', time.localtime(os.path.getmtime(path)))
+            if askyesno('Recover Changes', f'{name} has unsaved changes from a session that ended unexpectedly ({when}).\n\nRecover them?', parent=self.window):
+                self.load_text(recovered.get_text())
+                self.saved_version = -1 # Still differs from the file on disk
+                self.file_format.forget_exceptions()
+                self.load_history(recovered.digest())
+                self.update_title()
+
+        modified = self.is_modified(tab=tab)
+        try:
+            tab.journal = Journal(path, None if modified else tab.saved_digest, fsync=self.settings.getboolean('fsync'))
+        except OSError as e:
+            self.save_status.config(text=f'Crash recovery is off: {e}')
+            return
+        if modified:
+            tab.journal.compact(tab.document.snapshot())
+
+    def untitled_number(self, tab):
+        """Lowest untitled journal number no other tab is using"""
+        taken = {other.journal.path for other in self.tabs if other is not tab and other.journal}
+        number = 1
+        while journal_path(None, number) in taken:
+            number += 1
+        return number
+
+    def autosave(self):
+        """Snapshot documents beside their journals once enough edits have piled up"""
+        for tab in self.tabs:
+            if tab.journal and not tab.evicted and tab.journal.due:
+                tab.journal.compact(tab.document.snapshot())
+        self.window.after(self.AUTOSAVE_MS, self.autosave)
+
+    def mark_saved(self, hasher=None):
+        """Remember the document state that matches the file on disk (hasher: its hash, if already known)"""
+        self.tab.disk_hash = hasher or self.document.hasher()
+        self.saved_version = self.document.version
+        self.saved_digest = self.tab.disk_hash.hexdigest()
+        self.update_title()
+
+    def load_history(self, digest):
+        """Pick up the undo history a previous session left for the active document, if it was left for this text"""
+        if self.save_path and not self.large_file and self.settings.getboolean('persist_undo'):
+            with self.span('load undo', path=self.save_path) as args:
+                args['loaded'] = self.history.load(undo_path(self.save_path), digest)
+
+    def save_history(self, tab):
+        """Keep a tab's undo history beside its file for the next session, when that's turned on"""
+        if not tab.save_path or tab.large_file or not tab.history or not self.settings.getboolean('persist_undo'):
+            return
+        digest = tab.history_digest if tab.evicted else tab.document.digest()
+        try:
+            with self.span('save undo', path=tab.save_path):
+                tab.history.save(undo_path(tab.save_path), digest)
+        except OSError:
+            pass # Only a convenience; the document itself is safe
+
+    def undo(self):
+        if not self.large_file:
+            self.apply_step(self.history.undo(), undo=True)
+
+    def redo(self):
+        if not self.large_file:
+            self.apply_step(self.history.redo(), undo=False)
+
+    def apply_step(self, step, undo):
+        """Replay an undo history step through the text area (backwards, for undo) and put the cursor after it"""
+        if step is None:
+            return
+        self.history.paused = True
+        try:
+            for edit in (reversed(step) if undo else step):
+                if isinstance(edit, SpanEdit):
+                    spans, texts = edit.backward() if undo else edit.forward()
+                    self.replace_spans(spans, texts)
+                    cursor = spans[0][0]
+                    continue
+                offset, removed, inserted = edit
+                old, new = (inserted, removed) if undo else (removed, inserted)
+                first = self.document.tk_index(offset)
+                if old:
+                    self.text_area.delete(first, self.document.tk_index(offset + len(old)))
+                if new:
+                    self.text_area.insert(first, new)
+                cursor = offset + len(new)
+        finally:
+            self.history.paused = False
+        self.text_area.mark_set('insert', self.document.tk_index(cursor))
+        self.text_area.see('insert')
+        self.update_line_numbers()
+
+    def replace_spans(self, spans, texts, content=None):
+        """Replace many (start, end) spans of the document in one go, as one undo step.
+
+        texts is one string for every span or a list with one per span;
+        content is the document text, if the caller already has it.
+        """
+        if not spans:
+            return
+        if content is None:
+            content = self.document.get_text()
+        lines = LineIndex(content)
+        per_span = [texts] * len(spans) if isinstance(texts, str) else texts
+
+        # Edit only the spans, last first so earlier indices stay valid, then the document in one pass
+        self.mirroring = False
+        try:
+            for (start, end), new_text in zip(reversed(spans), reversed(per_span)):
+                self.text_area.replace(lines.tk_index(start), lines.tk_index(end), new_text)
+        finally:
+            self.mirroring = True
+        self.document.replace_spans(spans, texts)
+        if self.journal:
+            self.journal.replace_spans(spans, texts)
+        self.history.record_spans(spans, [content[start:end] for start, end in spans], texts)
+        self.reset_highlighter()
+        self.update_title()
+
+    def check_files(self):
+        """Pick up changes other programs made to open files"""
+        watcher = self.watcher
+        open_paths = {os.path.abspath(tab.save_path) for tab in self.tabs if tab.save_path}
+        for path in watcher.paths - open_paths:
+            watcher.unwatch(path)
+        changed = open_paths - watcher.paths # Not watched yet: compare with what was read
+        for path in changed:
+            watcher.watch(path)
+        changed.update(watcher.changes())
+
+        for tab in self.tabs:
+            if tab.save_path and os.path.abspath(tab.save_path) in changed:
+                if tab is self.tab:
+                    self.file_changed(tab)
+                else:
+                    tab.disk_changed = True # Dealt with when it's selected
+        self.window.after(self.WATCH_MS, self.check_files)
+
+    def file_changed(self, tab):
+        """Bring the active tab up to date with its file after another program wrote to it"""
+        tab.disk_changed = False
+        if tab.reloading:
+            return # Checked again when it finishes
+        path = tab.save_path
+        current = signature(path)
+        if current is None or tab.disk is None or current == tab.disk.signature:
+            return # Deleted, or nothing new
+        job = self.save_job
+        if job and job.path == path and (not job.done or job.stat and stat_signature(job.stat) == current):
+            return # Our own save
+
+        if tab.large_file:
+            self.refresh_large_file(tab)
+            return
+        modified = self.is_modified(verify=True)
+        if modified:
+            from tkinter.messagebox import askyesno
+
+            if not askyesno('File Changed', f'{self.tab_name(tab)} was changed by another program.\n\nReload it and lose your unsaved changes?', parent=self.window):
+                tab.disk.signature = current # Don't ask again until it changes again
+                self.saved_version = -1 # No longer matches the file on disk
+                self.saved_digest = None
+                self.update_title()
+                return
+        self.reload_file(tab, append=not modified)
+
+    def reload_file(self, tab, append=True):
+        """Make the active tab's document match its file again by editing only the lines that differ.
+
+        Edits go through the text area like typing would, so the cursor,
+        scroll position and undo history survive. When append is set and the
+        file has only grown, just the new bytes are read, like tail -f.
+        Otherwise the file is read and diffed against a snapshot on a worker
+        thread, and the edits are made once it's done.
+        """
+        path = tab.save_path
+        try:
+            appended = tab.disk.read_appended(path, self.file_format) if append and tab.disk_hash else None
+        except OSError as e:
+            self.save_status.config(text=f'Could not reload {self.tab_name(tab)}: {e}')
+            return
+        if appended is not None:
+            follow = self.text_area.yview()[1] >= 1.0
+            with self.span('reload', path=path, appended=len(appended)), self.history.group():
+                self.text_area.insert('end-1c', appended)
+            hasher = tab.disk_hash
+            hasher.update(appended.encode('utf-8', 'surrogatepass'))
+            self.finish_reload(hasher, follow)
+            return
+
+        if tab.reloading:
+            return
+        tab.reloading = True
+        snapshot = self.document.snapshot()
+        result = {}
+
+        def work():
+            started = time.perf_counter()
             try:
-                with open(self.save_path, 'r') as file:
-                    saved_content = file.read()
-                if current_content == saved_content:
-                    self.window.destroy()
-                    return
-            except:
-                pass # If we can't read the file, continue with exit process
+                disk = DiskState(path)
+                text, file_format = read_file(path, size=disk.size)
+                result['reload'] = disk, file_format, line_edits(snapshot.get_text(), text)
+            except OSError as e:
+                result['error'] = e
+            if self.tracer:
+                self.tracer.complete('read and diff', started, time.perf_counter() - started, thread='reload worker', path=path)
+
+        def poll():
+            if worker.is_alive():
+                self.window.after(50, poll)
+                return
+            tab.reloading = False
+            if tab not in self.tabs:
+                return
+            if 'error' in result:
+                self.save_status.config(text=f'Could not reload {self.tab_name(tab)}: {result["error"]}')
+                return
+            if tab is not self.tab or tab.evicted or tab.document.version != snapshot.version:
+                # Switched away or edited meanwhile: start over (asking first, if there are changes now)
+                if tab is self.tab:
+                    self.file_changed(tab)
+                else:
+                    tab.disk_changed = True
+                return
+
+            disk, file_format, edits = result['reload']
+            follow = self.text_area.yview()[1] >= 1.0
+            with self.span('reload', path=path, hunks=len(edits)), self.history.group():
+                for start, end, new_text in edits:
+                    first = self.document.tk_index(start)
+                    if end > start:
+                        self.text_area.delete(first, self.document.tk_index(end))
+                    if new_text:
+                        self.text_area.insert(first, new_text)
+            tab.disk = disk
+            if (file_format.encoding, file_format.bom, file_format.newline) != (self.file_format.encoding, self.file_format.bom, self.file_format.newline):
+                file_format.forget_exceptions() # They're offsets into text the document wasn't built from
+                self.file_format = file_format
+            self.finish_reload(None, follow)
+            if signature(path) != disk.signature: # Changed again while it was being read
+                self.file_changed(tab)
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        poll()
+
+    def finish_reload(self, hasher, follow):
+        """The active document matches its file again (hasher: the file text's hash, if already known)"""
+        self.mark_saved(hasher)
+        if self.journal:
+            self.journal.rebase(self.saved_digest, self.journal.mark())
+        if follow:
+            self.text_area.see('end')
+
+    def is_modified(self, verify=False, tab=None):
+        """O(1) unsaved-changes check; verify re-hashes the text to catch edits that were undone"""
+        tab = tab or self.tab
+        if tab.evicted:
+            return tab.modified
+        if tab.large_file or tab.document.version == tab.saved_version:
+            return False
+        if verify:
+            return tab.document.digest() != tab.saved_digest
+        return True
+
+    def update_title(self, tab=None):
+        tab = tab or self.tab
+        modified = self.is_modified(tab=tab)
+        label = self.tab_name(tab) + (' *' if modified else '')
+        if label != self.tab_bar.tab(tab.page, 'text'):
+            self.tab_bar.tab(tab.page, text=label)
+        if tab is not self.tab:
+            return
+
+        title = 'Text Editor'
+        if self.save_path:
+            title += f' - {self.save_path}'
+        if self.large_file:
+            title += ' (read-only)'
+        if modified:
+            title += ' *'
+        if title != self.window.title():
+            self.window.title(title)
+
+    def open_large_file(self, file_path, file_format):
+        self.large_file = LargeFile(file_path, file_format.encoding, len(file_format.bom))
+        self.load_text('')
+        self.text_area.configure(state='disabled')
+        self.large_scroll.pack(side='right', fill='y', before=self.text_area)
+
+        # Show the first screen as soon as it is indexed, then keep the scrollbar in step with the index
+        def poll(shown=False):
+            large_file = self.large_file
+            if large_file is None or large_file.path != file_path:
+                return
+            if not shown and (large_file.line_count > self.LARGE_WINDOW or large_file.complete):
+                self.show_large_window(1)
+                shown = True
+            else:
+                self.on_text_scroll(*self.text_area.yview())
+            if not large_file.complete or not shown:
+                self.window.after(50, poll, shown)
+
+        poll()
+
+    def refresh_large_file(self, tab):
+        """Extend a large file's view over appended lines, following them if its end was in view"""
+        large_file = self.large_file
+        follow = self.window_start + self.LARGE_WINDOW > large_file.line_count and self.text_area.yview()[1] >= 1.0
+        if not large_file.refresh():
+            self.load_file(tab.save_path) # Replaced or truncated: start over
+            return
+        try:
+            tab.disk = DiskState(tab.save_path)
+        except OSError:
+            pass
+
+        def poll():
+            if self.large_file is not large_file:
+                return
+            if not large_file.complete:
+                self.window.after(50, poll)
+            elif follow:
+                self.show_large_window(large_file.line_count)
+                self.text_area.yview_moveto(1.0)
+            else:
+                self.on_text_scroll(*self.text_area.yview())
+
+        poll()
+
+    def close_large_file(self):
+        if self.large_file is None:
+            return
+        self.large_file.close()
+        self.large_file = None
+        self.window_start = 1
+        self.large_scroll.pack_forget()
+        self.text_area.configure(state='normal')
+
+    def show_large_window(self, top_line):
+        """Materialize the lines around top_line and scroll so top_line is at the top"""
+        large_file = self.large_file
+        start = max(1, min(top_line - self.LARGE_WINDOW // 2, large_file.line_count - self.LARGE_WINDOW + 1))
+        self.window_start = start
+        self.text_area.configure(state='normal')
+        self.load_text(large_file.lines(start, self.LARGE_WINDOW))
+        self.text_area.configure(state='disabled')
+        self.text_area.yview(f'{top_line - start + 1}.0')
+        self.update_line_numbers()
+
+    def scroll_large_file(self, action, amount, unit=None):
+        large_file = self.large_file
+        if large_file is None:
+            return
+
+        first, last = self.visible_lines()
+        top = self.window_start + first - 1
+        if action == 'moveto':
+            line = int(float(amount) * large_file.estimated_lines) + 1
+        elif unit == 'pages':
+            line = top + int(amount) * (last - first)
+        else:
+            line = top + int(amount)
+        self.goto_line(max(1, min(line, large_file.line_count)))
+
+    def goto_line(self, line):
+        """Scroll to a 1-based line, paging it in first when a large file is open"""
+        if self.large_file and not self.window_start + self.LARGE_MARGIN <= line < self.window_start + self.LARGE_WINDOW - self.LARGE_MARGIN:
+            self.show_large_window(line)
+        else:
+            self.text_area.yview(f'{line - self.window_start + 1}.0')
+        self.text_area.mark_set('insert', f'{line - self.window_start + 1}.0')
+
+    def on_text_scroll(self, first, last):
+        large_file = self.large_file
+        if self.search_job:
+            self.highlight_visible_matches()
+        self.schedule_highlight()
+        if large_file is None:
+            self.large_scroll.set(first, last)
+            self.update_line_numbers()
+            return
+
+        # Page in more lines when the view gets close to either edge of the window
+        local_top = self.visible_lines()[0]
+        top = self.window_start + local_top - 1
+        near_start = local_top <= self.LARGE_MARGIN and self.window_start > 1
+        near_end = local_top >= self.LARGE_WINDOW - self.LARGE_MARGIN and self.window_start + self.LARGE_WINDOW <= large_file.line_count
+        if near_start or near_end:
+            self.show_large_window(top)
+            return
+
+        visible = (float(last) - float(first)) * self.LARGE_WINDOW
+        total = max(large_file.estimated_lines, 1)
+        self.large_scroll.set((top - 1) / total, (top - 1 + visible) / total)
+        self.update_line_numbers()
+
+    def exit(self):
+        settings = self.settings
+        # Check if there are unsaved changes
+        modified = [tab for tab in self.tabs if self.is_modified(verify=settings.getboolean('verify_exit'), tab=tab)]
+        if not modified:
+            self.window.destroy()
+            return
 
-        if not current_content.strip(): # If the text area is empty (only whitespace), exit without confirmation
+        if not any(tab.evicted or any(chunk.strip() for chunk in tab.document.chunks()) for tab in modified): # If the text areas are empty (only whitespace), exit without confirmation
             self.window.destroy()
             return
 
         # Initialize Popup
+        def save_all():
+            """Save every modified tab, stopping at the first that isn't saved (the save failed or Save As was cancelled)"""
+            for tab in modified:
+                self.select_tab(tab)
+                self.save_file(wait=True)
+                if self.is_modified() or self.save_job and self.save_job.error:
+                    return False
+            return True
+
         def save():
-            self.save_file()
+            if not save_all(): # Keep the editor open so the changes aren't lost
+                return
             exit_popup.destroy()
             self.window.destroy()
 
         def remember_last_doc():
             if self.remember_var == None:
-                self.remember_var = BooleanVar(value=config.getboolean('Editor', 'remember'))
-            with open('settings.conf', 'w') as f:
-                if self.remember_var.get():
-                    config.set('Editor', 'last_doc', self.save_path)
-                else:
-                    config.set('Editor', 'last_doc', None)
-                config.set('Editor', 'remember', str(self.remember_var.get()))
-                config.write(f)
+                self.remember_var = BooleanVar(value=settings.getboolean('remember'))
+            settings.set('last_doc', self.save_path if self.remember_var.get() else None)
+            settings.set('remember', self.remember_var.get())
 
         exit_popup = Toplevel(title='Exit')
         exit_popup.title('Exit')
 
-        self.remember_var = BooleanVar(value=config.getboolean('Editor', 'remember'))
+        self.remember_var = BooleanVar(value=settings.getboolean('remember'))
         # Add Widgets
         Checkbutton(exit_popup, text='Remember Last Document', variable=self.remember_var, command=remember_last_doc).pack(padx=self.pad, pady=self.pad, fill='x', side='bottom')
         Label(exit_popup, text='Are you sure you want to exit?').pack(side='top', expand=True, fill='x', padx=self.pad, pady=self.pad)
-        Button(exit_popup, text='Save 1st', command=lambda:[self.save_file(), self.window.destroy()]).pack(side='left', expand=True, fill='x', padx=self.pad, pady=self.pad)
+        Button(exit_popup, text='Save 1st', command=save).pack(side='left', expand=True, fill='x', padx=self.pad, pady=self.pad)
         Button(exit_popup, text='Yes', command=self.window.destroy).pack(side='left', expand=True, fill='x', padx=self.pad, pady=self.pad)
         Button(exit_popup, text='Cancel', command=exit_popup.destroy).pack(side='left', expand=True, fill='x', padx=self.pad, pady=self.pad)
+        Button(exit_popup, text='Show Changes', command=lambda: [self.compare(tab=tab) for tab in modified], style='info-outline').pack(side='left', expand=True, fill='x', padx=self.pad, pady=self.pad)
 
 
         # Finish Up
@@ -178,14 +1039,12 @@ class TextEditor:
 
     def open_settings(self):
 
-        config = self.config
+        settings = self.settings
         settings_popup = Toplevel(title='Settings')
 
         # Theme Stuff
         def change_theme():
-            config.set('Editor', 'theme', theme_var.get())
-            with open('settings.conf', 'w') as f:
-                config.write(f)
+            settings.set('theme', theme_var.get())
 
             self.window.style.theme_use(theme_var.get())
 
@@ -202,17 +1061,16 @@ class TextEditor:
         # Show Line Stuff
         def change_line_numbers():
             show_lns = show_line_var.get()
-            config.set('Editor', 'line_numbers', str(show_lns))
+            settings.set('line_numbers', show_lns)
+            self.gutter_view = None
             self.update_line_numbers()
-            with open('settings.conf', 'w') as f:
-                config.write(f)
             if show_lns:
                 self.line_numbers.pack(side='left', fill='y', padx=self.pad, pady=self.pad)
             else:
                 self.line_numbers.pack_forget()
 
         show_line_frame = LabelFrame(settings_popup, text='Show Line Numbers')
-        show_line_var = BooleanVar(value=config.getboolean('Editor', 'line_numbers'))
+        show_line_var = BooleanVar(value=settings.getboolean('line_numbers'))
         show_line_check = Checkbutton(show_line_frame, text='Show Line Numbers', variable=show_line_var, bootstyle='square-toggle')
 
         show_line_check.pack(padx=self.pad, pady=self.pad, fill='x')
@@ -221,19 +1079,16 @@ class TextEditor:
         # Font Size
         def update_font_size():
             font_size = font_var.get()
-            config.set('Editor', 'font_size', str(font_size))
-            with open('settings.conf', 'w') as f:
-                config.write(f)
+            settings.set('font_size', font_size)
             for item in items_to_change_font:
                 item.config(font=('', font_size))
             size_entry.delete(0, END)
             size_entry.insert(0, f'{font_size}')
-            f.close()
 
-        items_to_change_font = [self.text_area, self.line_numbers]
+        items_to_change_font = [tab.text_area for tab in self.tabs] + [self.line_numbers]
 
         font_frame = LabelFrame(settings_popup, text='Font Size')
-        font_var = IntVar(value=config.getint('Editor', 'font_size'))
+        font_var = IntVar(value=settings.getint('font_size'))
         font_size = font_var.get()
         font_scale = Scale(font_frame, from_=8, to=24, orient='horizontal', variable=font_var, command=lambda _: font_var.set(round(font_scale.get())))
         size_entry = Entry(font_frame, width=5, textvariable=font_var)
@@ -244,13 +1099,11 @@ class TextEditor:
 
         # Padding
         def update_padding():
-            config.set('Editor', 'pad', str(pad_var.get()))
-            with open('settings.conf', 'w') as configfile:
-                config.write(configfile)
+            settings.set('pad', pad_var.get())
 
         padding_frame = LabelFrame(settings_popup, text='Padding (Restart Required)')
 
-        pad_var = IntVar(value=config.getint('Editor', 'pad'))
+        pad_var = IntVar(value=settings.getint('pad'))
         pad_scale = Scale(padding_frame, from_=0, to=20, orient='horizontal', variable=pad_var, command=lambda _: pad_var.set(round(pad_scale.get())))
         pad_entry = Entry(padding_frame, width=5, textvariable=pad_var)
 
@@ -280,96 +1133,86 @@ class TextEditor:
         def stop():
             self.window.unbind('<Escape>')
             self.finding = False
+            self.search_refresh = None
+            if self.search_after:
+                self.window.after_cancel(self.search_after)
+                self.search_after = None
+            self.cancel_search()
             self.clear_highlights()
+            self.search_matches = []
+            self.current_match_index = -1
             find_frame.pack_forget()
             self.text_area.focus_set()
 
-        def perform_search():
+        def perform_search(step=True):
+            if self.search_after:
+                self.window.after_cancel(self.search_after)
+                self.search_after = None
             search_text = find_var.get()
-            if not search_text:
-                return
-
+            self.cancel_search()
             self.clear_highlights()
             self.search_matches = []
             self.current_match_index = -1
-            self.last_search = search_text
-
-            # Get all text content
-            content = self.text_area.get(1.0, 'end-1c')
-
-            # Perform case-sensitive or case-insensitive search
-            if case_var.get():
-                search_content = content
-                search_term = search_text
-            else:
-                search_content = content.lower()
-                search_term = search_text.lower()
+            if not search_text:
+                status_label.config(text="Enter search term")
+                return
 
-            # Find all matches
-            start_pos = 0
-            while True:
-                pos = search_content.find(search_term, start_pos)
-                if pos == -1:
-                    break
+            self.last_search = search_text
 
-                # Convert position to line.column format
-                lines_before = content[:pos].count('\n')
-                line_start = content.rfind('\n', 0, pos) + 1
-                col = pos - line_start
+            try:
+                engine = SearchEngine(search_text, regex=regex_var.get(), whole_word=word_var.get(), case=case_var.get())
+            except re.error as e:
+                status_label.config(text=f"Invalid pattern: {e}")
+                return
 
-                start_index = f"{lines_before + 1}.{col}"
-                end_index = f"{lines_before + 1}.{col + len(search_text)}"
+            # Find all matches on a worker, streaming the count into the status label
+            job = self.search_job = BackgroundSearch(engine, self.document.get_text())
+            self.search_matches = job.spans
+            poll_search(job, step)
 
-                self.search_matches.append((start_index, end_index))
-                start_pos = pos + 1
+        def poll_search(job, step):
+            if job is not self.search_job:
+                return
 
-            # Highlight all matches
-            for start_idx, end_idx in self.search_matches:
-                self.text_area.tag_add("search_match", start_idx, end_idx)
-                self.text_area.tag_configure("search_match", background="yellow", foreground="black")
+            self.highlight_visible_matches()
+            if not job.done:
+                status_label.config(text=f"Searching... {len(job.spans)} matches")
+                self.window.after(100, poll_search, job, step)
+                return
 
             # Update status
             if self.search_matches:
                 status_label.config(text=f"Found {len(self.search_matches)} matches")
-                next_match()
+                if step:
+                    next_match()
             else:
                 status_label.config(text="No matches found")
 
-        def next_match():
-            if not self.search_matches:
-                return
-
-            # Clear current highlight
-            self.text_area.tag_remove("current_match", 1.0, 'end')
-
-            # Move to next match
-            self.current_match_index = (self.current_match_index + 1) % len(self.search_matches)
-            start_idx, end_idx = self.search_matches[self.current_match_index]
+        def schedule_search(*_, step=True):
+            # Search as you type, once typing pauses; after an edit, search again without moving to a match
+            if self.search_after:
+                self.window.after_cancel(self.search_after)
+            self.search_after = self.window.after(300, perform_search, step)
 
-            # Highlight current match
-            self.text_area.tag_add("current_match", start_idx, end_idx)
-            self.text_area.tag_configure("current_match", background="orange", foreground="black")
-
-            # Scroll to match
-            self.text_area.see(start_idx)
-
-            # Update status
-            status_label.config(text=f"Match {self.current_match_index + 1} of {len(self.search_matches)}")
+        def next_match():
+            step_match(1)
 
         def prev_match():
-            if not self.search_matches:
+            step_match(-1)
+
+        def step_match(step):
+            if not self.search_matches or self.search_job is None or self.search_job.lines is None:
                 return
 
             # Clear current highlight
             self.text_area.tag_remove("current_match", 1.0, 'end')
 
-            # Move to previous match
-            self.current_match_index = (self.current_match_index - 1) % len(self.search_matches)
-            start_idx, end_idx = self.search_matches[self.current_match_index]
+            # Move to next/previous match
+            self.current_match_index = (self.current_match_index + step) % len(self.search_matches)
+            start_idx, end_idx = self.match_indices(self.current_match_index)
 
             # Highlight current match
             self.text_area.tag_add("current_match", start_idx, end_idx)
-            self.text_area.tag_configure("current_match", background="orange", foreground="black")
 
             # Scroll to match
             self.text_area.see(start_idx)
@@ -382,47 +1225,84 @@ class TextEditor:
                 return
 
             replace_text = replace_var.get()
-            start_idx, end_idx = self.search_matches[self.current_match_index]
+            indices = self.match_indices(self.current_match_index)
+            if indices is None:
+                return
+            start_idx, end_idx = indices
 
             # Replace the text
-            self.text_area.delete(start_idx, end_idx)
-            self.text_area.insert(start_idx, replace_text)
+            with self.history.group():
+                self.text_area.delete(start_idx, end_idx)
+                self.text_area.insert(start_idx, replace_text)
 
             # Refresh search to update positions
             perform_search()
 
         def replace_all():
-            if not self.search_matches:
-                return
-
             search_text = find_var.get()
             replace_text = replace_var.get()
 
             if not search_text:
                 return
 
-            # Get all content
-            content = self.text_area.get(1.0, 'end-1c')
-
-            # Perform replacement
-            if case_var.get():
-                new_content = content.replace(search_text, replace_text)
-            else:
-                # Case-insensitive replacement is more complex
-                import re
-                pattern = re.compile(re.escape(search_text), re.IGNORECASE)
-                new_content = pattern.sub(replace_text, content)
-
-            # Update text area
-            self.text_area.delete(1.0, 'end')
-            self.text_area.insert(1.0, new_content)
+            try:
+                engine = SearchEngine(search_text, regex=regex_var.get(), whole_word=word_var.get(), case=case_var.get())
+            except re.error as e:
+                status_label.config(text=f"Invalid pattern: {e}")
+                return
+            try:
+                engine.check_replacement(replace_text)
+            except re.error as e:
+                status_label.config(text=f"Invalid replacement: {e}")
+                return
 
             # Clear search
+            self.cancel_search()
             self.clear_highlights()
             self.search_matches = []
             self.current_match_index = -1
 
-            status_label.config(text="Replaced all matches")
+            if self.large_file:
+                if not engine.single_line: # It would have to read the whole file into memory
+                    status_label.config(text="Patterns that can match across lines can't be replaced in a large file")
+                    return
+                replace_in_file(engine, replace_text)
+                return
+
+            content = self.document.get_text()
+            edits = list(engine.edits(content, replace_text))
+            self.replace_spans([(start, end) for start, end, _ in edits], [new_text for _, _, new_text in edits], content)
+
+            status_label.config(text=f"Replaced {len(edits)} matches")
+
+        def replace_in_file(engine, replace_text):
+            # Large files are rewritten on disk by a worker, then reopened
+            file_path = self.save_path
+            file_format = self.file_format
+            tab = self.tab
+            result = {}
+
+            def work():
+                try:
+                    result['count'] = replace_file(file_path, engine, replace_text, encoding=file_format.encoding)
+                except OSError as e:
+                    result['error'] = e
+
+            def poll():
+                if worker.is_alive():
+                    self.window.after(100, poll)
+                elif 'error' in result:
+                    status_label.config(text=f"Replace failed: {result['error']}")
+                elif tab in self.tabs:
+                    self.select_tab(tab)
+                    self.load_file(file_path)
+                    status_label.config(text=f"Replaced {result['count']} matches")
+
+            self.close_large_file()
+            status_label.config(text="Replacing in file...")
+            worker = threading.Thread(target=work, daemon=True)
+            worker.start()
+            poll()
 
         # Search Stuff
         self.window.bind('<Escape>', lambda _: stop())
@@ -445,6 +1325,12 @@ class TextEditor:
             case_var = BooleanVar(value=False)
             case_check = Checkbutton(options_frame, text='Case sensitive', variable=case_var)
             case_check.pack(side='left', padx=self.pad)
+            word_var = BooleanVar(value=False)
+            word_check = Checkbutton(options_frame, text='Whole word', variable=word_var)
+            word_check.pack(side='left', padx=self.pad)
+            regex_var = BooleanVar(value=False)
+            regex_check = Checkbutton(options_frame, text='Regex', variable=regex_var)
+            regex_check.pack(side='left', padx=self.pad)
             options_frame.pack(fill='x', padx=self.pad)
 
             # Buttons frame
@@ -472,6 +1358,9 @@ class TextEditor:
 
             replace_btn_frame.pack(fill='x', padx=self.pad)
 
+            files_btn = Button(find_frame, text='Find in Files', command=lambda: self.find_in_files(find_var.get()), style='secondary-outline')
+            files_btn.pack(padx=self.pad, pady=self.pad, fill='x')
+
             # Status label
             status_label = Label(find_frame, text="Enter search term")
             status_label.pack(padx=self.pad, pady=self.pad)
@@ -481,47 +1370,508 @@ class TextEditor:
             # Focus on find entry and bind Enter key
             find_entry.focus_set()
             find_entry.bind('<Return>', lambda _: perform_search())
+            find_var.trace_add('write', schedule_search)
+            self.search_refresh = lambda: schedule_search(step=False)
             replace_entry.bind('<Return>', lambda _: perform_search())
 
             self.finding = True
 
+    def find_in_files(self, query=''):
+        from findfiles import FileSearch
+
+        def browse():
+            from tkinter.filedialog import askdirectory
+            directory = askdirectory(parent=files_popup)
+            if directory:
+                dir_var.set(directory)
+
+        def start():
+            cancel()
+            results.delete(*results.get_children())
+            if not query_var.get() or not os.path.isdir(dir_var.get()):
+                status_label.config(text="Enter a search term and a directory")
+                return
+
+            try:
+                job = FileSearch(dir_var.get(), query_var.get(), regex=regex_var.get(), whole_word=word_var.get(), case=case_var.get(),
+                                 include=include_var.get(), exclude=exclude_var.get(), max_size=max_size_var.get() * 1024 * 1024)
+            except re.error as e:
+                status_label.config(text=f"Invalid pattern: {e}")
+                return
+            except TclError:
+                status_label.config(text="Max size must be a number")
+                return
+            self.file_search = job
+            poll(job, 0)
+
+        def poll(job, shown):
+            if job is not self.file_search or not files_popup.winfo_exists():
+                return
+
+            # Push new hits into the list as they arrive, a batch per callback so the window stays responsive
+            found = len(job.hits)
+            hits = job.hits[shown:min(found, shown + self.FILE_HITS_PER_POLL, self.FILE_HITS_SHOWN)]
+            for path, line, col, text in hits:
+                results.insert('', 'end', values=(os.path.relpath(path, dir_var.get()), line, text.strip()), tags=(path, f'{line}.{col}'))
+            shown += len(hits)
+
+            listed = f" ({shown} listed)" if found > shown else ''
+            if job.done and shown == min(found, self.FILE_HITS_SHOWN):
+                status_label.config(text=f"{found} matches in {job.files_searched} files{listed}")
+            else:
+                status_label.config(text=f"Searching... {found} matches in {job.files_searched} files{listed}")
+                self.window.after(10 if len(hits) == self.FILE_HITS_PER_POLL else 100, poll, job, shown)
+
+        def cancel():
+            if self.file_search:
+                self.file_search.cancel()
+                self.file_search = None
+                status_label.config(text="Cancelled")
+
+        def open_hit(_):
+            selection = results.selection()
+            if not selection:
+                return
+            path, index = results.item(selection[0], 'tags')
+            line, col = map(int, index.split('.'))
+            self.open_path(path)
+            self.goto_line(line)
+            local = self.document.tk_index(self.document.offset_of(line - self.window_start + 1, col))
+            self.text_area.mark_set('insert', local)
+            self.text_area.see(local)
+            self.text_area.focus_set()
+            return 'break'
+
+        def close():
+            cancel()
+            files_popup.destroy()
+
+        files_popup = Toplevel(title='Find in Files')
+
+        # Search options
+        options_frame = LabelFrame(files_popup, text='Find in Files')
+        query_var = StringVar(value=query)
+        Entry(options_frame, textvariable=query_var).pack(padx=self.pad, pady=self.pad, fill='x')
+
+        dir_frame = Frame(options_frame)
+        dir_var = StringVar(value=os.path.dirname(self.save_path) if self.save_path else os.getcwd())
+        Entry(dir_frame, textvariable=dir_var).pack(side='left', padx=self.pad, fill='x', expand=True)
+        Button(dir_frame, text='Browse', command=browse).pack(side='left', padx=self.pad)
+        dir_frame.pack(padx=self.pad, pady=self.pad, fill='x')
+
+        filter_frame = Frame(options_frame)
+        include_var = StringVar(value='*')
+        exclude_var = StringVar(value='')
+        max_size_var = IntVar(value=self.settings.getint('large_file_mb'))
+        Label(filter_frame, text='Include').pack(side='left', padx=self.pad)
+        Entry(filter_frame, textvariable=include_var, width=12).pack(side='left', padx=self.pad, fill='x', expand=True)
+        Label(filter_frame, text='Exclude').pack(side='left', padx=self.pad)
+        Entry(filter_frame, textvariable=exclude_var, width=12).pack(side='left', padx=self.pad, fill='x', expand=True)
+        Label(filter_frame, text='Max MB').pack(side='left', padx=self.pad)
+        Entry(filter_frame, textvariable=max_size_var, width=6).pack(side='left', padx=self.pad)
+        filter_frame.pack(padx=self.pad, pady=self.pad, fill='x')
+
+        check_frame = Frame(options_frame)
+        case_var = BooleanVar(value=False)
+        word_var = BooleanVar(value=False)
+        regex_var = BooleanVar(value=False)
+        Checkbutton(check_frame, text='Case sensitive', variable=case_var).pack(side='left', padx=self.pad)
+        Checkbutton(check_frame, text='Whole word', variable=word_var).pack(side='left', padx=self.pad)
+        Checkbutton(check_frame, text='Regex', variable=regex_var).pack(side='left', padx=self.pad)
+        check_frame.pack(padx=self.pad, pady=self.pad, fill='x')
+
+        btn_frame = Frame(options_frame)
+        Button(btn_frame, text='Search', command=start).pack(side='left', padx=self.pad, pady=self.pad, fill='x', expand=True)
+        Button(btn_frame, text='Cancel', command=cancel, style='danger-outline').pack(side='left', padx=self.pad, pady=self.pad, fill='x', expand=True)
+        btn_frame.pack(fill='x', padx=self.pad)
+        options_frame.pack(padx=self.pad, pady=self.pad, fill='x')
+
+        # Results
+        results = Treeview(files_popup, columns=('file', 'line', 'text'), show='headings', height=15)
+        results.heading('file', text='File')
+        results.heading('line', text='Line')
+        results.heading('text', text='Text')
+        results.column('line', width=60, stretch=False)
+        results.pack(padx=self.pad, pady=self.pad, fill='both', expand=True)
+        results.bind('<Double-1>', open_hit)
+        results.bind('<Return>', open_hit)
+
+        status_label = Label(files_popup, text="Enter search term")
+        status_label.pack(padx=self.pad, pady=self.pad)
+
+        # Bindings
+        for bind in self.destroy_binds:
+            files_popup.bind(bind, lambda _: close())
+        files_popup.protocol("WM_DELETE_WINDOW", close)
+        files_popup.bind('<Return>', lambda _: start())
+
+    def compare_file(self):
+        """Compare the active document with a file, picked the way Open picks one"""
+        file_path = self.ask_open_path()
+        if file_path:
+            self.compare(file_path)
+
+    def compare(self, file_path=None, tab=None):
+        """Show a tab's document side by side with file_path, or with its own file on disk.
+
+        Both texts are read and diffed on a worker thread. The view holds
+        only the rows on screen, redrawn on both sides from the same row
+        whenever it scrolls, so the sides can't drift apart.
+        """
+        from tkinter.font import Font
+
+        tab = tab or self.tab
+        if tab.evicted:
+            self.select_tab(tab)
+        name = self.tab_name(tab)
+        if file_path is None:
+            file_path = tab.save_path
+            right_name = f'{name} (on disk)' if file_path else '(nothing saved)'
+        else:
+            right_name = file_path
+
+        # Both sides are read whole, which large files are opened in windows to avoid
+        large_file_mb = self.settings.getint('large_file_mb')
+        too_large = tab.large_file is not None
+        if file_path and not too_large:
+            try:
+                too_large = os.path.getsize(file_path) >= large_file_mb * 1024 * 1024
+            except OSError:
+                pass # The diff job reports it
+        if too_large:
+            self.save_status.config(text=f'Files of {large_file_mb} MB or more are too large to compare')
+            return
+
+        from diff import DiffJob # Only loaded the first time something is compared
+        job = DiffJob(tab.document.snapshot().get_text, lambda: read_file(file_path)[0] if file_path else '')
+        top = 0
+        current = -1 # Change last stepped to
+        shown = [] # Left line (or None) on each row on screen
+        summary = ''
+
+        def visible_rows():
+            return max(left_text.winfo_height() // linespace, 1)
+
+        def show(row):
+            nonlocal top
+            rows = job.rows
+            count = visible_rows()
+            top = max(0, min(row, rows.count - count))
+            left_lines, right_lines = job.left_lines, job.right_lines
+            width = len(str(max(len(left_lines), len(right_lines))))
+            x = left_text.xview()[0]
+            for text in (left_text, right_text):
+                text.configure(state='normal')
+                text.delete(1.0, 'end')
+            shown.clear()
+            for tag, i, j in rows.rows(top, top + count):
+                shown.append(i)
+                for text, lines, number in ((left_text, left_lines, i), (right_text, right_lines, j)):
+                    if number is None:
+                        text.insert('end', '\n', 'filler')
+                    else:
+                        text.insert('end', f'{number + 1:>{width}} ', 'number', lines[number] + '\n', tag)
+            for text in (left_text, right_text):
+                text.configure(state='disabled')
+                text.xview_moveto(x)
+            if rows.count:
+                scrollbar.set(top / rows.count, (top + count) / rows.count)
+
+        def scroll(action, amount, unit=None):
+            nonlocal current
+            if not job.rows:
+                return
+            if action == 'moveto':
+                show(int(float(amount) * job.rows.count))
+            else:
+                show(top + int(amount) * (visible_rows() if unit == 'pages' else 1))
+            current = bisect_right(job.rows.hunks, top + self.COMPARE_CONTEXT) - 1
+
+        def wheel(event):
+            scroll('scroll', -3 if event.num == 4 or event.delta > 0 else 3, 'units')
+            return 'break'
+
+        def step_change(step):
+            nonlocal current
+            hunks = job.rows.hunks if job.rows else []
+            if not hunks:
+                return 'break'
+            current = max(0, min(current + step, len(hunks) - 1))
+            show(hunks[current] - self.COMPARE_CONTEXT)
+            status_label.config(text=f'Change {current + 1} of {len(hunks)} · {summary}')
+            return 'break'
+
+        def open_row(event):
+            row = int(left_text.index(f'@{event.x},{event.y}').split('.')[0]) - 1
+            if row < len(shown) and shown[row] is not None and tab in self.tabs:
+                self.select_tab(tab)
+                self.goto_line(shown[row] + 1)
+                self.text_area.see('insert')
+                self.text_area.focus_set()
+            return 'break'
+
+        def poll():
+            nonlocal summary
+            if not compare_popup.winfo_exists():
+                return
+            if not job.done:
+                self.window.after(50, poll)
+                return
+            if job.error:
+                status_label.config(text=f'Could not compare: {job.error}')
+                return
+
+            opcodes = job.rows.opcodes
+            added = sum(j2 - j1 for tag, _, _, j1, j2 in opcodes if tag != 'equal')
+            removed = sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag != 'equal')
+            summary = f'{len(job.rows.hunks)} changes, +{added} -{removed} lines, compared in {job.seconds:.2f}s'
+            if job.rows.hunks:
+                step_change(1)
+            else:
+                show(0)
+                status_label.config(text=f'No differences · compared in {job.seconds:.2f}s')
+
+        compare_popup = Toplevel(title='Compare')
+        compare_popup.title(f'Compare - {name}')
+
+        # Two read-only text areas sharing one set of scrollbars
+        view_frame = Frame(compare_popup)
+        Label(view_frame, text=f'{name} (editor)').grid(row=0, column=0, sticky='w', padx=self.pad)
+        Label(view_frame, text=right_name).grid(row=0, column=1, sticky='w', padx=self.pad)
+        font = ('', self.settings.getint('font_size'))
+        linespace = Font(font=font).metrics('linespace')
+        left_text = Text(view_frame, font=font, wrap='none', state='disabled', width=60, height=30)
+        right_text = Text(view_frame, font=font, wrap='none', state='disabled', width=60, height=30)
+        scrollbar = Scrollbar(view_frame, orient='vertical', command=scroll)
+        x_scrollbar = Scrollbar(view_frame, orient='horizontal', command=lambda *args: [left_text.xview(*args), right_text.xview(*args)])
+        left_text.configure(xscrollcommand=x_scrollbar.set)
+        left_text.grid(row=1, column=0, sticky='nsew', padx=self.pad)
+        right_text.grid(row=1, column=1, sticky='nsew', padx=self.pad)
+        scrollbar.grid(row=1, column=2, sticky='ns')
+        x_scrollbar.grid(row=2, column=0, columnspan=2, sticky='ew', padx=self.pad)
+        view_frame.rowconfigure(1, weight=1)
+        view_frame.columnconfigure(0, weight=1, uniform='side')
+        view_frame.columnconfigure(1, weight=1, uniform='side')
+        view_frame.pack(padx=self.pad, pady=self.pad, fill='both', expand=True)
+
+        for text in (left_text, right_text):
+            text.tag_configure('delete', background='#ffd7d5', foreground='black')
+            text.tag_configure('insert', background='#ccffd8', foreground='black')
+            text.tag_configure('replace', background='#fff5b1', foreground='black')
+            text.tag_configure('filler', background='#e8e8e8')
+            text.tag_configure('number', foreground='gray')
+
+        btn_frame = Frame(compare_popup)
+        Button(btn_frame, text='Previous Change', command=lambda: step_change(-1)).pack(side='left', padx=self.pad, pady=self.pad, fill='x', expand=True)
+        Button(btn_frame, text='Next Change', command=lambda: step_change(1)).pack(side='left', padx=self.pad, pady=self.pad, fill='x', expand=True)
+        Button(btn_frame, text='Close', command=compare_popup.destroy, style='danger-outline').pack(side='left', padx=self.pad, pady=self.pad, fill='x', expand=True)
+        btn_frame.pack(fill='x', padx=self.pad)
+
+        status_label = Label(compare_popup, text='Comparing...')
+        status_label.pack(padx=self.pad, pady=self.pad)
+
+        # Bindings (on the text areas too, so their own scrolling can't move one side alone)
+        for widget in (compare_popup, left_text, right_text):
+            widget.bind('<MouseWheel>', wheel)
+            widget.bind('<Button-4>', wheel)
+            widget.bind('<Button-5>', wheel)
+            widget.bind('<Up>', lambda _: scroll('scroll', -1, 'units') or 'break')
+            widget.bind('<Down>', lambda _: scroll('scroll', 1, 'units') or 'break')
+            widget.bind('<Prior>', lambda _: scroll('scroll', -1, 'pages') or 'break')
+            widget.bind('<Next>', lambda _: scroll('scroll', 1, 'pages') or 'break')
+            widget.bind('<n>', lambda _: step_change(1))
+            widget.bind('<p>', lambda _: step_change(-1))
+        left_text.bind('<Double-1>', open_row)
+        left_text.bind('<Configure>', lambda _: show(top) if job.rows else None)
+        for bind in self.destroy_binds:
+            compare_popup.bind(bind, lambda _: compare_popup.destroy())
+        poll()
+
     def clear_highlights(self):
         """Clear all search highlights from the text area"""
         self.text_area.tag_remove("search_match", 1.0, 'end')
         self.text_area.tag_remove("current_match", 1.0, 'end')
+        self.tagged_matches = None
+
+    def cancel_search(self):
+        if self.search_job:
+            self.search_job.cancel()
+            self.search_job = None
+
+    def match_indices(self, i):
+        """Tk indices of the i-th match of the current search, or None while there's no index to find them with"""
+        job = self.search_job
+        if job is None or job.lines is None:
+            return None
+        start, end = self.search_matches[i]
+        return job.lines.tk_index(start), job.lines.tk_index(end)
+
+    def invalidate_search(self):
+        """Drop search matches the text has moved away from, searching again once editing pauses if the Find panel is open"""
+        if self.search_job is None and not self.search_matches:
+            return
+        self.cancel_search()
+        self.clear_highlights()
+        self.search_matches = []
+        self.current_match_index = -1
+        if self.search_refresh:
+            self.search_refresh()
+
+    def highlight_visible_matches(self):
+        """Tag only the matches in and around the visible lines"""
+        job = self.search_job
+        if job is None or job.lines is None:
+            return
+
+        starts = job.lines.starts
+        first, last = self.visible_lines()
+        low = starts[max(first - self.HIGHLIGHT_MARGIN, 1) - 1]
+        high = starts[last + self.HIGHLIGHT_MARGIN] if last + self.HIGHLIGHT_MARGIN < len(starts) else len(job.text)
+
+        spans = job.spans
+        i = bisect_left(spans, (low,))
+        j = bisect_left(spans, (high,), i)
+        if (i, j) == self.tagged_matches:
+            return
+        self.tagged_matches = (i, j)
+
+        self.text_area.tag_remove("search_match", 1.0, 'end')
+        indices = []
+        for start, end in spans[i:j]:
+            indices += [job.lines.tk_index(start), job.lines.tk_index(end)]
+        if indices:
+            self.text_area.tag_add("search_match", *indices)
 
     def update_line_numbers(self):
-        self.line_numbers.configure(state='normal')
-        self.line_numbers.delete(1.0, 'end')
-        self.line_numbers.insert(1.0, '\n'.join(str(i) for i in range(1, len(self.text_area.get('1.0', 'end').split('\n')))))
-        self.line_numbers.configure(state='disabled')
-
-    def update_config(self):
-        config = self.config
-        if os.path.exists('settings.conf'):
-            pass
-        else:
-            with open('settings.conf', 'w') as f:
-                f.write('')
-                f.close()
-
-        config.read('settings.conf')
-
-        # Only add section and set defaults if section doesn't exist
-        if not config.has_section('Editor'):
-            config.add_section('Editor')
-            config.set('Editor', 'theme', 'sandstone')
-            config.set('Editor', 'font_size', '12')
-            config.set('Editor', 'pad', '2')
-            config.set('Editor', 'line_numbers', 'False')
-            config.set('Editor', 'last_doc', '')
-            config.set('Editor', 'remember', 'False')
-
-        with open('settings.conf', 'w') as f:
-            config.write(f)
-            f.close()
-
-def main():
-    editor = TextEditor()
-
-main()
+        """Render numbers for the visible lines only, and only when the view has changed"""
+        if not self.settings.getboolean('line_numbers'):
+            return
+        self.gutter_view = render_line_numbers(self.text_area, self.line_numbers, self.window_start, self.document.line_count, self.gutter_view)
+
+    def load_text(self, text):
+        """Replace the whole document without replaying it through the edit mirror"""
+        self.invalidate_search()
+        self.document = Document(text)
+        self.history.clear()
+        self.mirroring = False
+        try:
+            self.text_area.delete(1.0, 'end')
+            self.text_area.insert(1.0, text)
+        finally:
+            self.mirroring = True
+        self.reset_highlighter()
+
+    def wrap_text_area(self, tab):
+        """Route the text area's Tcl command through text_proxy so every edit reaches the document"""
+        widget = tab.text_area
+        tab.text_command = widget._w + '_widget'
+        widget.tk.call('rename', widget._w, tab.text_command)
+
+        def proxy(*args):
+            if tab is not self.tab: # Only the active tab is edited; the others are just drawn
+                return widget.tk.call(tab.text_command, *args)
+            return self.text_proxy(*args)
+
+        widget.tk.createcommand(widget._w, proxy)
+
+    def text_proxy(self, command, *args):
+        call = self.text_area.tk.call
+        if not self.mirroring or command not in ('insert', 'delete', 'replace'):
+            return call(self.text_command, command, *args)
+
+        document = self.document
+        if command == 'insert':
+            offset = self.text_offset(args[0])
+            result = call(self.text_command, command, *args)
+            text = ''.join(args[1::2])
+            document.insert(offset, text)
+            self.document_edited(offset, '', text)
+            return result
+
+        if command == 'delete':
+            ranges = list(args)
+            if len(ranges) % 2:
+                ranges.append(f'{ranges[-1]}+1c')
+            spans = sorted((self.text_offset(a), self.text_offset(b)) for a, b in zip(ranges[::2], ranges[1::2]))
+            result = call(self.text_command, command, *args)
+            with self.history.group() if len(spans) > 1 else nullcontext():
+                for start, end in reversed(spans):
+                    self.document_edited(start, document.delete(start, end - start), '')
+            return result
+
+        # replace index1 index2 chars ?tagList chars tagList ...?
+        start, end = self.text_offset(args[0]), self.text_offset(args[1])
+        result = call(self.text_command, command, *args)
+        removed = document.delete(start, end - start)
+        text = ''.join(args[2::2])
+        document.insert(start, text)
+        self.document_edited(start, removed, text)
+        return result
+
+    def document_edited(self, offset, removed, inserted):
+        """Called after every edit mirrored into the document"""
+        self.invalidate_search()
+        self.history.record(offset, removed, inserted)
+        if self.journal:
+            if removed:
+                self.journal.delete(offset, len(removed))
+            if inserted:
+                self.journal.insert(offset, inserted)
+        if self.highlighter:
+            line = self.document.index_of(offset)[0]
+            if removed:
+                self.highlighter.edited(line, -removed.count('\n'))
+            if inserted:
+                self.highlighter.edited(line, inserted.count('\n'))
+            self.schedule_highlight()
+        self.update_title()
+
+    def visible_lines(self):
+        """First and last text area lines on screen"""
+        return visible_lines(self.text_area)
+
+    def reset_highlighter(self):
+        lexer = lexer_for(self.save_path)
+        self.highlighter = Highlighter(lexer, self.document.get_line, self.document.line_count) if lexer else None
+        self.schedule_highlight()
+
+    def schedule_highlight(self):
+        if self.highlighter is None:
+            return
+        if self.highlight_after:
+            self.window.after_cancel(self.highlight_after)
+        self.highlight_after = self.window.after_idle(self.highlight)
+
+    def highlight(self):
+        """Tag the visible lines, then keep working through the rest a chunk per callback"""
+        self.highlight_after = None
+        highlighter = self.highlighter
+        if highlighter is None:
+            return
+
+        first, last = self.visible_lines()
+        highlighter.render(first, last, self.tag_line)
+        if highlighter.sweep(self.tag_line, self.HIGHLIGHT_CHUNK):
+            self.highlight_after = self.window.after(10, self.highlight)
+
+    def tag_line(self, line, tokens):
+        start, end = f'{line}.0', f'{line}.end'
+        for tag in TAG_COLORS:
+            self.text_area.tag_remove(tag, start, end)
+
+        text = self.document.get_line(line) if tokens else ''
+        ranges = {}
+        for tag, token_start, token_end in tokens:
+            ranges.setdefault(tag, []).extend((f'{line}.{tk_column(text, token_start)}', f'{line}.{tk_column(text, token_end)}'))
+        for tag, indices in ranges.items():
+            self.text_area.tag_add(tag, *indices)
+
+    def text_offset(self, index):
+        line, col = map(int, self.text_area.tk.call(self.text_command, 'index', index).split('.'))
+        return self.document.tk_offset(line, col)
+
+def main(file_path=None, profile=None, tracer=None):
+    editor = TextEditor(file_path, profile, tracer)
+
+if __name__ == '__main__': # Find in Files workers re-import this module
+    main()
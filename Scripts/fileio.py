@@ -0,0 +1,207 @@
+import codecs
+import os
+import re
+from array import array
+from bisect import bisect_left
+
+SNIFF_BYTES = 1 << 16
+CHUNK = 1 << 20
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'), # Before UTF-16 LE, whose BOM it starts with
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+NEWLINE_NAMES = {'\n': 'LF', '\r\n': 'CRLF', '\r': 'CR'}
+LINE_ENDING = re.compile('\r\n|\r|\n')
+ESCAPED = re.compile('[\udc80-\udcff]') # Undecodable bytes under surrogateescape
+
+
+class FileFormat:
+    """How a file was stored on disk, so it can be written back byte for byte.
+
+    The editor only ever sees '\\n' line endings; saving turns them back into
+    newline. In a file with mixed line endings, the '\\n's of the originally
+    loaded text that ended their line differently are listed in exceptions
+    (offsets into that text) and keep their own ending while untouched.
+    Bytes that aren't valid in the encoding are decoded to lone surrogates
+    and encoded back to the same bytes.
+    """
+
+    def __init__(self, encoding='utf-8', bom=b'', newline=os.linesep, binary=False):
+        self.encoding = encoding
+        self.bom = bom
+        self.newline = newline
+        self.binary = binary # No sensible text encoding; shown as Latin-1
+        self.errors = 'surrogatepass' if encoding.startswith(('utf-16', 'utf-32')) else 'surrogateescape'
+        self.exceptions = array('q')
+        self.exception_newlines = []
+
+    @property
+    def ascii_compatible(self):
+        """Whether '\\n' is a single 0x0A byte, as LargeFile's line index assumes"""
+        return not self.encoding.startswith(('utf-16', 'utf-32'))
+
+    @property
+    def label(self):
+        name = 'Binary' if self.binary else self.encoding.upper() + (' BOM' if self.bom else '')
+        return f'{name} · {NEWLINE_NAMES[self.newline]}' + (' (mixed)' if self.exceptions else '')
+
+    def forget_exceptions(self):
+        """The document no longer starts from the text the file was read as (e.g. it was recovered)"""
+        self.exceptions = array('q')
+        self.exception_newlines = []
+
+    def restore_newlines(self, text, origin=None):
+        """Give text, found at origin in the original text (None for new text), its on-disk line endings"""
+        newline = self.newline
+        exceptions = self.exceptions
+        if origin is not None and exceptions:
+            first = bisect_left(exceptions, origin)
+            last = bisect_left(exceptions, origin + len(text), first)
+            if first < last:
+                parts, pos = [], 0
+                for i in range(first, last):
+                    offset = exceptions[i] - origin
+                    parts.append(text[pos:offset].replace('\n', newline))
+                    parts.append(self.exception_newlines[i])
+                    pos = offset + 1
+                parts.append(text[pos:].replace('\n', newline))
+                return ''.join(parts)
+        return text if newline == '\n' else text.replace('\n', newline)
+
+    def encode(self, document, block=CHUNK):
+        """Yield the document as bytes in this format, a block of text at a time"""
+        encoder = codecs.getincrementalencoder(self.encoding)(self.errors)
+        if self.bom:
+            yield self.bom
+        for text, origin in document.pieces():
+            for i in range(0, len(text), block):
+                yield encoder.encode(self.restore_newlines(text[i:i + block], None if origin is None else origin + i))
+        yield encoder.encode('', True)
+
+
+def detect(prefix):
+    """Guess a file's format from its first few KB"""
+    for bom, encoding in BOMS:
+        if prefix.startswith(bom):
+            return FileFormat(encoding, bom, _guess_newline(prefix[len(bom):], encoding))
+
+    binary = False
+    if b'\0' in prefix:
+        # UTF-16 without a BOM has a zero in every other byte for ASCII text
+        half = len(prefix) // 2
+        even, odd = prefix[0::2].count(0), prefix[1::2].count(0)
+        if odd > half * 0.4 and even < half * 0.05:
+            encoding = 'utf-16-le'
+        elif even > half * 0.4 and odd < half * 0.05:
+            encoding = 'utf-16-be'
+        else:
+            encoding, binary = 'latin-1', True
+    else:
+        # UTF-8 unless invalid bytes outnumber valid multibyte characters, as in Latin-1 text
+        text = codecs.getincrementaldecoder('utf-8')('surrogateescape').decode(prefix) # Not final: a cut-off character isn't an error
+        invalid = len(ESCAPED.findall(text))
+        non_ascii = len(text) - len(text.encode('ascii', 'ignore'))
+        encoding = 'utf-8' if invalid <= non_ascii - invalid else 'latin-1'
+    return FileFormat(encoding, newline=_guess_newline(prefix, encoding), binary=binary)
+
+
+def detect_file(path):
+    with open(path, 'rb') as file:
+        return detect(file.read(SNIFF_BYTES))
+
+
+def read_file(path, chunk_size=CHUNK, size=None):
+    """Read a file a chunk at a time and return (text, FileFormat).
+
+    Line endings are translated to '\\n' as each chunk is decoded, so the
+    file is never held as both bytes and text. size stops reading after that
+    many bytes, e.g. the size the file had when it was stat'ed.
+    """
+    with open(path, 'rb') as file:
+        prefix = _read(file, SNIFF_BYTES, size)
+        file_format = detect(prefix)
+        try:
+            text = _decode(file, prefix, file_format, chunk_size, size)
+        except UnicodeDecodeError:
+            # A guess the rest of the file disagrees with (e.g. UTF-16 with an odd byte count); Latin-1 maps every byte
+            file.seek(0)
+            file_format = FileFormat('latin-1', newline=file_format.newline, binary=True)
+            text = _decode(file, _read(file, chunk_size, size), file_format, chunk_size, size)
+    return text, file_format
+
+
+def decode_appended(data, file_format):
+    """Decode bytes appended to a file read as file_format; return (text, bytes used).
+
+    A character or CRLF cut off by a writer that hasn't finished is left
+    out, to be decoded with the bytes that follow it. Line endings other
+    than the file's usual one become '\\n' like the rest, but aren't
+    remembered as exceptions, since the text isn't part of the original.
+    """
+    decoder = codecs.getincrementaldecoder(file_format.encoding)(file_format.errors)
+    text = decoder.decode(data)
+    used = len(data) - len(decoder.getstate()[0])
+    if text.endswith('\r'):
+        text = text[:-1]
+        used -= len('\r'.encode(file_format.encoding))
+    return _translate(text, 0, FileFormat(file_format.encoding, newline=file_format.newline)), used
+
+
+def _guess_newline(data, encoding):
+    text = codecs.getincrementaldecoder(encoding)('replace').decode(data)
+    crlf = text.count('\r\n')
+    counts = {'\r\n': crlf, '\r': text.count('\r') - crlf, '\n': text.count('\n') - crlf}
+    newline = max(counts, key=counts.get)
+    return newline if counts[newline] else os.linesep
+
+
+def _read(file, count, size):
+    return file.read(count if size is None else max(0, min(count, size - file.tell())))
+
+
+def _decode(file, data, file_format, chunk_size, size):
+    decoder = codecs.getincrementaldecoder(file_format.encoding)(file_format.errors)
+    data = data[len(file_format.bom):]
+    parts = []
+    length = 0
+    carry = ''
+    while True:
+        final = not data
+        text = carry + decoder.decode(data, final)
+        carry = ''
+        if not final and text.endswith('\r'):
+            text, carry = text[:-1], '\r' # May be the first half of a CRLF
+        text = _translate(text, length, file_format)
+        parts.append(text)
+        length += len(text)
+        if final:
+            return ''.join(parts)
+        data = _read(file, chunk_size, size)
+
+
+def _translate(text, base, file_format):
+    """Turn the line endings in text (at base in the decoded file) into '\\n', noting any that aren't the usual one"""
+    newline = file_format.newline
+    if newline == '\n':
+        if '\r' not in text:
+            return text
+    elif newline == '\r\n':
+        crlf = text.count('\r\n')
+        if crlf == text.count('\r') == text.count('\n'):
+            return text.replace('\r\n', '\n')
+    elif '\n' not in text:
+        return text.replace('\r', '\n')
+
+    exceptions, newlines = file_format.exceptions, file_format.exception_newlines
+    shift = 0
+    for match in LINE_ENDING.finditer(text):
+        ending = match.group()
+        if ending != newline:
+            exceptions.append(base + match.start() - shift)
+            newlines.append(ending)
+        shift += len(ending) - 1
+    return LINE_ENDING.sub('\n', text)
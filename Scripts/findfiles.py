@@ -0,0 +1,125 @@
+import fnmatch
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from fileio import detect_file
+from search import LineIndex, SearchEngine
+
+SKIP_DIRS = {'.git', '.hg', '.svn', '__pycache__', 'node_modules'}
+
+
+def split_globs(globs):
+    return [glob.strip() for glob in globs.replace(',', ';').split(';') if glob.strip()]
+
+
+def iter_files(root, include='*', exclude='', max_size=None):
+    """Walk root and yield the files matching the include globs, skipping excluded and oversized ones"""
+    include, exclude = split_globs(include) or ['*'], split_globs(exclude)
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not any(fnmatch.fnmatch(d, glob) for glob in exclude))
+        for name in sorted(files):
+            if not any(fnmatch.fnmatch(name, glob) for glob in include):
+                continue
+            if any(fnmatch.fnmatch(name, glob) for glob in exclude):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if max_size is not None and os.path.getsize(path) > max_size:
+                    continue
+            except OSError:
+                continue
+            yield path
+
+
+def search_file(path, query, regex=False, whole_word=False, case=False, max_hits=1000, chunk_size=1 << 22):
+    """Return (path, line, col, line_text) hits for one file, reading it a chunk of whole lines at a time.
+
+    The file is decoded the way the editor would open it, so lines and
+    columns match what it shows; binary files have no hits.
+    """
+    engine = SearchEngine(query, regex, whole_word, case)
+    hits = []
+    line_offset = 0
+    try:
+        file_format = detect_file(path)
+        if file_format.binary:
+            return hits
+        with open(path, 'r', encoding=file_format.encoding, errors=file_format.errors) as file:
+            if file_format.bom:
+                file.read(1) # Decodes to a single U+FEFF
+            while len(hits) < max_hits:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                if not chunk.endswith('\n'):
+                    chunk += file.readline()
+
+                lines = LineIndex(chunk)
+                for start, _ in engine.finditer(chunk):
+                    line, col = lines.index_of(start)
+                    end = lines.starts[line] - 1 if line < len(lines) else len(chunk)
+                    text = chunk[lines.starts[line - 1]:end][:200].encode('utf-8', 'replace').decode('utf-8') # Undecodable bytes as '?'
+                    hits.append((path, line_offset + line, col, text))
+                    if len(hits) >= max_hits:
+                        break
+                line_offset += len(lines) - 1
+    except (OSError, UnicodeError):
+        pass
+    return hits
+
+
+class FileSearch:
+    """Search a directory tree in a process pool.
+
+    Hits are appended to self.hits as each file finishes; poll it together
+    with done from the UI thread.
+    """
+
+    def __init__(self, root, query, regex=False, whole_word=False, case=False, include='*', exclude='', max_size=None, workers=None):
+        SearchEngine(query, regex, whole_word, case) # Raise re.error here rather than in every worker
+        self.hits = []
+        self.files_searched = 0
+        self.done = False
+        self.cancelled = False
+        self._options = (query, regex, whole_word, case)
+        self._files = iter_files(root, include, exclude, max_size)
+        self._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._walker = threading.Thread(target=self._walk, daemon=True)
+        self._walker.start()
+
+    def cancel(self):
+        self.cancelled = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _walk(self):
+        with self._lock:
+            self._pending += 1
+        for path in self._files:
+            if self.cancelled:
+                return
+            with self._lock:
+                self._pending += 1
+            try:
+                future = self._pool.submit(search_file, path, *self._options)
+            except RuntimeError: # Pool shut down by cancel()
+                return
+            future.add_done_callback(self._collect)
+        self._finish_one()
+
+    def _collect(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.hits.extend(future.result())
+        with self._lock:
+            self.files_searched += 1
+        self._finish_one()
+
+    def _finish_one(self):
+        with self._lock:
+            self._pending -= 1
+            if self._pending == 0 and not self.cancelled:
+                self.done = True
+                self._pool.shutdown(wait=False)
@@ -0,0 +1,38 @@
+# Line number gutter drawing, shared by the editor and the benchmarks. Takes Tk widgets but imports nothing from Tk.
+
+
+def visible_lines(text_area):
+    """First and last text area lines on screen"""
+    first = int(text_area.index('@0,0').split('.')[0])
+    last = int(text_area.index(f'@0,{text_area.winfo_height()}').split('.')[0])
+    return first, last
+
+
+def render_line_numbers(text_area, line_numbers, window_start=1, line_count=None, last_view=None):
+    """Number the visible lines of text_area in line_numbers, unless the view is still last_view; return the view.
+
+    window_start is the file line shown on text_area's first line (large
+    files only hold a window), and line_count the document's, so a view
+    that merely gained or lost lines off screen is still redrawn.
+    """
+    first, last = visible_lines(text_area)
+    display_lines = text_area.count('@0,0', f'@0,{text_area.winfo_height()}', 'displaylines')
+    view = (first, last, display_lines, window_start, line_count, text_area.winfo_height())
+    if view == last_view:
+        return view
+
+    # One row per display line, so wrapped lines keep the numbers aligned
+    rows = []
+    for line in range(first, last + 1):
+        rows.append(str(window_start + line - 1))
+        wraps = (text_area.count(f'{line}.0', f'{line}.0 lineend', 'displaylines') or (0,))[0]
+        rows.extend([''] * wraps)
+
+    width = max(4, len(rows[0]), len(str(window_start + last - 1)))
+    if int(line_numbers.cget('width')) != width:
+        line_numbers.configure(width=width)
+    line_numbers.configure(state='normal')
+    line_numbers.delete(1.0, 'end')
+    line_numbers.insert(1.0, '\n'.join(rows))
+    line_numbers.configure(state='disabled')
+    return view
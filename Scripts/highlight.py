@@ -0,0 +1,231 @@
+import builtins
+import keyword
+import os
+import re
+from abc import ABC, abstractmethod
+
+TAG_COLORS = {
+    'hl_keyword': '#a626a4',
+    'hl_builtin': '#0184bc',
+    'hl_string': '#50a14f',
+    'hl_comment': '#8a8a8a',
+    'hl_number': '#c18401',
+    'hl_decorator': '#e45649',
+    'hl_definition': '#4078f2',
+}
+
+LEXERS = []
+UNKNOWN = object() # Start state of a line that hasn't been lexed yet
+
+
+def register_lexer(lexer):
+    """Make a lexer available to lexer_for; later registrations win"""
+    LEXERS.insert(0, lexer)
+    return lexer
+
+
+def lexer_for(path):
+    if not path:
+        return None
+    extension = os.path.splitext(path)[1].lower()
+    for lexer in LEXERS:
+        if extension in lexer.extensions:
+            return lexer
+    return None
+
+
+class Lexer(ABC):
+    """Base class for language plugins.
+
+    lex_line gets one line and the state left by the previous line, and
+    returns ([(tag, start_col, end_col), ...], end_state). States must be
+    comparable with ==, so the highlighter can tell when re-lexing after an
+    edit has converged.
+    """
+
+    extensions = ()
+    initial_state = None
+
+    @abstractmethod
+    def lex_line(self, line, state):
+        pass
+
+
+class PythonLexer(Lexer):
+    extensions = ('.py', '.pyw', '.pyi')
+
+    KEYWORDS = set(keyword.kwlist) | set(getattr(keyword, 'softkwlist', ()))
+    BUILTINS = {name for name in dir(builtins) if not name.startswith('_')}
+    TOKEN = re.compile(r'''
+        (?P<comment>\#.*)
+      | (?P<triple>(?<!\w)[rRbBuUfF]{0,2}(?:\'\'\'|"""))
+      | (?P<string>(?<!\w)[rRbBuUfF]{0,2}(?:'(?:[^'\\]|\\.)*'?|"(?:[^"\\]|\\.)*"?))
+      | (?P<decorator>(?<![\w)\]])@[\w.]+)
+      | (?P<number>(?<![\w.])(?:0[xXoObB][\da-fA-F_]+|\d[\d_]*\.?[\d_]*(?:[eE][+-]?\d+)?j?|\.\d[\d_]*(?:[eE][+-]?\d+)?j?))
+      | (?P<name>[^\W\d]\w*)
+    ''', re.VERBOSE)
+    CLOSE = {delimiter: re.compile(r'(?:[^\\]|\\.)*?' + re.escape(delimiter)) for delimiter in ("'''", '"""')}
+
+    def lex_line(self, line, state):
+        tokens = []
+        pos = 0
+        if state:
+            pos = self._close(line, 0, state, tokens)
+            if pos is None:
+                return tokens, state
+
+        definition = False
+        while True:
+            match = self.TOKEN.search(line, pos)
+            if not match:
+                return tokens, None
+            kind, start, pos = match.lastgroup, match.start(), match.end()
+
+            if kind == 'triple':
+                delimiter = match.group()[-3:]
+                end = self._close(line, pos, delimiter, tokens, start)
+                if end is None:
+                    return tokens, delimiter
+                pos = end
+            elif kind == 'name':
+                name = match.group()
+                if definition:
+                    tokens.append(('hl_definition', start, pos))
+                elif name in self.KEYWORDS:
+                    tokens.append(('hl_keyword', start, pos))
+                elif name in self.BUILTINS:
+                    tokens.append(('hl_builtin', start, pos))
+                definition = name in ('def', 'class')
+                continue
+            else:
+                tokens.append(('hl_' + kind, start, pos))
+            definition = False
+
+    def _close(self, line, pos, delimiter, tokens, start=None):
+        """Tag a triple-quoted string from start; return where it ends, or None if it runs past the line"""
+        start = pos if start is None else start
+        match = self.CLOSE[delimiter].match(line, pos)
+        end = match.end() if match else len(line)
+        if end > start:
+            tokens.append(('hl_string', start, end))
+        return end if match else None
+
+
+class IniLexer(Lexer):
+    extensions = ('.ini', '.conf', '.cfg', '.toml')
+
+    LINE = re.compile(r'(?P<comment>\s*[#;].*)|\s*(?P<section>\[.*\])|\s*(?P<key>[^=:\s][^=:]*?)\s*[=:]\s*(?P<value>.*)')
+
+    def lex_line(self, line, state):
+        match = self.LINE.match(line)
+        if not match:
+            return [], None
+        if match.group('comment'):
+            return [('hl_comment', 0, len(line))], None
+        if match.group('section'):
+            return [('hl_keyword', match.start('section'), match.end('section'))], None
+        tokens = [('hl_definition', match.start('key'), match.end('key'))]
+        if match.group('value'):
+            tokens.append(('hl_string', match.start('value'), match.end('value')))
+        return tokens, None
+
+
+register_lexer(IniLexer())
+register_lexer(PythonLexer())
+
+
+class Highlighter:
+    """Incremental highlighting state for one document.
+
+    Keeps the lexer state at the start of every line and a flag per line
+    saying whether its tags are current. After an edit, lines are re-lexed
+    from the edited line only until the lexer state matches what it was
+    before, so the cost of a keystroke doesn't grow with the file.
+    """
+
+    def __init__(self, lexer, get_line, line_count):
+        self.lexer = lexer
+        self.get_line = get_line
+        self.starts = [lexer.initial_state] + [UNKNOWN] * (line_count - 1)
+        self.tagged = bytearray(line_count)
+        self.known = 1 # Start states of lines 1..known are valid
+        self.valid_to = 1 # ...and were valid up to here before the last edit
+        self.edit_end = 0
+
+    @property
+    def done(self):
+        return self.known >= len(self.tagged) and self.tagged.find(0) == -1
+
+    def edited(self, line, delta):
+        """Line (1-based) changed and the line count changed by delta"""
+        if delta > 0:
+            self.starts[line:line] = [UNKNOWN] * delta
+            self.tagged[line:line] = bytes(delta)
+        elif delta < 0:
+            del self.starts[line:line - delta]
+            del self.tagged[line:line - delta]
+        self.tagged[line - 1] = 0
+
+        # States past an unfinished re-lex are only valid relative to its frontier, so drop them
+        self.valid_to = min(self.valid_to, self.known)
+        if self.valid_to > line:
+            self.valid_to = max(self.valid_to + delta, line)
+        self.known = min(self.known, line)
+        self.edit_end = max(self.edit_end if self.edit_end <= line else self.edit_end + delta, line + max(delta, 0))
+
+    def render(self, first, last, tag_line, budget=5000):
+        """Tag lines first..last that aren't current.
+
+        If more than budget lines would have to be lexed to know the state
+        at first, the view is tagged from a guessed state and left for the
+        idle sweep to correct.
+        """
+        last = min(last, len(self.tagged))
+        if first - self.known > budget:
+            state = self.lexer.initial_state
+            for line in range(first, last + 1):
+                tokens, state = self.lexer.lex_line(self.get_line(line), state)
+                tag_line(line, tokens)
+                self.tagged[line - 1] = 0
+            return
+
+        self._ensure_states(last)
+        for line in range(first, last + 1):
+            if not self.tagged[line - 1]:
+                self._tag(line, tag_line)
+
+    def sweep(self, tag_line, limit=500):
+        """Tag up to limit stale lines from the top; return True while work remains"""
+        line = self.tagged.find(0) + 1
+        if not line:
+            # Tags look current, but states past known may still change them
+            if self.known >= len(self.tagged):
+                return False
+            line = self.known
+        end = min(line + limit, len(self.tagged) + 1)
+        self._ensure_states(end - 1)
+        for line in range(line, end):
+            if not self.tagged[line - 1]:
+                self._tag(line, tag_line)
+        return not self.done
+
+    def _tag(self, line, tag_line):
+        tokens, _ = self.lexer.lex_line(self.get_line(line), self.starts[line - 1])
+        tag_line(line, tokens)
+        self.tagged[line - 1] = 1
+
+    def _ensure_states(self, target):
+        starts, tagged = self.starts, self.tagged
+        while self.known < target:
+            line = self.known
+            _, end = self.lexer.lex_line(self.get_line(line), starts[line - 1])
+            old = starts[line]
+            starts[line] = end
+            self.known += 1
+            if end != old:
+                tagged[line] = 0
+            elif line >= self.edit_end and self.valid_to > self.known:
+                # Converged: everything after here is as it was before the edit
+                self.known = self.valid_to
+                self.edit_end = 0
+        self.valid_to = max(self.valid_to, self.known)
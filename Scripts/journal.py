@@ -0,0 +1,315 @@
+import os
+import threading
+import time
+
+from document import Document
+from saver import AtomicFile
+from settings import default_path
+
+JOURNAL_HEADER = b'#TEXTEDITOR-JOURNAL'
+SNAPSHOT_HEADER = b'#TEXTEDITOR-SNAPSHOT'
+NO_BASE = '-'
+
+
+def journal_path(path, number=1):
+    """Journal file for a document: beside it, or numbered in the per-user recovery folder when untitled"""
+    if path is None:
+        name = 'untitled.journal' if number == 1 else f'untitled-{number}.journal'
+        return os.path.join(os.path.dirname(default_path()), 'recovery', name)
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f'.{name}.journal')
+
+
+def snapshot_path(path):
+    return os.path.splitext(path)[0] + '.snapshot'
+
+
+class Journal:
+    """Append-only log of the edits made to a document since its base.
+
+    The base is either the file on disk or a compacted snapshot written
+    beside the journal, and is identified by its digest, so a journal can
+    always be checked against the text it has to be replayed onto. Edits
+    are queued in memory and written by a background thread in batches.
+
+    Records:
+        +offset,bytes\\n<text>              insert
+        -offset,length\\n                   delete
+        *count,span_bytes,text_bytes\\n...  replace_spans
+        =digest,position\\n                 text after journal byte position has this digest
+    """
+
+    FLUSH_INTERVAL = 0.5
+    COMPACT_BYTES = 8 << 20 # Snapshot once this much journal has piled up...
+    COMPACT_SECONDS = 300 # ...or this long after the last snapshot/save, if anything changed
+
+    def __init__(self, path, base_digest=None, fsync=True):
+        self.path = path
+        self.snapshot_path = snapshot_path(path)
+        self.fsync = fsync
+        self.generation = 0
+        self.size = 0
+        self._base_size = 0
+        self._based = time.monotonic()
+        self._pending = []
+        self._synced = True # Nothing written since the last fsync
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._job = None
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with AtomicFile(path, mode='wb', fsync=fsync) as file:
+            file.write(self._header(base_digest))
+        self._file = open(path, 'ab')
+        self.size = self._base_size = os.path.getsize(path)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def due(self):
+        """Whether the journal has grown enough to be worth compacting"""
+        grown = self.size - self._base_size
+        return grown > self.COMPACT_BYTES or (grown > 0 and time.monotonic() - self._based > self.COMPACT_SECONDS)
+
+    # Recording (called from the UI thread on every edit, so keep these cheap)
+    def insert(self, offset, text):
+        data = text.encode('utf-8', 'surrogatepass')
+        with self._lock:
+            self._pending.append(b'+%d,%d\n%s' % (offset, len(data), data))
+
+    def delete(self, offset, length):
+        with self._lock:
+            self._pending.append(b'-%d,%d\n' % (offset, length))
+
+    def replace_spans(self, spans, text):
+        texts = [text] * len(spans) if isinstance(text, str) else text
+        span_data = b'\n'.join(b'%d,%d,%d' % (start, end, len(new_text)) for (start, end), new_text in zip(spans, texts))
+        text_data = ''.join(texts).encode('utf-8', 'surrogatepass')
+        with self._lock:
+            self._pending.append(b'*%d,%d,%d\n%s%s' % (len(spans), len(span_data), len(text_data), span_data, text_data))
+
+    # Writing
+    def flush(self, fsync=None):
+        with self._lock:
+            self._flush(self.fsync if fsync is None else fsync)
+
+    def mark(self):
+        """Flush and return the current position, to rebase onto a copy of the document taken now"""
+        with self._lock:
+            self._flush(False)
+            return self.generation, self.size
+
+    def rebase(self, digest, mark):
+        """The document as it was at mark is now stored somewhere with this digest.
+
+        Rewrites the journal to start from that base, keeping only the edits
+        made after mark. Returns False if the journal was rebased since mark.
+        """
+        with self._lock:
+            if mark[0] != self.generation or self._closed.is_set():
+                return False
+            self._flush(False)
+            with open(self.path, 'rb') as file:
+                file.seek(mark[1])
+                tail = file.read()
+            tail = b''.join(_strip_checkpoints(tail)) # Their positions are about to change
+            self._file.close()
+            try:
+                with AtomicFile(self.path, mode='wb', fsync=self.fsync) as file:
+                    file.write(self._header(digest))
+                    file.write(tail)
+            finally:
+                self._file = open(self.path, 'ab')
+            self._synced = True # The AtomicFile was
+            self.generation += 1
+            self.size = os.path.getsize(self.path)
+            self._base_size = self.size - len(tail)
+            self._based = time.monotonic()
+            return True
+
+    def compact(self, document):
+        """Write document (a snapshot taken now) beside the journal on a worker and rebase onto it"""
+        if self._job and self._job.is_alive():
+            return
+        self._job = threading.Thread(target=self._compact, args=(document, self.mark()), daemon=True)
+        self._job.start()
+
+    def wait(self):
+        """Let a snapshot in progress finish and write out queued records"""
+        if self._job:
+            self._job.join()
+        self.flush()
+
+    def close(self, discard=False):
+        """Stop writing; discard removes the journal and snapshot, e.g. after a clean exit"""
+        self._closed.set()
+        self._thread.join()
+        if self._job:
+            self._job.join()
+        with self._lock:
+            if not discard:
+                self._flush(self.fsync)
+            self._file.close()
+        if discard:
+            for path in (self.path, self.snapshot_path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    # Internals
+    def _header(self, digest):
+        return b'%s %s\n' % (JOURNAL_HEADER, (digest or NO_BASE).encode('ascii'))
+
+    def _flush(self, fsync):
+        """Write out queued records, and fsync if asked and anything was written since the last; the lock must be held"""
+        if self._pending:
+            data = b''.join(self._pending)
+            self._pending.clear()
+            self._file.write(data)
+            self._file.flush()
+            self.size += len(data)
+            self._synced = False
+        if fsync and not self._synced:
+            os.fsync(self._file.fileno())
+            self._synced = True
+
+    def _run(self):
+        while not self._closed.wait(self.FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except OSError:
+                pass # Keep the records queued and try again next time
+
+    def _compact(self, document, mark):
+        digest = document.digest()
+        # Record where the snapshot starts before it replaces the previous one, so a crash part way through still has a base
+        with self._lock:
+            if mark[0] != self.generation or self._closed.is_set():
+                return
+            self._pending.append(b'=%s,%d\n' % (digest.encode('ascii'), mark[1]))
+            self._flush(True)
+        try:
+            with AtomicFile(self.snapshot_path, encoding='utf-8', errors='surrogatepass', newline='', fsync=self.fsync) as file:
+                file.write(f'{SNAPSHOT_HEADER.decode()} {digest}\n')
+                for chunk in document.chunks():
+                    file.write(chunk)
+            self.rebase(digest, mark)
+        except OSError:
+            pass # The journal still replays from the old base
+
+
+def _records(data, pos):
+    """Yield (kind, fields, payload, end) for each whole record from pos, stopping at a torn or garbled tail"""
+    while True:
+        newline = data.find(b'\n', pos)
+        if newline == -1:
+            return
+        kind, fields = data[pos:pos + 1], data[pos + 1:newline].split(b',')
+        try:
+            if kind == b'+':
+                size = int(fields[1])
+            elif kind == b'*':
+                size = int(fields[1]) + int(fields[2])
+            elif kind in (b'-', b'='):
+                size = 0
+            else:
+                return
+        except (ValueError, IndexError):
+            return
+        end = newline + 1 + size
+        if end > len(data):
+            return
+        yield kind, fields, data[newline + 1:end], end
+        pos = end
+
+
+def _strip_checkpoints(data):
+    pos = 0
+    for kind, _, _, end in _records(data, 0):
+        if kind != b'=':
+            yield data[pos:end]
+        pos = end
+
+
+def _apply(document, kind, fields, payload):
+    if kind == b'+':
+        document.insert(int(fields[0]), payload.decode('utf-8', 'surrogatepass'))
+    elif kind == b'-':
+        document.delete(int(fields[0]), int(fields[1]))
+    elif kind == b'*':
+        span_size = int(fields[1])
+        text = payload[span_size:].decode('utf-8', 'surrogatepass')
+        spans, texts, cursor = [], [], 0
+        for line in payload[:span_size].split(b'\n') if span_size else ():
+            start, end, length = map(int, line.split(b','))
+            spans.append((start, end))
+            texts.append(text[cursor:cursor + length])
+            cursor += length
+        document.replace_spans(spans, texts)
+
+
+def _read_snapshot(path, header_only=False):
+    """Return (digest, text) of a snapshot file, text being None when header_only"""
+    try:
+        with open(path, 'rb') as file:
+            header = file.readline()
+            if not header.startswith(SNAPSHOT_HEADER + b' '):
+                return None, None
+            digest = header[len(SNAPSHOT_HEADER) + 1:].strip().decode('ascii')
+            return digest, None if header_only else file.read().decode('utf-8', 'surrogatepass')
+    except (OSError, UnicodeError):
+        return None, None
+
+
+def recover(path, base_digest, load_base):
+    """Replay the journal at path and return the recovered Document.
+
+    base_digest is the digest of the document as it is on disk, and
+    load_base returns its text; it is only called if the journal has to be
+    replayed onto it rather than onto the compacted snapshot. Returns None
+    if there is no journal, no usable base, or nothing that differs from
+    the file on disk.
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return None
+
+    header_end = data.find(b'\n') + 1
+    if not data.startswith(JOURNAL_HEADER + b' ') or not header_end:
+        return None
+    anchors = [(data[len(JOURNAL_HEADER) + 1:header_end - 1].decode('ascii', 'replace'), header_end)]
+    for kind, fields, _, _ in _records(data, header_end):
+        if kind == b'=' and len(fields) == 2 and fields[1].isdigit():
+            anchors.append((fields[0].decode('ascii', 'replace'), int(fields[1])))
+
+    snapshot_digest, _ = _read_snapshot(snapshot_path(path), header_only=True)
+    for digest, position in reversed(anchors):
+        if digest == base_digest:
+            try:
+                document = Document(load_base())
+            except OSError:
+                continue
+            break
+        if digest == snapshot_digest:
+            _, text = _read_snapshot(snapshot_path(path))
+            if text is not None:
+                document = Document(text)
+                break
+    else:
+        return None
+
+    for kind, fields, payload, _ in _records(data, position):
+        if kind == b'=':
+            continue
+        try:
+            _apply(document, kind, fields, payload)
+        except (ValueError, IndexError, UnicodeError):
+            break # Garbled record; keep what was recovered up to here
+
+    if document.version == 0 and digest == base_digest or document.digest() == base_digest:
+        return None
+    return document
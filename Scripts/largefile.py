@@ -0,0 +1,118 @@
+import mmap
+import os
+import threading
+from array import array
+
+LARGE_WINDOW = 2000 # Lines of a large file the editor keeps in the text area at a time
+
+
+class LargeFile:
+    """Read-only, memory-mapped view of a file too big to load into the Text widget.
+
+    Line start offsets are indexed on a background thread, so lines near the
+    top of the file can be read before the whole file has been scanned.
+    refresh() extends the view and the index over bytes appended since.
+    """
+
+    CHUNK = 1 << 22
+
+    def __init__(self, path, encoding='utf-8', header=0):
+        self.path = path
+        self.encoding = encoding
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self._offsets = array('q', [header]) # header: bytes before the first line, i.e. a byte order mark
+        self._closed = False
+        self._lock = threading.Lock()
+        self._indexing = True
+        self.indexed = 0
+        self.complete = not self.size
+
+        self._thread = threading.Thread(target=self._build_index, daemon=True)
+        self._thread.start()
+
+    @property
+    def line_count(self):
+        """Number of lines indexed so far"""
+        return len(self._offsets)
+
+    @property
+    def estimated_lines(self):
+        if self.complete or not self.indexed:
+            return self.line_count
+        return max(self.line_count, int(self.line_count * self.size / self.indexed))
+
+    def lines(self, first, count):
+        """Return count lines starting at 1-based line first, joined with newlines"""
+        offsets = self._offsets
+        available = len(offsets)
+        if first < 1 or first > available:
+            return ''
+
+        start = offsets[first - 1]
+        last = first - 1 + count
+        if last < available:
+            end = offsets[last] - 1
+        elif self.complete:
+            end = self.size
+        else:
+            end = offsets[available - 1] - 1
+        if end <= start:
+            return ''
+        text = self._map[start:end].decode(self.encoding, errors='replace').replace('\r\n', '\n') # Lines are split on LF alone
+        return text[:-1] if text.endswith('\r') else text
+
+    def line_offset(self, line):
+        """Byte offset of a 1-based line, or None if it hasn't been indexed yet"""
+        if 1 <= line <= len(self._offsets):
+            return self._offsets[line - 1]
+        return None
+
+    def refresh(self):
+        """Pick up bytes appended to the file; return False if it was replaced or truncated instead"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        opened = os.fstat(self._file.fileno())
+        if (stat.st_dev, stat.st_ino) != (opened.st_dev, opened.st_ino) or stat.st_size < self.size:
+            return False
+        if stat.st_size == self.size:
+            return True
+
+        with self._lock:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) # The old map lives on until nothing uses it
+            self.size = len(self._map)
+            self.complete = False
+            if not self._indexing:
+                self._indexing = True
+                self._thread = threading.Thread(target=self._build_index, daemon=True)
+                self._thread.start()
+        return True
+
+    def close(self):
+        self._closed = True
+        self._thread.join()
+        if self.size:
+            self._map.close()
+        self._file.close()
+
+    def _build_index(self):
+        offsets = self._offsets
+        pos = self.indexed
+        while not self._closed:
+            with self._lock:
+                data, size = self._map, self.size
+                if pos >= size:
+                    self.complete = True
+                    self._indexing = False
+                    return
+            end = min(pos + self.CHUNK, size)
+            newline = data.find(b'\n', pos, end)
+            while newline != -1:
+                offsets.append(newline + 1)
+                newline = data.find(b'\n', newline + 1, end)
+            pos = end
+            self.indexed = pos
+        self._indexing = False
@@ -0,0 +1,159 @@
+import errno
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+
+from fileio import FileFormat
+
+
+UMASK = os.umask(0) # Only readable by setting it; read once here, as setting it isn't thread safe
+os.umask(UMASK)
+
+
+class AtomicFile:
+    """File that only replaces path once everything has been written (text unless mode is 'wb').
+
+    Writes go to a temp file in the same directory, which is renamed over
+    path on commit, so a crash mid-write never leaves a truncated file.
+    Used as a context manager it commits on success and discards on error.
+
+    A symlink is followed, so the file it points at is the one replaced,
+    and the replacement keeps the old file's mode and, where allowed, its
+    owner. A file with other hard links, or in a directory we can't create
+    files in, is written in place on commit instead, as renaming would
+    split it from its other names or isn't possible. Read-only files raise
+    PermissionError, as opening them for writing would.
+    """
+
+    def __init__(self, path, encoding=None, errors=None, newline=None, fsync=False, mode='w'):
+        self.path = os.path.realpath(path)
+        self.fsync = fsync
+        if os.path.exists(self.path) and not os.access(self.path, os.W_OK):
+            raise PermissionError(errno.EACCES, 'File is read-only', self.path)
+        directory, name = os.path.split(self.path)
+        self.in_place = False
+        try:
+            fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+        except PermissionError:
+            if not os.path.exists(self.path):
+                raise
+            fd, self.temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp')
+            self.in_place = True
+        self.file = os.fdopen(fd, mode, encoding=encoding, errors=errors, newline=newline)
+
+    def write(self, text):
+        self.file.write(text)
+
+    def commit(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.file.close()
+        try:
+            target = os.stat(self.path)
+        except FileNotFoundError:
+            os.chmod(self.temp_path, 0o666 & ~UMASK) # mkstemp makes it 0600; give a new file the usual mode
+        else:
+            if self.in_place or target.st_nlink > 1:
+                self._write_in_place()
+                return
+            if hasattr(os, 'chown'): # Before the mode, as changing the owner clears setuid bits
+                try:
+                    os.chown(self.temp_path, target.st_uid, target.st_gid)
+                except OSError:
+                    try:
+                        os.chown(self.temp_path, -1, target.st_gid) # Only root can give a file away; the group may still be ours to set
+                    except OSError:
+                        pass
+            os.chmod(self.temp_path, stat.S_IMODE(target.st_mode))
+        os.replace(self.temp_path, self.path)
+
+    def _write_in_place(self):
+        """Copy the temp file over path's contents, keeping its inode"""
+        try:
+            with open(self.temp_path, 'rb') as source, open(self.path, 'r+b') as target:
+                shutil.copyfileobj(source, target, 1 << 20)
+                target.truncate()
+                if self.fsync:
+                    target.flush()
+                    os.fsync(target.fileno())
+        finally:
+            os.unlink(self.temp_path)
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.unlink(self.temp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.file.closed:
+            return
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+class SaveJob:
+    """Writes a document snapshot to path on a worker thread, in file_format.
+
+    The thread is not a daemon, so a save started just before the window
+    closes still finishes before the interpreter exits.
+    """
+
+    BLOCK = 1 << 20
+
+    def __init__(self, path, document, file_format=None, fsync=True):
+        self.path = path
+        self.document = document
+        self.file_format = file_format or FileFormat()
+        self.fsync = fsync
+        self.error = None
+        self.digest = None
+        self.hasher = None
+        self.stat = None # The file as this job left it
+        self.size = 0
+        self.started = None
+        self.seconds = 0.0
+        self.done = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.start()
+
+    @property
+    def rate(self):
+        """Bytes written per second"""
+        return self.size / self.seconds if self.seconds else 0.0
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self):
+        started = self.started = time.perf_counter()
+        try:
+            with AtomicFile(self.path, mode='wb', fsync=self.fsync) as file:
+                for data in self.file_format.encode(self.document, self.BLOCK):
+                    file.write(data)
+            self.stat = os.stat(self.path)
+            self.size = self.stat.st_size
+            self.seconds = time.perf_counter() - started
+            self.hasher = self.document.hasher()
+            self.digest = self.hasher.hexdigest()
+        except (OSError, UnicodeError) as e:
+            self.error = e
+        self.done = True
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GB'
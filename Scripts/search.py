@@ -0,0 +1,274 @@
+import re
+import threading
+from bisect import bisect_right
+from contextlib import nullcontext
+
+from document import ASTRAL, newline_positions, tk_column
+from saver import AtomicFile
+
+try:
+    from re import _parser as sre_parse # Python 3.11+
+except ImportError:
+    import sre_parse
+
+NEWLINE_CATEGORIES = {'CATEGORY_SPACE', 'CATEGORY_NOT_DIGIT', 'CATEGORY_NOT_WORD', 'CATEGORY_LINEBREAK', 'CATEGORY_UNI_SPACE', 'CATEGORY_UNI_NOT_DIGIT', 'CATEGORY_UNI_NOT_WORD', 'CATEGORY_UNI_LINEBREAK'}
+
+
+class LineIndex:
+    """Line start offsets of a string, for O(log n) offset to line.col conversion"""
+
+    def __init__(self, text):
+        self.text = text
+        self.starts = [0]
+        self.starts.extend(pos + 1 for pos in newline_positions(text))
+        self.astral = not text.isascii() and ASTRAL.search(text) is not None # Whether Tk columns can differ from ours
+
+    def __len__(self):
+        return len(self.starts)
+
+    def index_of(self, offset):
+        """Return the 1-based line and 0-based column of offset"""
+        line = bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1]
+
+    def tk_index(self, offset):
+        line, col = self.index_of(offset)
+        if self.astral:
+            col = tk_column(self.text[offset - col:offset], col)
+        return f'{line}.{col}'
+
+    def offset_of(self, line, col):
+        return self.starts[line - 1] + col
+
+
+def compile_pattern(query, regex=False, whole_word=False, case=False):
+    """Build the compiled pattern for a Find panel query. Raises re.error for bad regexes."""
+    pattern = query if regex else re.escape(query)
+    if whole_word:
+        pattern = rf'(?<!\w)(?:{pattern})(?!\w)'
+    flags = re.MULTILINE
+    if not case:
+        flags |= re.IGNORECASE
+    return re.compile(pattern, flags)
+
+
+def can_span_lines(pattern):
+    """Whether a compiled pattern might match a newline, or look at the start or end of the whole text (\\A, \\Z).
+
+    Patterns that can't only ever match within a line, so they can be run
+    over a text a chunk of whole lines at a time. Errs towards True.
+    """
+    parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    return _can_span_lines(parsed, bool(parsed.state.flags & re.DOTALL))
+
+
+def _can_span_lines(items, dotall):
+    for op, av in items:
+        name = str(op)
+        if name == 'LITERAL':
+            if av == 10:
+                return True
+        elif name == 'NOT_LITERAL':
+            if av != 10:
+                return True
+        elif name == 'ANY':
+            if dotall:
+                return True
+        elif name == 'IN':
+            if _set_has_newline(av):
+                return True
+        elif name == 'AT':
+            if str(av) in ('AT_BEGINNING_STRING', 'AT_END_STRING'):
+                return True
+        elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            if _can_span_lines(av[2], dotall):
+                return True
+        elif name == 'SUBPATTERN':
+            _, add_flags, del_flags, sub = av
+            if _can_span_lines(sub, (dotall or bool(add_flags & re.DOTALL)) and not del_flags & re.DOTALL):
+                return True
+        elif name == 'BRANCH':
+            if any(_can_span_lines(branch, dotall) for branch in av[1]):
+                return True
+        elif name in ('ASSERT', 'ASSERT_NOT'):
+            if _can_span_lines(av[1], dotall):
+                return True
+        elif name == 'ATOMIC_GROUP':
+            if _can_span_lines(av, dotall):
+                return True
+        elif name == 'GROUPREF_EXISTS':
+            if any(branch is not None and _can_span_lines(branch, dotall) for branch in av[1:]):
+                return True
+        elif name != 'GROUPREF': # Matches what its group matched, which was checked; anything else is unknown
+            return True
+    return False
+
+
+def _set_has_newline(items):
+    negate = False
+    found = False
+    for op, av in items:
+        name = str(op)
+        if name == 'NEGATE':
+            negate = True
+        elif name == 'LITERAL':
+            found = found or av == 10
+        elif name == 'RANGE':
+            found = found or av[0] <= 10 <= av[1]
+        elif name == 'CATEGORY':
+            found = found or str(av) in NEWLINE_CATEGORIES
+        else:
+            return True
+    return found != negate
+
+
+class SearchEngine:
+    """Literal, regex, whole-word and case-insensitive search over plain text"""
+
+    def __init__(self, query, regex=False, whole_word=False, case=False):
+        self.query = query
+        self.regex = regex
+        self.pattern = compile_pattern(query, regex, whole_word, case)
+        self.single_line = not can_span_lines(self.pattern) if regex else '\n' not in query # Can be run a chunk of lines at a time
+
+    def finditer(self, text, pos=0, endpos=None):
+        """Lazily yield (start, end) offsets of non-empty, non-overlapping matches"""
+        endpos = len(text) if endpos is None else endpos
+        for match in self.pattern.finditer(text, pos, endpos):
+            start, end = match.span()
+            if end > start:
+                yield start, end
+
+    def matches(self, text, pos=0, endpos=None):
+        """Like finditer, but yields Tk line.col index pairs"""
+        lines = LineIndex(text)
+        starts = lines.starts
+        line = 1
+        for start, end in self.finditer(text, pos, endpos):
+            # Matches arrive in order, so the previous line bounds the bisect
+            line = bisect_right(starts, start, line - 1)
+            col = start - starts[line - 1]
+            if lines.astral:
+                yield lines.tk_index(start), lines.tk_index(end)
+            elif line == len(starts) or end <= starts[line]:
+                yield f'{line}.{col}', f'{line}.{col + end - start}'
+            else:
+                yield f'{line}.{col}', lines.tk_index(end)
+
+    def count(self, text):
+        return sum(1 for _ in self.finditer(text))
+
+    def check_replacement(self, replacement):
+        """Raise re.error if replacement isn't a valid template for this pattern, e.g. \\1 with no group 1"""
+        if not self.regex:
+            return
+        try:
+            self.pattern.sub(replacement, '') # The template is compiled even when nothing matches
+        except IndexError as e: # What Python before 3.12 raises for an unknown group name
+            raise re.error(str(e)) from None
+
+    def expand(self, match, replacement):
+        """Replacement text for one match: regex templates are expanded, literals are used as-is"""
+        return match.expand(replacement) if self.regex and '\\' in replacement else replacement # Templates without a backslash expand to themselves
+
+    def edits(self, text, replacement):
+        """Lazily yield (start, end, new_text) for every match.
+
+        Unlike Find, empty matches count (^ -> '# ' comments out each line),
+        except one after a final newline, which isn't on a line (as in sed).
+        """
+        past_end = len(text) if text.endswith('\n') else -1
+        for match in self.pattern.finditer(text):
+            start, end = match.span()
+            if start != past_end:
+                yield start, end, self.expand(match, replacement)
+
+    def replace(self, text, replacement):
+        """Return (new_text, count) with every match replaced, as edits would"""
+        past_end = len(text) if text.endswith('\n') else -1
+        skipped = 0
+
+        def expand(match):
+            nonlocal skipped
+            if match.start() == past_end: # Only an empty match can start there
+                skipped += 1
+                return ''
+            return self.expand(match, replacement)
+
+        new_text, count = self.pattern.subn(expand, text)
+        return new_text, count - skipped
+
+
+def replace_file(path, engine, replacement, chunk_size=1 << 22, encoding='utf-8'):
+    """Replace every match in a file without loading it whole, and return the count"""
+    return replace_rules(path, [(engine, replacement)], chunk_size, encoding)[0]
+
+
+def replace_rules(path, rules, chunk_size=1 << 22, encoding='utf-8', dry_run=False, by_line=False):
+    """Apply (engine, replacement) rules to a file one after another, and return the count for each.
+
+    The result is streamed through an AtomicFile, which is only committed
+    if something was replaced. When no query can match across lines (or
+    by_line says to treat them as if they can't), the file is processed a
+    chunk of whole lines at a time; otherwise it's read whole. dry_run
+    counts without writing.
+    """
+    chunked = all(by_line or engine.single_line for engine, _ in rules)
+    counts = [0] * len(rules)
+    with open(path, 'r', encoding=encoding, errors='surrogateescape', newline='') as source:
+        with nullcontext() if dry_run else AtomicFile(path, encoding=encoding, errors='surrogateescape', newline='') as target:
+            while True:
+                chunk = source.read(chunk_size if chunked else -1)
+                if not chunk:
+                    break
+                if chunked and not chunk.endswith('\n'):
+                    chunk += source.readline()
+                for i, (engine, replacement) in enumerate(rules):
+                    chunk, replaced = engine.replace(chunk, replacement)
+                    counts[i] += replaced
+                if target:
+                    target.write(chunk)
+            if target and not any(counts):
+                target.discard()
+    return counts
+
+
+class BackgroundSearch:
+    """Runs a SearchEngine over a text on a worker thread, a chunk at a time.
+
+    spans grows while the search runs; poll it (and done) from the UI thread.
+    """
+
+    CHUNK = 1 << 20
+
+    def __init__(self, engine, text):
+        self.engine = engine
+        self.text = text
+        self.lines = None
+        self.spans = []
+        self.done = False
+        self.cancelled = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _run(self):
+        text, spans = self.text, self.spans
+        self.lines = LineIndex(text)
+
+        # Queries that can't match across lines can have chunks end on any newline
+        chunked = self.engine.single_line
+        pos = 0
+        while pos < len(text) and not self.cancelled:
+            end = len(text)
+            if chunked:
+                end = text.find('\n', min(pos + self.CHUNK, len(text)))
+                end = len(text) if end == -1 else end
+            for span in self.engine.finditer(text, pos, end):
+                if self.cancelled:
+                    return
+                spans.append(span)
+            pos = end
+        self.done = not self.cancelled
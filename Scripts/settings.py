@@ -0,0 +1,95 @@
+import os
+import threading
+from configparser import ConfigParser
+
+from saver import AtomicFile
+
+DEFAULTS = {
+    'theme': 'sandstone',
+    'font_size': '12',
+    'pad': '2',
+    'line_numbers': 'False',
+    'last_doc': '',
+    'remember': 'False',
+    'large_file_mb': '64',
+    'fsync': 'True',
+    'verify_exit': 'False',
+    'resident_tabs': '8',
+    'undo_mb': '16',
+    'persist_undo': 'False',
+}
+
+
+def default_path():
+    """Per-user settings.conf, independent of the working directory"""
+    if os.name == 'nt':
+        base = os.environ.get('APPDATA') or os.path.expanduser('~')
+        return os.path.join(base, 'TextEditor', 'settings.conf')
+    base = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(base, 'texteditor', 'settings.conf')
+
+
+class Settings:
+    """Editor settings, read once and served from memory.
+
+    set() only updates the cache; changes made close together are written
+    in one atomic write after a short delay, or straight away by flush().
+    """
+
+    SECTION = 'Editor'
+
+    def __init__(self, path=None, delay=0.5):
+        self.path = path or default_path()
+        self.delay = delay
+        self._config = ConfigParser()
+        self._config.read_dict({self.SECTION: DEFAULTS})
+        # Settings used to live in settings.conf in the working directory
+        self._config.read([self.path] if os.path.exists(self.path) else ['settings.conf'])
+        self._typed = {}
+        self._dirty = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        return self._config.get(self.SECTION, name)
+
+    def getint(self, name):
+        return self._cached(name, self._config.getint)
+
+    def getboolean(self, name):
+        return self._cached(name, self._config.getboolean)
+
+    def set(self, name, value):
+        value = '' if value is None else str(value)
+        with self._lock:
+            if self._config.get(self.SECTION, name, fallback=None) == value:
+                return
+            self._config.set(self.SECTION, name, value)
+            self._typed.pop(name, None)
+            self._dirty = True
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write pending changes now"""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with AtomicFile(self.path) as file:
+                    self._config.write(file)
+            except OSError:
+                return # Stay dirty and try again on the next change or flush
+            self._dirty = False
+
+    def _cached(self, name, parse):
+        if name not in self._typed:
+            self._typed[name] = parse(self.SECTION, name)
+        return self._typed[name]
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+import tkinter
+from collections import deque
+from contextlib import contextmanager
+
+
+def callback_name(func):
+    name = getattr(func, '__qualname__', None) or type(func).__qualname__
+    return name.replace('.<locals>', '')
+
+
+class Tracer:
+    """Records how long Tk callbacks and I/O take, for export as a Chrome trace.
+
+    install() swaps in a tkinter CallWrapper that times every bound event,
+    widget command and after job registered from then on, so it has to run
+    before the window is created. Events longer than slow_ms are flagged.
+    """
+
+    QUEUE_TRACK = 'mainloop queue'
+
+    def __init__(self, slow_ms=50, limit=200000):
+        self.slow = slow_ms / 1000
+        self.events = deque(maxlen=limit) # (name, category, start, duration, thread, args)
+        self.document_size = None # Set by the editor: returns the active document's length
+        self.start = time.perf_counter()
+        self._clock_offset = None # Smallest (local ms - event.time) seen, i.e. an event with no queueing
+        self._threads = {}
+
+    # Recording
+    def complete(self, name, start, duration, category='io', thread=None, **args):
+        """Record something that ran from start for duration seconds"""
+        if thread is None:
+            thread = threading.get_ident()
+            self._threads.setdefault(thread, threading.current_thread().name)
+        if duration >= self.slow:
+            args['slow'] = True
+        self.events.append((name, category, start, duration, thread, args))
+
+    @contextmanager
+    def span(self, name, category='io', **args):
+        start = time.perf_counter()
+        try:
+            yield args # Callers can add args (e.g. bytes read) while the span is open
+        finally:
+            self.complete(name, start, time.perf_counter() - start, category, **args)
+
+    def callback(self, name, category, func, args, queued=None):
+        """Run a Tk callback and record it, along with how long it waited in the queue"""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            duration = time.perf_counter() - start
+            extra = {}
+            if self.document_size:
+                try:
+                    extra['document_chars'] = self.document_size()
+                except Exception:
+                    pass
+            if queued and queued > 0:
+                extra['queued_ms'] = round(queued * 1000, 3)
+                self.events.append((name, 'queue', start - queued, queued, self.QUEUE_TRACK, {}))
+            self.complete(name, start, duration, category, **extra)
+
+    def event_queued(self, event):
+        """Seconds a Tk event waited before its binding ran, judged from the X server timestamp"""
+        if not isinstance(getattr(event, 'time', None), int) or not event.time:
+            return None
+        offset = time.perf_counter() * 1000 - event.time
+        if self._clock_offset is None or offset < self._clock_offset:
+            self._clock_offset = offset
+        return (offset - self._clock_offset) / 1000
+
+    # Hooking into tkinter
+    def install(self):
+        tracer = self
+        original_after = tkinter.Misc.after
+
+        class TracedCallWrapper(tkinter.CallWrapper):
+            def __call__(self, *args):
+                try:
+                    if self.subst:
+                        args = self.subst(*args)
+                    if getattr(self.func, 'traced', False): # after jobs record themselves
+                        return self.func(*args)
+
+                    event = args[0] if args and isinstance(args[0], tkinter.Event) else None
+                    name = callback_name(self.func)
+                    if event is not None:
+                        name = f'{event.type}: {name}'
+                        return tracer.callback(name, 'event', self.func, args, tracer.event_queued(event))
+                    return tracer.callback(name, 'command', self.func, args)
+                except SystemExit:
+                    raise
+                except:
+                    self.widget._report_exception()
+
+        def after(widget, ms, func=None, *args):
+            # Misc.after, but timing the job and how late it ran
+            if func is None:
+                return original_after(widget, ms)
+            due = time.perf_counter() + (0 if ms == 'idle' else int(ms) / 1000)
+            name = callback_name(func)
+
+            def callit():
+                try:
+                    tracer.callback(name, 'after', func, args, time.perf_counter() - due)
+                finally:
+                    try:
+                        widget.deletecommand(command)
+                    except tkinter.TclError:
+                        pass
+
+            callit.__name__ = getattr(func, '__name__', type(func).__name__)
+            callit.traced = True
+            command = widget._register(callit)
+            return widget.tk.call('after', ms, command)
+
+        tkinter.CallWrapper = TracedCallWrapper
+        tkinter.Misc.after = after
+
+    # Reporting
+    def summary(self, seconds=5):
+        """Digest of the last few seconds of callbacks, for the status label"""
+        since = time.perf_counter() - seconds
+        recent = [event for event in self.events if event[2] >= since and event[1] in ('event', 'command', 'after')]
+        if not recent:
+            return 'Trace: idle'
+        durations = sorted(event[3] for event in recent)
+        p99 = durations[min(int(0.99 * len(durations)), len(durations) - 1)]
+        worst = max(recent, key=lambda event: event[3])
+        slow = sum(1 for duration in durations if duration >= self.slow)
+        return (f'Trace {seconds}s: {len(recent)} callbacks, p99 {p99 * 1000:.1f} ms, {slow} slow\n'
+                f'worst {worst[3] * 1000:.1f} ms {worst[0]}')
+
+    def write(self, path):
+        """Write the events as Chrome trace JSON (chrome://tracing, Perfetto)"""
+        pid = os.getpid()
+        names = dict(self._threads)
+        names[threading.main_thread().ident] = 'mainloop'
+        tracks = {} # Named tracks (queueing, worker jobs) get small made-up thread ids
+
+        trace_events = []
+        for name, category, start, duration, thread, args in self.events:
+            if isinstance(thread, str):
+                thread = tracks.setdefault(thread, len(tracks) + 1)
+            event = {
+                'name': name,
+                'cat': category + (',slow' if args.get('slow') else ''),
+                'ph': 'X',
+                'ts': round((start - self.start) * 1e6, 1),
+                'dur': round(duration * 1e6, 1),
+                'pid': pid,
+                'tid': thread,
+            }
+            if args:
+                event['args'] = args
+            trace_events.append(event)
+
+        names.update((thread, name) for name, thread in tracks.items())
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'TextEditor'}}]
+        metadata += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread, 'args': {'name': name}} for thread, name in names.items()]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': metadata + trace_events, 'displayTimeUnit': 'ms'}, file)
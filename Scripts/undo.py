@@ -0,0 +1,262 @@
+import json
+import os
+import time
+from array import array
+from collections import deque
+from contextlib import contextmanager
+
+from saver import AtomicFile
+
+UNDO_HEADER = 'TEXTEDITOR-UNDO'
+
+
+def undo_path(path):
+    """Where a document's undo history is kept between sessions: beside it, hidden"""
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f'.{name}.undo')
+
+
+class SpanEdit:
+    """Many spans replaced in one go (Replace All), stored as offsets and joined strings.
+
+    spans are (start, end) in the text before the edit; removed and
+    inserted have one string per span, or inserted is one string for all.
+    """
+
+    def __init__(self, starts, removed_lengths, removed, inserted, inserted_lengths=None):
+        self.starts = starts
+        self.removed_lengths = removed_lengths
+        self.removed = removed
+        self.inserted = inserted
+        self.inserted_lengths = inserted_lengths # None when every span got the same text
+
+    @classmethod
+    def from_spans(cls, spans, removed, inserted):
+        starts = array('q', (start for start, _ in spans))
+        removed_lengths = array('q', (end - start for start, end in spans))
+        if isinstance(inserted, str) or len(set(inserted)) <= 1:
+            return cls(starts, removed_lengths, ''.join(removed), inserted if isinstance(inserted, str) else ''.join(inserted[:1]))
+        return cls(starts, removed_lengths, ''.join(removed), ''.join(inserted), array('q', map(len, inserted)))
+
+    @property
+    def cost(self):
+        return 16 * len(self.starts) + len(self.removed) + len(self.inserted)
+
+    def forward(self):
+        """(spans, texts) that redo the edit"""
+        spans = [(start, start + length) for start, length in zip(self.starts, self.removed_lengths)]
+        return spans, self._inserted_texts()
+
+    def backward(self):
+        """(spans, texts) that undo it: the inserted spans, in the text after the edit, get their old text back"""
+        spans, shift = [], 0
+        for start, removed, inserted in zip(self.starts, self.removed_lengths, self._inserted_lengths()):
+            spans.append((start + shift, start + shift + inserted))
+            shift += inserted - removed
+        return spans, _split(self.removed, self.removed_lengths)
+
+    def _inserted_lengths(self):
+        if self.inserted_lengths is None:
+            return [len(self.inserted)] * len(self.starts)
+        return self.inserted_lengths
+
+    def _inserted_texts(self):
+        if self.inserted_lengths is None:
+            return self.inserted
+        return _split(self.inserted, self.inserted_lengths)
+
+    def to_json(self):
+        return ['*', self.starts.tolist(), self.removed_lengths.tolist(), self.removed, self.inserted,
+                None if self.inserted_lengths is None else self.inserted_lengths.tolist()]
+
+    @classmethod
+    def from_json(cls, data):
+        _, starts, removed_lengths, removed, inserted, inserted_lengths = data
+        return cls(array('q', starts), array('q', removed_lengths), removed, inserted,
+                   None if inserted_lengths is None else array('q', inserted_lengths))
+
+
+def _split(joined, lengths):
+    texts, pos = [], 0
+    for length in lengths:
+        texts.append(joined[pos:pos + length])
+        pos += length
+    return texts
+
+
+def _cost(edit):
+    if isinstance(edit, SpanEdit):
+        return edit.cost
+    return UndoHistory.EDIT_OVERHEAD + len(edit[1]) + len(edit[2])
+
+
+class UndoHistory:
+    """Undo and redo for one document, as deltas kept within a memory budget.
+
+    A step is a list of edits undone together: (offset, removed, inserted)
+    tuples, or a SpanEdit for a Replace All. Typing and deleting characters
+    one after another coalesce into one edit until a pause or a newline.
+    Once the steps cost more than budget (roughly bytes: characters kept
+    plus a per-edit overhead), the oldest are dropped.
+    """
+
+    COALESCE_SECONDS = 1.0
+    EDIT_OVERHEAD = 100
+
+    def __init__(self, budget=16 << 20):
+        self.budget = budget
+        self.undo_steps = deque()
+        self.redo_steps = []
+        self.size = 0
+        self.paused = False # Set while undo/redo replays edits, so they aren't recorded
+        self._group = None # Step that edits are being collected into, inside group()
+        self._last_time = 0.0
+
+    def __bool__(self):
+        return bool(self.undo_steps or self.redo_steps)
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.size = 0
+        self._group = None
+
+    # Recording
+    def record(self, offset, removed, inserted):
+        if self.paused:
+            return
+        now = time.monotonic()
+        edit = (offset, removed, inserted)
+        if self._group is None and self._coalesce(edit, now):
+            self._last_time = now
+            return
+        self._push(edit)
+        self._last_time = now
+
+    def record_spans(self, spans, removed, inserted):
+        if not self.paused and spans:
+            self._push(SpanEdit.from_spans(spans, removed, inserted))
+
+    @contextmanager
+    def group(self):
+        """Make the edits recorded inside one step"""
+        if self._group is not None:
+            yield
+            return
+        self._group = []
+        try:
+            yield
+        finally:
+            step, self._group = self._group, None
+            if step:
+                self._drop_redo()
+                self.undo_steps.append(step)
+                self.size += sum(_cost(edit) for edit in step)
+                self._trim()
+
+    # Undo / redo: the editor applies the returned step (in reverse for undo)
+    def undo(self):
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        self._last_time = 0.0 # Typing after an undo starts a new step
+        return step
+
+    def redo(self):
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        self._last_time = 0.0
+        return step
+
+    # Persistence
+    def save(self, path, digest):
+        """Write the history for the document with this digest"""
+        data = {
+            'digest': digest,
+            'undo': [[self._edit_json(edit) for edit in step] for step in self.undo_steps],
+            'redo': [[self._edit_json(edit) for edit in step] for step in self.redo_steps],
+        }
+        with AtomicFile(path, encoding='ascii') as file:
+            file.write(UNDO_HEADER + '\n')
+            json.dump(data, file)
+
+    def load(self, path, digest):
+        """Replace the history with the one saved at path, if it was saved for the document with this digest"""
+        try:
+            with open(path, encoding='ascii') as file:
+                if file.readline().strip() != UNDO_HEADER:
+                    return False
+                data = json.load(file)
+            if data.get('digest') != digest:
+                return False
+            undo_steps = [[self._edit_from_json(edit) for edit in step] for step in data['undo']]
+            redo_steps = [[self._edit_from_json(edit) for edit in step] for step in data['redo']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self.clear()
+        self.undo_steps.extend(undo_steps)
+        self.redo_steps = redo_steps
+        self.size = sum(_cost(edit) for step in undo_steps + redo_steps for edit in step)
+        self._trim()
+        return True
+
+    # Internals
+    def _push(self, edit):
+        if self._group is not None:
+            self._group.append(edit)
+            return
+        self._drop_redo()
+        self.undo_steps.append([edit])
+        self.size += _cost(edit)
+        self._trim()
+
+    def _coalesce(self, edit, now):
+        """Merge a typed or deleted character into the last edit, if it continues it"""
+        if not self.undo_steps or now - self._last_time > self.COALESCE_SECONDS or self.redo_steps:
+            return False
+        step = self.undo_steps[-1]
+        last = step[-1]
+        if len(step) != 1 or isinstance(last, SpanEdit):
+            return False
+        offset, removed, inserted = edit
+        last_offset, last_removed, last_inserted = last
+        if inserted and not removed and not last_removed and len(inserted) == 1:
+            if offset != last_offset + len(last_inserted) or last_inserted.endswith('\n'):
+                return False
+            merged = (last_offset, '', last_inserted + inserted)
+        elif removed and not inserted and not last_inserted and len(removed) == 1 and '\n' not in removed:
+            if offset + 1 == last_offset: # Backspace
+                merged = (offset, removed + last_removed, '')
+            elif offset == last_offset: # Delete
+                merged = (offset, last_removed + removed, '')
+            else:
+                return False
+        else:
+            return False
+        step[-1] = merged
+        self.size += 1
+        return True
+
+    def _drop_redo(self):
+        for step in self.redo_steps:
+            self.size -= sum(_cost(edit) for edit in step)
+        self.redo_steps.clear()
+
+    def _trim(self):
+        """Drop the oldest steps until the history fits the budget (even the newest, if it alone doesn't)"""
+        while self.undo_steps and self.size > self.budget:
+            self.size -= sum(_cost(edit) for edit in self.undo_steps.popleft())
+
+    @staticmethod
+    def _edit_json(edit):
+        return edit.to_json() if isinstance(edit, SpanEdit) else list(edit)
+
+    @staticmethod
+    def _edit_from_json(data):
+        if data[0] == '*':
+            return SpanEdit.from_json(data)
+        offset, removed, inserted = data
+        return int(offset), str(removed), str(inserted)
@@ -0,0 +1,206 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import time
+
+from fileio import decode_appended
+
+# inotify(7)
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT = struct.Struct('iIII') # wd, mask, cookie, name length
+
+
+def stat_signature(stat):
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def signature(path):
+    """Identity, size and mtime of a file, or None if it doesn't exist"""
+    try:
+        return stat_signature(os.stat(path))
+    except OSError:
+        return None
+
+
+class FileWatcher:
+    """Tells which watched files have changed since they were last looked at.
+
+    Uses inotify on the files' directories where available, so that
+    changes() only has to stat files something happened to, and a rename
+    over the file (an atomic save, log rotation) is caught too. Elsewhere it
+    falls back to stat-ing every watched file at most every POLL_SECONDS.
+    Nothing runs in the background: the editor calls changes() on a timer.
+    """
+
+    POLL_SECONDS = 2.0
+
+    def __init__(self):
+        self.signatures = {} # Path -> signature when last reported
+        self._directories = {} # Directory -> inotify watch descriptor
+        self._dirty = set()
+        self._polled = 0.0
+        self._fd = -1
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            pass # Not Linux: poll
+
+    @property
+    def paths(self):
+        return set(self.signatures)
+
+    @property
+    def inotify(self):
+        return self._fd >= 0
+
+    def watch(self, path):
+        """Watch path, taking its current state as unchanged"""
+        path = os.path.abspath(path)
+        self.signatures[path] = signature(path)
+        directory = os.path.dirname(path)
+        if self.inotify and directory not in self._directories:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd >= 0:
+                self._directories[directory] = wd
+
+    def unwatch(self, path):
+        path = os.path.abspath(path)
+        self.signatures.pop(path, None)
+        directory = os.path.dirname(path)
+        if directory in self._directories and not any(os.path.dirname(other) == directory for other in self.signatures):
+            self._libc.inotify_rm_watch(self._fd, self._directories.pop(directory))
+
+    def changes(self):
+        """Return the watched paths whose identity, size or mtime changed since they were last reported"""
+        if self.inotify:
+            candidates = self._read_events()
+        elif time.monotonic() - self._polled >= self.POLL_SECONDS:
+            self._polled = time.monotonic()
+            candidates = list(self.signatures)
+        else:
+            return []
+
+        changed = []
+        for path in candidates:
+            current = signature(path)
+            if path in self.signatures and current != self.signatures[path]:
+                self.signatures[path] = current
+                changed.append(path)
+        return changed
+
+    def close(self):
+        if self.inotify:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _read_events(self):
+        """Paths inotify has reported something for since the last call"""
+        directories = {wd: directory for directory, wd in self._directories.items()}
+        dirty = self._dirty
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                return list(self.signatures)
+            pos = 0
+            while pos + EVENT.size <= len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, pos)
+                name = data[pos + EVENT.size:pos + EVENT.size + length].rstrip(b'\0')
+                pos += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    dirty.update(self.signatures)
+                elif wd in directories and name:
+                    dirty.add(os.path.join(directories[wd], os.fsdecode(name)))
+        self._dirty = set()
+        return [path for path in dirty if path in self.signatures]
+
+
+class DiskState:
+    """What a file held when the editor last read or wrote the whole of it.
+
+    Remembers the file's signature, how many of its bytes the document
+    reflects and the last few of them, which is enough to recognise a file
+    that has only been appended to and decode just the new bytes.
+    """
+
+    TAIL = 64
+
+    def __init__(self, path):
+        stat = os.stat(path)
+        self.signature = stat_signature(stat)
+        self.size = stat.st_size
+        with open(path, 'rb') as file:
+            file.seek(max(0, self.size - self.TAIL))
+            self.tail = file.read(self.size - file.tell())
+
+    def read_appended(self, path, file_format):
+        """Decode the bytes appended since, or return None if the file was changed some other way"""
+        stat = os.stat(path)
+        if stat.st_ino != self.signature[0] or stat.st_size <= self.size:
+            return None
+        if self.tail.endswith('\r'.encode(file_format.encoding)):
+            return None # Its line ending may turn out to be half of a CRLF
+
+        with open(path, 'rb') as file:
+            file.seek(self.size - len(self.tail))
+            if file.read(len(self.tail)) != self.tail:
+                return None
+            data = file.read(stat.st_size - self.size)
+        text, used = decode_appended(data, file_format)
+        self.size += used
+        self.tail = (self.tail + data[:used])[-self.TAIL:]
+        self.signature = stat_signature(stat)
+        return text
+
+
+def line_edits(old, new):
+    """Return the (start, end, text) edits, last first, that turn old into new a line at a time.
+
+    Lines both texts start or end with are skipped before diffing, so a
+    small change to a big file only diffs the lines around it, and
+    diff_lines keeps scattered changes near linear too.
+    """
+    a, b = old.split('\n'), new.split('\n')
+    limit = min(len(a), len(b))
+    head = 0
+    while head < limit and a[head] == b[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and a[-1 - tail] == b[-1 - tail]:
+        tail += 1
+    if head == len(a) == len(b):
+        return []
+
+    from diff import diff_lines # Only needed once a file changes on disk; keeps difflib out of startup
+    offsets = [0]
+    for line in a:
+        offsets.append(offsets[-1] + len(line) + 1)
+
+    # Offsets are into old + '\n', where every line has a newline; edits that reach that extra newline are moved off it
+    edits = []
+    for tag, i1, i2, j1, j2 in diff_lines(a[head:len(a) - tail], b[head:len(b) - tail]):
+        if tag == 'equal':
+            continue
+        start, end = offsets[head + i1], offsets[head + i2]
+        text = ''.join(line + '\n' for line in b[head + j1:head + j2])
+        if end > len(old):
+            if not text:
+                start -= 1
+            elif start > len(old):
+                start, text = len(old), '\n' + text[:-1]
+            else:
+                text = text[:-1]
+            end = len(old)
+        edits.append((start, end, text))
+    return edits[::-1]
@@ -0,0 +1,85 @@
+import argparse
+import json
+
+import pytest
+
+from batch import load_rules, main, process_file
+
+
+def rules_args(**kwargs):
+    defaults = dict(find=None, replace=None, rules=None, regex=False, whole_word=False, case=False)
+    return argparse.Namespace(**{**defaults, **kwargs})
+
+
+def make_tree(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'a.txt').write_text('foo1 foo2\nbar\n')
+    (tmp_path / 'sub' / 'b.txt').write_text('no match here\n')
+    (tmp_path / 'sub' / 'c.py').write_text('foo3 = 1\n')
+    (tmp_path / 'blob.bin').write_bytes(b'foo1\0\x01\x02' * 20)
+    return tmp_path
+
+
+def test_load_rules_from_flags_and_file(tmp_path):
+    rules_file = tmp_path / 'rules.json'
+    rules_file.write_text(json.dumps([{'find': 'x', 'replace': 'y', 'case': True}]))
+    rules = load_rules(rules_args(find=['a'], replace=['b'], rules=str(rules_file)))
+    assert rules == [('a', 'b', False, False, False), ('x', 'y', False, False, True)]
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(find=['a'], replace=[]),
+    dict(),
+    dict(find=['('], replace=['x'], regex=True),
+    dict(find=['a'], replace=[r'\1'], regex=True),
+    dict(find=['(a)'], replace=[r'\g<name>'], regex=True),
+])
+def test_load_rules_rejects(kwargs):
+    with pytest.raises(ValueError):
+        load_rules(rules_args(**kwargs))
+
+
+def test_literal_replacements_are_not_templates():
+    assert load_rules(rules_args(find=['a'], replace=[r'\1'])) == [('a', r'\1', False, False, False)]
+
+
+def test_bad_template_is_a_usage_error(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main([str(make_tree(tmp_path)), '--regex', '-f', 'a', '-r', r'\1', '-j', '1'])
+    assert exit.value.code == 2
+    assert 'bad replacement' in capsys.readouterr().err
+
+
+def test_bad_template_fails_one_file_not_the_run(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('abc\n')
+    result = process_file(str(path), [('a', r'\1', True, False, False)])
+    assert 'invalid group reference' in result['error']
+    assert path.read_text() == 'abc\n'
+
+
+def test_run_replaces_in_place(tmp_path, capsys):
+    root = make_tree(tmp_path)
+    assert main([str(root), '--regex', '-f', r'foo(\d)', '-r', r'baz\1', '-j', '1']) == 0
+    assert (root / 'a.txt').read_text() == 'baz1 baz2\nbar\n'
+    assert (root / 'sub' / 'c.py').read_text() == 'baz3 = 1\n'
+    assert (root / 'blob.bin').read_bytes() == b'foo1\0\x01\x02' * 20 # Binary files are skipped
+    assert '4 files, changed 2 (3 replacements), 1 skipped, 0 errors' in capsys.readouterr().err
+
+
+def test_dry_run_json_with_a_pool(tmp_path, capsys):
+    root = make_tree(tmp_path)
+    assert main([str(root), '-f', 'foo', '-r', 'x', '--include', '*.txt', '--dry-run', '--json', '-j', '2']) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    counts = {result['path']: result['counts'] for result in lines[:-1]}
+    assert counts == {str(root / 'a.txt'): [2], str(root / 'sub' / 'b.txt'): [0]}
+    assert lines[-1]['summary']['replacements'] == 2
+    assert (root / 'a.txt').read_text() == 'foo1 foo2\nbar\n'
+
+
+def test_zero_width_rule_comments_out_lines(tmp_path, capsys):
+    path = tmp_path / 'a.txt'
+    path.write_text('one\ntwo\n')
+    assert main([str(path), '--regex', '-f', '^', '-r', '# ', '-j', '1']) == 0
+    assert path.read_text() == '# one\n# two\n'
+    assert 'replaced 2' in capsys.readouterr().out
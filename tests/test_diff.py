@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from diff import DiffJob, DiffRows, diff_lines
+
+
+def rebuild(a, b, opcodes):
+    """Check opcodes cover both sides in order and turn a into b"""
+    i = j = 0
+    result = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j) and (i1 < i2 or j1 < j2)
+        if tag == 'equal':
+            assert a[i1:i2] == b[j1:j2]
+        result.extend(b[j1:j2])
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    return result
+
+
+def test_random_edits():
+    rng = random.Random(0)
+    for _ in range(500):
+        a = [rng.choice('abcde') + str(rng.randint(0, rng.choice([2, 50]))) for _ in range(rng.randint(0, 40))]
+        b = list(a)
+        for _ in range(rng.randint(0, 6)):
+            pos = rng.randint(0, len(b))
+            choice = rng.random()
+            if choice < 0.4:
+                b.insert(pos, rng.choice(['new', rng.choice(a or ['q'])]))
+            elif b:
+                del b[min(pos, len(b) - 1)]
+        assert rebuild(a, b, diff_lines(a, b)) == b
+
+
+def test_small_changes_stay_small():
+    a = [f'line {i}' for i in range(10000)]
+    b = list(a)
+    b[100] = 'changed'
+    del b[5000]
+    b.insert(8000, 'inserted')
+    opcodes = diff_lines(a, b)
+    assert [opcode for opcode in opcodes if opcode[0] != 'equal'] == [
+        ('replace', 100, 101, 100, 101),
+        ('delete', 5000, 5001, 5000, 5000),
+        ('insert', 8001, 8001, 8000, 8001),
+    ]
+
+
+def test_identical_and_empty():
+    assert diff_lines(['a', 'b'], ['a', 'b']) == [('equal', 0, 2, 0, 2)]
+    assert diff_lines([], ['a']) == [('insert', 0, 0, 0, 1)]
+    assert diff_lines([], []) == []
+
+
+def test_rows_pad_the_shorter_side():
+    rows = DiffRows(diff_lines(['a', 'b', 'c'], ['a', 'x', 'y', 'c']))
+    assert rows.count == 4 and rows.hunks == [1]
+    assert list(rows.rows(0, 4)) == [('equal', 0, 0), ('replace', 1, 1), ('replace', None, 2), ('equal', 2, 3)]
+    assert list(rows.rows(2, 3)) == [('replace', None, 2)]
+
+
+def test_job_reads_and_diffs():
+    job = DiffJob(lambda: 'a\nb\nc', lambda: 'a\nc\nd')
+    job.join()
+    assert job.done and job.error is None
+    assert job.left_lines == ['a', 'b', 'c'] and job.rows.count == 4
+
+
+@pytest.mark.parametrize('error', [OSError('gone'), MemoryError(), ValueError('bad')])
+def test_job_reports_any_error(error):
+    def fail():
+        raise error
+
+    job = DiffJob(lambda: 'a', fail)
+    job.join()
+    assert job.done and job.error is error and job.rows is None
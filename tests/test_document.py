@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+from document import Document, code_column, tk_column
+
+
+def random_edits(seed, steps=300):
+    """Apply the same random edits to a Document and a str, checking they agree after each"""
+    rng = random.Random(seed)
+    text = ''.join(rng.choice('ab\n') for _ in range(50))
+    document = Document(text)
+    for _ in range(steps):
+        offset = rng.randint(0, len(text))
+        if rng.random() < 0.6:
+            new_text = ''.join(rng.choice('xy\n') for _ in range(rng.randint(1, 5)))
+            document.insert(offset, new_text)
+            text = text[:offset] + new_text + text[offset:]
+        else:
+            length = rng.randint(0, 6)
+            assert document.delete(offset, length) == text[offset:offset + length]
+            text = text[:offset] + text[offset + length:]
+        assert len(document) == len(text)
+        assert document.line_count == text.count('\n') + 1
+    return document, text
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_edits_match_string(seed):
+    document, text = random_edits(seed)
+    assert document.get_text() == text
+    assert document.get_text(10, 40) == text[10:40]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_line_mapping(seed):
+    document, text = random_edits(seed)
+    lines = text.split('\n')
+    start = 0
+    for number, line in enumerate(lines, 1):
+        assert document.line_start(number) == start
+        assert document.line_end(number) == start + len(line)
+        assert document.get_line(number) == line
+        start += len(line) + 1
+    for offset in range(len(text) + 1):
+        line = text.count('\n', 0, offset) + 1
+        col = offset - (text.rfind('\n', 0, offset) + 1)
+        assert document.index_of(offset) == (line, col)
+        assert document.offset_of(line, col) == offset
+
+
+def test_replace_spans():
+    document = Document('one two one three one')
+    document.replace_spans([(0, 3), (8, 11), (18, 21)], '1')
+    assert document.get_text() == '1 two 1 three 1'
+    document.replace_spans([(0, 1), (6, 7)], ['uno\n', ''])
+    assert document.get_text() == 'uno\n two  three 1'
+    assert document.line_count == 2
+    with pytest.raises(IndexError):
+        document.replace_spans([(5, 8), (4, 6)], 'x')
+
+
+def test_snapshot_is_unaffected_by_edits():
+    document = Document('hello\nworld')
+    snapshot = document.snapshot()
+    document.insert(5, ', there')
+    document.delete(0, 1)
+    assert snapshot.get_text() == 'hello\nworld'
+    assert document.get_text() == 'ello, there\nworld'
+
+
+def test_digest_depends_only_on_text():
+    edited = Document('abc')
+    edited.insert(3, 'def')
+    edited.insert(0, 'x')
+    edited.delete(0, 1)
+    assert edited.digest() == Document('abcdef').digest()
+    assert edited.digest() != Document('abcdeg').digest()
+
+
+def test_pieces_report_origin():
+    document = Document('0123456789')
+    document.insert(5, 'ab')
+    assert list(document.pieces()) == [('01234', 0), ('ab', None), ('56789', 5)]
+
+
+def test_tk_columns_count_astral_characters_twice():
+    document = Document('a\U0001F600b\n\U0001F600\U0001F600x\nplain')
+    assert document.tk_index(2) == '1.3' # After the emoji
+    assert document.tk_index(6) == '2.4'
+    assert document.tk_index(10) == '3.2'
+    assert document.tk_offset(1, 3) == 2
+    assert document.tk_offset(2, 4) == 6
+    for offset in range(len(document) + 1):
+        assert document.tk_offset(*map(int, document.tk_index(offset).split('.'))) == offset
+
+
+def test_typing_after_an_emoji():
+    # What the text area reports for typing x between the emoji and b
+    document = Document('a\U0001F600b')
+    document.insert(document.tk_offset(1, 3), 'x')
+    assert document.get_text() == 'a\U0001F600xb'
+
+
+def test_tk_column_matches_tcl():
+    tkinter = pytest.importorskip('tkinter')
+    tcl = tkinter.Tcl()
+    line = 'a\U0001F600b\xe9\U0001F9D1‍\U0001F4BBc'
+    for col in range(len(line) + 1):
+        tk_col = tcl.call('string', 'length', line[:col])
+        assert tk_column(line, col) == tk_col
+        assert code_column(line, tk_col) == col
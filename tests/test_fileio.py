@@ -0,0 +1,60 @@
+import codecs
+
+import pytest
+
+from document import Document
+from fileio import FileFormat, decode_appended, detect, read_file
+
+SAMPLES = {
+    'lf': b'one\ntwo\nthree\n',
+    'crlf': b'one\r\ntwo\r\nthree',
+    'cr': b'one\rtwo\rthree\r',
+    'mixed': b'one\r\ntwo\nthree\rfour\r\n',
+    'latin-1': 'caf\xe9 cr\xe8me\n'.encode('latin-1'),
+    'invalid utf-8': b'ok \xff\xfe bytes \xc3\n',
+    'utf-8 bom': codecs.BOM_UTF8 + 'h\xe9llo\r\n'.encode('utf-8'),
+    'utf-16 bom': codecs.BOM_UTF16_LE + 'h\xe9llo\nworld'.encode('utf-16-le'),
+    'utf-16 no bom': 'plain ascii text\r\nsecond line\r\n'.encode('utf-16-le'),
+    'binary': bytes(range(256)) * 4,
+    'empty': b'',
+}
+
+
+def encode(document, file_format):
+    return b''.join(file_format.encode(document, block=7)) # A small block, so exceptions straddle blocks
+
+
+@pytest.mark.parametrize('name', SAMPLES)
+def test_round_trip_is_byte_exact(tmp_path, name):
+    path = tmp_path / 'sample'
+    path.write_bytes(SAMPLES[name])
+    text, file_format = read_file(path, chunk_size=5)
+    assert '\r' not in text or file_format.binary
+    assert encode(Document(text), file_format) == SAMPLES[name]
+
+
+def test_edits_keep_untouched_line_endings(tmp_path):
+    path = tmp_path / 'mixed'
+    path.write_bytes(b'a\r\nb\nc\r\n')
+    text, file_format = read_file(path)
+    assert file_format.newline == '\r\n' and file_format.exceptions
+    document = Document(text)
+    document.insert(len(text), 'd\n')
+    assert encode(document, file_format) == b'a\r\nb\nc\r\nd\r\n'
+
+
+def test_detect():
+    assert detect(b'plain\n').encoding == 'utf-8'
+    assert detect('caf\xe9 cr\xe8me\n'.encode('latin-1')).encoding == 'latin-1'
+    assert detect(codecs.BOM_UTF16_BE + 'x'.encode('utf-16-be')).encoding == 'utf-16-be'
+    assert detect(b'\0\x01\x02\x03\xff' * 10).binary
+    assert detect(b'a\r\nb\r\nc\n').newline == '\r\n'
+
+
+def test_decode_appended_holds_back_incomplete_input():
+    file_format = FileFormat('utf-8', newline='\r\n')
+    data = 'line\r\n\xe9'.encode('utf-8')
+    text, used = decode_appended(data[:-1], file_format) # Cut inside the two-byte character
+    assert text == 'line\n' and used == len(b'line\r\n')
+    text, used = decode_appended(b'more\r', file_format) # May be half of a CRLF
+    assert text == 'more' and used == 4
@@ -0,0 +1,65 @@
+import codecs
+import os
+import time
+
+from findfiles import FileSearch, iter_files, search_file
+
+
+def test_iter_files_filters(tmp_path):
+    for name in ('a.py', 'b.txt', 'c.log', '.git/config', 'build/out.py', 'src/d.py'):
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text('x' * (100 if name == 'src/d.py' else 1))
+    found = [os.path.relpath(path, tmp_path) for path in iter_files(str(tmp_path), '*.py; *.txt', 'build', max_size=10)]
+    assert found == ['a.py', 'b.txt']
+
+
+def test_hits_have_line_col_and_text(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_bytes(b'one\r\ntwo needle\r\n\r\nneedle three\r\n')
+    assert search_file(str(path), 'needle') == [(str(path), 2, 4, 'two needle'), (str(path), 4, 0, 'needle three')]
+
+
+def test_files_are_decoded_like_the_editor(tmp_path):
+    samples = {
+        'bom16.txt': codecs.BOM_UTF16_LE + 'first\nsecond caf\xe9\n'.encode('utf-16-le'),
+        'plain16.txt': 'first line\r\nsecond caf\xe9\r\n'.encode('utf-16-be'),
+        'bom8.txt': codecs.BOM_UTF8 + 'caf\xe9 first\n'.encode('utf-8'),
+        'latin1.txt': 'premi\xe8re\nsecond caf\xe9\n'.encode('latin-1'),
+    }
+    expected = {'bom16.txt': (2, 7), 'plain16.txt': (2, 7), 'bom8.txt': (1, 0), 'latin1.txt': (2, 7)}
+    for name, data in samples.items():
+        (tmp_path / name).write_bytes(data)
+        hits = search_file(str(tmp_path / name), 'caf\xe9')
+        assert [(line, col) for _, line, col, _ in hits] == [expected[name]], name
+
+
+def test_undecodable_bytes_are_shown_as_question_marks(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_bytes(b'ok \xc3\xa9 \xff needle\n')
+    assert search_file(str(path), 'needle') == [(str(path), 1, 7, 'ok \xe9 ? needle')]
+
+
+def test_binary_files_have_no_hits(tmp_path):
+    path = tmp_path / 'a.bin'
+    path.write_bytes(b'needle\0\x01\x02\x03' * 10)
+    assert search_file(str(path), 'needle') == []
+
+
+def test_max_hits(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('needle\n' * 100)
+    hits = search_file(str(path), 'needle', max_hits=10, chunk_size=16)
+    assert [line for _, line, _, _ in hits] == list(range(1, 11))
+
+
+def test_file_search_walks_a_tree(tmp_path):
+    for i in range(20):
+        (tmp_path / f'{i:02}.txt').write_text(f'line\nfind me {i}\n')
+    (tmp_path / 'skip.log').write_text('find me\n')
+    job = FileSearch(str(tmp_path), 'FIND ME', include='*.txt', workers=2)
+    deadline = time.monotonic() + 30
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert job.done and job.files_searched == 20
+    assert sorted((os.path.basename(path), line, col) for path, line, col, _ in job.hits) == [(f'{i:02}.txt', 2, 0) for i in range(20)]
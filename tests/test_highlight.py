@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from highlight import LEXERS, Highlighter, IniLexer, Lexer, PythonLexer, lexer_for, register_lexer
+
+
+def lex_all(lexer, lines):
+    """Tokens for every line, lexed from the top"""
+    state, result = lexer.initial_state, []
+    for line in lines:
+        tokens, state = lexer.lex_line(line, state)
+        result.append(tokens)
+    return result
+
+
+def test_python_tokens():
+    line = '@cache def load(path): return open(path, "r") + 0x1F # done'
+    tokens, state = PythonLexer().lex_line(line, None)
+    found = [(tag, line[start:end]) for tag, start, end in tokens]
+    assert found == [
+        ('hl_decorator', '@cache'), ('hl_keyword', 'def'), ('hl_definition', 'load'), ('hl_keyword', 'return'),
+        ('hl_builtin', 'open'), ('hl_string', '"r"'), ('hl_number', '0x1F'), ('hl_comment', '# done'),
+    ]
+    assert state is None
+
+
+def test_triple_quoted_string_spans_lines():
+    lines = ['x = """start', 'middle # not a comment', 'end""" + 1']
+    tokens = lex_all(PythonLexer(), lines)
+    assert tokens[1] == [('hl_string', 0, len(lines[1]))]
+    assert tokens[2] == [('hl_string', 0, 6), ('hl_number', 9, 10)]
+
+
+def test_ini_tokens():
+    lexer = IniLexer()
+    assert lexer.lex_line('[Editor]', None) == ([('hl_keyword', 0, 8)], None)
+    assert lexer.lex_line('font_size = 12', None) == ([('hl_definition', 0, 9), ('hl_string', 12, 14)], None)
+    assert lexer.lex_line('; comment', None) == ([('hl_comment', 0, 9)], None)
+
+
+def test_lexer_for(monkeypatch):
+    assert isinstance(lexer_for('a/b.PY'), PythonLexer)
+    assert isinstance(lexer_for('settings.conf'), IniLexer)
+    assert lexer_for('notes.txt') is None and lexer_for(None) is None
+
+    class TomlLexer(IniLexer):
+        extensions = ('.toml',)
+
+    monkeypatch.setattr('highlight.LEXERS', list(LEXERS))
+    toml = register_lexer(TomlLexer())
+    assert lexer_for('pyproject.toml') is toml # Later registrations win
+
+
+def test_lexers_must_implement_lex_line():
+    class Incomplete(Lexer):
+        extensions = ('.x',)
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_incremental_tags_match_a_full_lex(seed):
+    rng = random.Random(seed)
+    pieces = ['x = 1', 'def f():', '"""', "'''", 's = "a"', '# c', 'y = """ z', 'w"""', '']
+    lines = [rng.choice(pieces) for _ in range(40)]
+    lexer = PythonLexer()
+    tags = [None] * len(lines) # What the text area would have, shifting with the lines like Tk's tags do
+
+    def tag_line(line, tokens):
+        tags[line - 1] = tokens
+
+    highlighter = Highlighter(lexer, lambda line: lines[line - 1], len(lines))
+    for _ in range(15):
+        first = rng.randint(1, len(lines))
+        highlighter.render(first, min(first + 10, len(lines)), tag_line)
+        while highlighter.sweep(tag_line, limit=rng.randint(1, 15)) and rng.random() < 0.5:
+            pass
+
+        line = rng.randint(1, len(lines))
+        if rng.random() < 0.5 or len(lines) < 5: # Replace a line with one or more
+            new = [rng.choice(pieces) for _ in range(rng.randint(1, 3))]
+            lines[line - 1:line] = new
+            tags[line - 1:line] = [None] * len(new)
+            highlighter.edited(line, len(new) - 1)
+        else: # Join the next few lines onto it
+            count = min(rng.randint(1, 3), len(lines) - line)
+            lines[line - 1:line + count] = [''.join(lines[line - 1:line + count])]
+            tags[line - 1:line + count] = [None]
+            highlighter.edited(line, -count)
+
+    highlighter.render(1, len(lines), tag_line)
+    while highlighter.sweep(tag_line):
+        pass
+    assert highlighter.done
+    assert tags == lex_all(lexer, lines)
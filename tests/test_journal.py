@@ -0,0 +1,83 @@
+import os
+import time
+
+from document import Document
+from journal import Journal, journal_path, recover
+
+
+def start(tmp_path, text, fsync=False):
+    path = tmp_path / 'doc.txt'
+    path.write_text(text)
+    document = Document(text)
+    return str(path), document, Journal(journal_path(str(path)), document.digest(), fsync=fsync)
+
+
+def test_recover_replays_edits(tmp_path):
+    path, document, journal = start(tmp_path, 'hello world\n')
+    base_digest = document.digest()
+    document.insert(5, ',')
+    journal.insert(5, ',')
+    document.delete(0, 1)
+    journal.delete(0, 1)
+    document.replace_spans([(0, 1), (6, 11)], ['He', 'WORLD'])
+    journal.replace_spans([(0, 1), (6, 11)], ['He', 'WORLD'])
+    journal.close() # As if the editor stopped without saving
+
+    recovered = recover(journal.path, base_digest, lambda: open(path).read())
+    assert recovered.get_text() == document.get_text() == 'Hello, WORLD\n'
+
+
+def test_recover_from_snapshot_after_compact(tmp_path):
+    path, document, journal = start(tmp_path, 'abc')
+    document.insert(3, 'def')
+    journal.insert(3, 'def')
+    journal.compact(document.snapshot())
+    journal.wait()
+    document.insert(0, '>')
+    journal.insert(0, '>')
+    journal.close()
+
+    # The file on disk has changed since, so only the snapshot can be the base
+    recovered = recover(journal.path, Document('something else').digest(), lambda: 'something else')
+    assert recovered.get_text() == '>abcdef'
+
+
+def test_nothing_to_recover(tmp_path):
+    path, document, journal = start(tmp_path, 'same')
+    journal.close()
+    assert recover(journal.path, document.digest(), lambda: 'same') is None
+    assert recover(str(tmp_path / 'missing.journal'), document.digest(), lambda: 'same') is None
+
+
+def test_garbled_tail_keeps_earlier_edits(tmp_path):
+    path, document, journal = start(tmp_path, 'abc')
+    journal.insert(3, 'd')
+    journal.close()
+    with open(journal.path, 'ab') as file:
+        file.write(b'+99,5\nxy') # Cut off mid-record by a crash
+
+    recovered = recover(journal.path, document.digest(), lambda: 'abc')
+    assert recovered.get_text() == 'abcd'
+
+
+def test_discard_removes_journal(tmp_path):
+    path, document, journal = start(tmp_path, 'abc')
+    journal.close(discard=True)
+    assert recover(journal.path, document.digest(), lambda: 'abc') is None
+
+
+def test_idle_journal_does_not_fsync(tmp_path, monkeypatch):
+    monkeypatch.setattr(Journal, 'FLUSH_INTERVAL', 0.01)
+    path, document, journal = start(tmp_path, 'abc', fsync=True)
+    calls = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: calls.append(fd) or fsync(fd))
+    time.sleep(0.2)
+    assert calls == []
+
+    journal.insert(0, 'x')
+    time.sleep(0.2)
+    assert len(calls) == 1 # Written and synced once, then idle again
+    journal.close()
+    assert len(calls) == 1
+
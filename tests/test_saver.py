@@ -0,0 +1,124 @@
+import os
+import stat
+
+import pytest
+
+import saver
+from document import Document
+from fileio import FileFormat
+from saver import UMASK, AtomicFile, SaveJob, format_size
+
+
+def save(path, text):
+    with AtomicFile(str(path)) as file:
+        file.write(text)
+
+
+def leftovers(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+
+def test_new_file_gets_the_umask_mode(tmp_path):
+    save(tmp_path / 'new.txt', 'hello')
+    assert (tmp_path / 'new.txt').read_text() == 'hello'
+    assert stat.S_IMODE(os.stat(tmp_path / 'new.txt').st_mode) == 0o666 & ~UMASK
+
+
+def test_existing_mode_is_kept(tmp_path):
+    path = tmp_path / 'script.sh'
+    path.write_text('old')
+    os.chmod(path, 0o750)
+    save(path, 'new')
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o750
+
+
+@pytest.mark.skipif(not hasattr(os, 'geteuid') or os.geteuid() != 0, reason='only root can give a file away')
+def test_owner_is_kept(tmp_path):
+    path = tmp_path / 'theirs.txt'
+    path.write_text('old')
+    os.chown(path, 1234, 5678)
+    save(path, 'new')
+    assert (os.stat(path).st_uid, os.stat(path).st_gid) == (1234, 5678)
+
+
+def test_symlink_is_followed(tmp_path):
+    target = tmp_path / 'real.txt'
+    target.write_text('old')
+    link = tmp_path / 'link.txt'
+    link.symlink_to(target)
+    save(link, 'new')
+    assert link.is_symlink()
+    assert target.read_text() == 'new'
+
+
+def test_hard_links_stay_linked(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('old contents')
+    other = tmp_path / 'b.txt'
+    os.link(path, other)
+    save(path, 'new')
+    assert other.read_text() == 'new'
+    assert os.path.samefile(path, other)
+    assert not leftovers(tmp_path)
+
+
+def test_unwritable_directory_writes_in_place(tmp_path, monkeypatch):
+    path = tmp_path / 'a.txt'
+    path.write_text('old')
+    inode = os.stat(path).st_ino
+    mkstemp = saver.tempfile.mkstemp
+
+    def no_temp_files_here(dir=None, **kwargs):
+        if dir is not None:
+            raise PermissionError('read-only directory')
+        return mkstemp(dir=str(tmp_path / 'elsewhere'), **kwargs)
+
+    (tmp_path / 'elsewhere').mkdir()
+    monkeypatch.setattr(saver.tempfile, 'mkstemp', no_temp_files_here)
+    save(path, 'new')
+    assert path.read_text() == 'new' and os.stat(path).st_ino == inode
+    assert not leftovers(tmp_path / 'elsewhere')
+
+
+def test_read_only_file_is_refused(tmp_path, monkeypatch):
+    path = tmp_path / 'locked.txt'
+    path.write_text('old')
+    monkeypatch.setattr(saver.os, 'access', lambda *args: False) # Root may write anything, so pretend
+    with pytest.raises(PermissionError):
+        save(path, 'new')
+    assert path.read_text() == 'old'
+    assert not leftovers(tmp_path)
+
+
+def test_error_discards_the_temp_file(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('old')
+    with pytest.raises(RuntimeError):
+        with AtomicFile(str(path)) as file:
+            file.write('half')
+            raise RuntimeError
+    assert path.read_text() == 'old'
+    assert not leftovers(tmp_path)
+
+
+def test_save_job_writes_the_format(tmp_path):
+    path = tmp_path / 'doc.txt'
+    document = Document('one\ntwo\n')
+    job = SaveJob(str(path), document.snapshot(), FileFormat('utf-16-le', b'\xff\xfe', newline='\r\n'), fsync=False)
+    job.join()
+    assert job.error is None and job.done
+    assert path.read_bytes() == b'\xff\xfe' + 'one\r\ntwo\r\n'.encode('utf-16-le')
+    assert job.digest == document.digest()
+    assert job.size == os.path.getsize(path)
+
+
+def test_save_job_reports_errors(tmp_path):
+    job = SaveJob(str(tmp_path / 'missing' / 'doc.txt'), Document('x'), fsync=False)
+    job.join()
+    assert isinstance(job.error, OSError) and job.done
+
+
+def test_format_size():
+    assert format_size(512) == '512 B'
+    assert format_size(1536) == '1.5 KB'
+    assert format_size(3 << 30) == '3.0 GB'
@@ -0,0 +1,97 @@
+import re
+
+import pytest
+
+from search import BackgroundSearch, LineIndex, SearchEngine, replace_rules
+
+
+@pytest.mark.parametrize('pattern, single_line', [
+    (r'foo\d+', True), (r'^\w+$', True), (r'a.b', True), (r'[^\n]+', True), (r'(a)\1', True),
+    (r'a\nb', False), (r'(?s)a.b', False), (r'a\sb', False), (r'[^x]', False), (r'\Afoo', False), (r'x|\W', False),
+])
+def test_single_line_regexes(pattern, single_line):
+    assert SearchEngine(pattern, regex=True).single_line == single_line
+
+
+def test_literal_single_line():
+    assert SearchEngine('foo bar').single_line
+    assert not SearchEngine('foo\nbar').single_line
+
+
+def test_replace_rules_streams_like_a_whole_read(tmp_path):
+    text = 'foo12 bar\nx\r\nbaz 7\nquux99' * 2000
+    path = tmp_path / 'big.txt'
+    path.write_bytes(text.encode())
+    counts = replace_rules(path, [(SearchEngine(r'([a-z]+)(\d+)', regex=True), r'\2\1'), (SearchEngine('bar'), 'BAR')], chunk_size=100)
+    expected, count = re.subn(r'([a-z]+)(\d+)', r'\2\1', text)
+    assert counts == [count, 2000]
+    assert path.read_bytes() == expected.replace('bar', 'BAR').encode()
+
+
+def test_dry_run_leaves_file_alone(tmp_path):
+    path = tmp_path / 'file.txt'
+    path.write_text('a a a\n')
+    assert replace_rules(path, [(SearchEngine('a'), 'b')], dry_run=True) == [3]
+    assert path.read_text() == 'a a a\n'
+
+
+@pytest.mark.parametrize('pattern, replacement, valid', [
+    (r'(\w+)', r'<\1>', True), (r'(?P<word>\w+)', r'\g<word>', True), (r'\w+', r'\1', False),
+    (r'(a)', r'\g<missing>', False), (r'a', '\\', False), (r'a', r'no backslash', True),
+])
+def test_check_replacement(pattern, replacement, valid):
+    engine = SearchEngine(pattern, regex=True)
+    if valid:
+        engine.check_replacement(replacement)
+    else:
+        with pytest.raises(re.error):
+            engine.check_replacement(replacement)
+
+
+def test_literal_replacements_are_never_templates():
+    engine = SearchEngine('a')
+    engine.check_replacement(r'\1')
+    assert engine.replace('abc', r'\1') == (r'\1bc', 1)
+
+
+def test_line_index_tk_columns_after_emoji():
+    text = 'plain\na\U0001F600 foo \U0001F600foo\nfoo'
+    lines = LineIndex(text)
+    starts = [start for start, _ in SearchEngine('foo').finditer(text)]
+    assert [lines.tk_index(start) for start in starts] == ['2.4', '2.10', '3.0']
+    assert [pair for pair in SearchEngine('foo').matches(text)] == [('2.4', '2.7'), ('2.10', '2.13'), ('3.0', '3.3')]
+    assert lines.index_of(starts[1]) == (2, 8)
+
+
+def test_background_search_finds_every_match():
+    text = 'needle hay\n' * 50000 + 'needle'
+    job = BackgroundSearch(SearchEngine('NEEDLE'), text)
+    job._thread.join()
+    assert job.done and len(job.spans) == 50001
+    assert job.lines.tk_index(job.spans[-1][0]) == '50001.0'
+
+
+@pytest.mark.parametrize('pattern, replacement, text, expected', [
+    (r'^', '# ', 'a\nb\n', ('# a\n# b\n', 2)),
+    (r'^', '# ', 'a\n\nb', ('# a\n# \n# b', 3)),
+    (r'$', ';', 'a\nb\n', ('a;\nb;\n', 2)),
+    (r'\b', '|', 'ab cd', ('|ab| |cd|', 4)),
+    (r'x*', '-', 'axb\n', ('-a--b-\n', 4)), # Python also allows an empty match right after a non-empty one
+])
+def test_empty_matches_are_replaced(pattern, replacement, text, expected):
+    engine = SearchEngine(pattern, regex=True)
+    assert engine.replace(text, replacement) == expected
+    assert len(list(engine.edits(text, replacement))) == expected[1]
+    assert list(engine.finditer(text)) == [(m.start(), m.end()) for m in re.finditer(pattern, text, re.M) if m.end() > m.start()] # Find skips them
+
+
+@pytest.mark.parametrize('pattern', [r'^', r'$', r'^$', r'\b', r'(?=b)', r'x*'])
+def test_empty_matches_stream_like_a_whole_read(tmp_path, pattern):
+    text = 'ab\n\nb x\r\nxx\n' * 50
+    engine = SearchEngine(pattern, regex=True)
+    expected = engine.replace(text, '<>')
+    for chunk_size in (1, 7, 1 << 20):
+        path = tmp_path / f'{chunk_size}.txt'
+        path.write_bytes(text.encode())
+        assert replace_rules(path, [(engine, '<>')], chunk_size=chunk_size) == [expected[1]]
+        assert path.read_bytes() == expected[0].encode()
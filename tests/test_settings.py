@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+
+from settings import DEFAULTS, Settings, default_path
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # Away from any old settings.conf in the working directory
+    return tmp_path / 'config' / 'settings.conf'
+
+
+def test_defaults(path):
+    settings = Settings(str(path))
+    assert settings.get('theme') == DEFAULTS['theme']
+    assert settings.getint('font_size') == 12
+    assert settings.getboolean('fsync') is True
+    assert not path.exists()
+
+
+def test_set_is_cached_and_written_later(path):
+    settings = Settings(str(path), delay=0.1)
+    assert settings.getint('font_size') == 12
+    settings.set('font_size', 14)
+    settings.set('line_numbers', True)
+    assert settings.getint('font_size') == 14 and settings.getboolean('line_numbers')
+    assert not path.exists() # Not until the changes settle
+    time.sleep(0.3)
+    assert path.exists()
+    reread = Settings(str(path))
+    assert reread.getint('font_size') == 14 and reread.getboolean('line_numbers')
+
+
+def test_flush_writes_now_and_none_clears(path):
+    settings = Settings(str(path), delay=60)
+    settings.set('last_doc', '/some/file.txt')
+    settings.set('last_doc', None)
+    settings.flush()
+    assert Settings(str(path)).get('last_doc') == ''
+
+
+def test_unchanged_values_are_not_written(path):
+    settings = Settings(str(path), delay=60)
+    settings.set('theme', DEFAULTS['theme'])
+    settings.flush()
+    assert not path.exists()
+
+
+def test_old_settings_in_working_directory_are_read(path):
+    with open('settings.conf', 'w') as file:
+        file.write('[Editor]\npad = 7\n')
+    assert Settings(str(path)).getint('pad') == 7
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='uses XDG_CONFIG_HOME')
+def test_default_path_follows_xdg(monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path))
+    assert default_path() == os.path.join(str(tmp_path), 'texteditor', 'settings.conf')
@@ -0,0 +1,29 @@
+import ast
+import os
+import subprocess
+import sys
+
+from TextEditor import EDITOR_IMPORTS
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scripts')
+
+
+def editor_imports():
+    with open(os.path.join(SCRIPTS, 'editor.py'), encoding='utf-8') as file:
+        tree = ast.parse(file.read())
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom):
+            yield node.module
+        elif isinstance(node, ast.Import):
+            yield from (alias.name for alias in node.names)
+
+
+def test_profile_times_every_module_editor_imports():
+    ours = {name for name in editor_imports() if os.path.exists(os.path.join(SCRIPTS, f'{name}.py'))}
+    assert ours | {'tkinter', 'ttkbootstrap'} == set(EDITOR_IMPORTS)
+
+
+def test_editor_loads_diff_on_demand():
+    code = 'import sys, editor; print("diff" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], cwd=SCRIPTS, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
@@ -0,0 +1,117 @@
+import random
+
+from document import Document
+from undo import SpanEdit, UndoHistory
+
+
+def apply(document, step, undo):
+    """What the editor's apply_step does, minus the text area"""
+    for edit in (reversed(step) if undo else step):
+        if isinstance(edit, SpanEdit):
+            spans, texts = edit.backward() if undo else edit.forward()
+            document.replace_spans(spans, texts)
+        else:
+            offset, removed, inserted = edit
+            old, new = (inserted, removed) if undo else (removed, inserted)
+            assert document.delete(offset, len(old)) == old
+            document.insert(offset, new)
+
+
+def type_text(history, document, offset, text):
+    for i, char in enumerate(text):
+        document.insert(offset + i, char)
+        history.record(offset + i, '', char)
+
+
+def test_typing_coalesces_until_newline():
+    history, document = UndoHistory(), Document()
+    type_text(history, document, 0, 'hello\nworld')
+    assert [list(step) for step in history.undo_steps] == [[(0, '', 'hello\n')], [(6, '', 'world')]]
+
+
+def test_pause_starts_new_step():
+    history, document = UndoHistory(), Document()
+    history.COALESCE_SECONDS = -1
+    type_text(history, document, 0, 'ab')
+    assert len(history.undo_steps) == 2
+
+
+def test_backspace_and_delete_coalesce():
+    history = UndoHistory()
+    document = Document('abcdef')
+    for offset in (5, 4, 3): # Backspace from the end
+        history.record(offset, document.delete(offset, 1), '')
+    assert list(history.undo_steps[-1]) == [(3, 'def', '')]
+    for _ in range(2): # Delete key at the start
+        history.record(0, document.delete(0, 1), '')
+    assert list(history.undo_steps[-1]) == [(0, 'ab', '')]
+
+
+def test_undo_redo_round_trip():
+    rng = random.Random(0)
+    document = Document('the quick brown fox\njumps over\nthe lazy dog\n')
+    original = document.get_text()
+    history = UndoHistory()
+    for _ in range(40):
+        text = document.get_text()
+        choice = rng.random()
+        if choice < 0.4:
+            offset = rng.randint(0, len(text))
+            type_text(history, document, offset, rng.choice(['x', 'yz', '\n']))
+        elif choice < 0.7 and text:
+            offset = rng.randrange(len(text))
+            history.record(offset, document.delete(offset, rng.randint(1, 3)), '')
+        else:
+            spans = [(i, i + 1) for i, char in enumerate(text) if char == 'o']
+            texts = [rng.choice(['0', '', 'oo']) for _ in spans]
+            document.replace_spans(spans, texts)
+            history.record_spans(spans, [text[start:end] for start, end in spans], texts)
+    final = document.get_text()
+
+    while (step := history.undo()) is not None:
+        apply(document, step, undo=True)
+    assert document.get_text() == original
+    while (step := history.redo()) is not None:
+        apply(document, step, undo=False)
+    assert document.get_text() == final
+
+
+def test_new_edit_drops_redo():
+    history, document = UndoHistory(), Document()
+    type_text(history, document, 0, 'a\n')
+    apply(document, history.undo(), undo=True)
+    type_text(history, document, 0, 'b')
+    assert history.redo() is None
+
+
+def test_group_is_one_step():
+    history = UndoHistory()
+    with history.group():
+        history.record(0, '', 'a')
+        history.record(1, '', 'b')
+    assert len(history.undo_steps) == 1 and len(history.undo()) == 2
+
+
+def test_budget_drops_oldest_steps():
+    history = UndoHistory(budget=1000)
+    for i in range(100):
+        history.record(i * 5, '', 'abc\n')
+    assert history.size <= 1000
+    assert history.undo_steps[-1] == [(495, '', 'abc\n')]
+    assert history.undo_steps[0] != [(0, '', 'abc\n')]
+
+
+def test_save_and_load_check_digest(tmp_path):
+    history = UndoHistory()
+    history.record(0, '', 'x\n')
+    history.record_spans([(0, 1), (4, 6)], ['a', 'bc'], 'z')
+    path = tmp_path / '.doc.undo'
+    history.save(path, 'digest')
+
+    loaded = UndoHistory()
+    assert not loaded.load(path, 'other digest') and not loaded
+    assert loaded.load(path, 'digest')
+    step = loaded.undo()
+    spans, texts = step[0].backward()
+    assert spans == [(0, 1), (4, 5)] # Where the replacements ended up and texts == ['a', 'bc']
+    assert loaded.undo() == [(0, '', 'x\n')]
@@ -0,0 +1,31 @@
+import random
+
+from watcher import line_edits
+
+
+def apply(old, edits):
+    for start, end, text in edits: # Last first, so earlier offsets stay valid
+        old = old[:start] + text + old[end:]
+    return old
+
+
+def test_line_edits_turn_old_into_new():
+    rng = random.Random(0)
+    for _ in range(2000):
+        old = ''.join(rng.choice(['a', 'b', '\n', 'c\n', '\n\n']) for _ in range(rng.randint(0, 15)))
+        new = list(old)
+        for _ in range(rng.randint(0, 4)):
+            pos = rng.randint(0, len(new))
+            if rng.random() < 0.5:
+                new.insert(pos, rng.choice(['x', '\n', 'y\n']))
+            elif new:
+                del new[min(pos, len(new) - 1)]
+        new = ''.join(new)
+        assert apply(old, line_edits(old, new)) == new
+
+
+def test_line_edits_only_touch_changed_lines():
+    old = ''.join(f'line {i}\n' for i in range(1000))
+    new = old.replace('line 500\n', 'line five hundred\n')
+    assert line_edits(old, new) == [(old.index('line 500\n'), old.index('line 501\n'), 'line five hundred\n')]
+    assert line_edits(old, old) == []